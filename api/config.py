@@ -22,6 +22,16 @@ class Settings(BaseSettings):
     USE_VLLM: bool = False  # Use transformers by default (easier for CPU)
     VLLM_HOST: str = "127.0.0.1"
     VLLM_PORT: int = 8000
+    VLLM_TIMEOUT: Optional[float] = None  # request timeout in seconds (None: client default)
+    REPETITION_STOP: bool = True  # stop looping generations early, both backends
+    HF_BATCH_SIZE: int = 1  # pages of the same size generated together by the transformers backend
+    HF_PROFILE: Optional[str] = None  # gpu, cpu (None: cpu profile when running on the cpu)
+    HF_ATTN_IMPLEMENTATION: Optional[str] = None  # flash_attention_2, sdpa, eager (None: fastest available)
+    HF_DTYPE: Optional[str] = None  # auto, bfloat16, float16, float32
+    HF_AUTOCAST_DTYPE: Optional[str] = None  # auto, bfloat16, float16
+    HF_NUM_THREADS: Optional[int] = None  # torch intra-op threads
+    HF_QUANTIZE: bool = False  # dynamic int8 linear layers of the language model (cpu only)
+    HF_MAX_NEW_TOKENS: int = 24000
     
     # Auto-detect device (CPU/GPU)
     DEVICE: str = "auto"  # auto, cpu, cuda
@@ -30,6 +40,43 @@ class Settings(BaseSettings):
     DPI: int = 200
     MIN_PIXELS: int = 256 * 28 * 28
     MAX_PIXELS: int = 1280 * 28 * 28
+    PREPROCESS_ENGINE: str = "resample"  # dpi upsample of image inputs: resample (one resize) or fitz
+    # Documents processed at the same time, in worker threads off the event loop;
+    # further requests wait for a free worker. vLLM only, the transformers backend takes one
+    OCR_WORKERS: int = 2
+    # Pages at the vLLM server at the same time, shared by all documents (their pages take turns);
+    # None or 0: no limit. The transformers backend runs HF_BATCH_SIZE pages at a time
+    MAX_INFLIGHT_PAGES: Optional[int] = 32
+    # Admission control of /process and /process/stream: documents are rejected with 429 once the
+    # visual tokens of the documents being processed would exceed the budget (~1280 per full page),
+    # and with 503 once the measured drain rate says they would wait longer than ADMISSION_MAX_WAIT
+    # seconds (keep it below the proxy timeout). None or 0 disables a check
+    ADMISSION_MAX_PENDING_TOKENS: Optional[int] = 400_000
+    ADMISSION_MAX_WAIT: Optional[float] = 240
+    ADMISSION_DEFAULT_THROUGHPUT: float = 1000.0  # tokens/s assumed for Retry-After until measured
+    # Measured drain rate saved at shutdown and used until this process measured its own
+    # (also read/written by `python -m dots_ocr.parser --throughput_file`). None: not kept
+    THROUGHPUT_FILE: Optional[str] = "./queue/throughput.json"
+    
+    # Per-page artifacts: full (json, layout jpg, md, nohf md), text (json, md), minimal (json),
+    # memory (no files). Layout images are rendered on demand by /api/v1/results/{task_id}/overlay
+    OUTPUT_PROFILE: str = "text"
+    OVERLAY_MAX_SIZE: int = 1600  # default longest side of on-demand overlay images
+    # Pictures in markdown: file (results/{task_id}/images/<sha256>.png, linked by URL) or inline (base64),
+    # always inline with OUTPUT_PROFILE=memory
+    PICTURE_MODE: str = "file"
+    
+    # Image transport to the vLLM server (png, webp_lossless, webp, jpeg)
+    IMAGE_FORMAT: str = "png"
+    IMAGE_QUALITY: Optional[int] = None  # jpeg/webp quality
+    PNG_COMPRESS_LEVEL: Optional[int] = None  # 0-9, lower is faster and larger
+    IMAGE_GRAYSCALE: bool = False
+    
+    # Inference cache (identical page + prompt + sampling params skip the model)
+    INFERENCE_CACHE: bool = False
+    INFERENCE_CACHE_DIR: Optional[Path] = None  # None: memory tier only
+    INFERENCE_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024  # 1GB on disk
+    INFERENCE_CACHE_MEMORY_ENTRIES: int = 256
     
     # Upload Settings
     MAX_UPLOAD_SIZE: int = 50 * 1024 * 1024  # 50MB
@@ -44,8 +91,18 @@ class Settings(BaseSettings):
     USE_LIBREOFFICE: bool = False  # Use python-docx by default
     LIBREOFFICE_PATH: Optional[str] = None
     
-    # Task Queue (optional, for background processing)
-    USE_REDIS: bool = False
+    # Task Queue of the asynchronous job API (/api/v1/jobs)
+    # memory (in-process), sqlite (processes of one host) or redis (API and worker pods)
+    QUEUE_BACKEND: str = "memory"
+    QUEUE_SQLITE_PATH: Path = Path("./queue/queue.db")
+    # Page worker threads started with the API; 0 leaves the queue to scripts/run_worker.py
+    QUEUE_WORKERS: int = 4
+    QUEUE_TASK_TTL: Optional[int] = 7 * 24 * 3600  # seconds a task is kept after its last update
+    # sqlite / redis: a job is handed out again when its worker sent no heartbeat for this many seconds,
+    # a page taken by QUEUE_MAX_ATTEMPTS workers that all died is reported as failed
+    QUEUE_LEASE_TIMEOUT: int = 120
+    QUEUE_MAX_ATTEMPTS: int = 3
+    USE_REDIS: bool = False  # true selects the redis queue backend
     REDIS_URL: str = "redis://localhost:6379"
     
     # CORS
@@ -8,7 +8,10 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 
 from api.config import settings
-from api.routers import process
+from api.routers import process, jobs
+from api.services.ocr_service import ocr_service
+from api.services.jobs import job_service
+from api.services.admission import admission
 
 # Configure logging
 logging.basicConfig(
@@ -50,6 +53,7 @@ app.add_middleware(
 
 # Include routers
 app.include_router(process.router)
+app.include_router(jobs.router)
 
 # Mount static files (for serving results)
 app.mount(
@@ -68,11 +72,15 @@ async def startup_event():
     logger.info(f"Model Path: {settings.MODEL_PATH}")
     logger.info(f"Use vLLM: {settings.USE_VLLM}")
     logger.info("="*60)
+    job_service.start(settings.QUEUE_WORKERS)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Run on application shutdown"""
     logger.info("Shutting down API server...")
+    job_service.stop(timeout=5)
+    ocr_service.shutdown()
+    admission.save_throughput()
 
 @app.get("/")
 async def root():
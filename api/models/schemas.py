@@ -13,6 +13,12 @@ class PromptMode(str, Enum):
     OCR_ONLY = "prompt_ocr"
     GROUNDING_OCR = "prompt_grounding_ocr"
 
+class ParseMethod(str, Enum):
+    """How PDF pages are parsed"""
+    OCR = "ocr"    # every page goes to the model
+    TXT = "txt"    # layout built from the PDF text layer
+    AUTO = "auto"  # text layer for born-digital pages, model for scanned / image-heavy pages
+
 class FileType(str, Enum):
     """Supported file types"""
     PDF = "pdf"
@@ -41,6 +47,14 @@ class ProcessRequest(BaseModel):
         default=None,
         description="Bounding box for grounding OCR [x1, y1, x2, y2]"
     )
+    pages: Optional[str] = Field(
+        default=None,
+        description="PDF pages to process, 1-based, e.g. '1-5,9,12-'"
+    )
+    parse_method: ParseMethod = Field(
+        default=ParseMethod.OCR,
+        description="PDF parse method: ocr, txt or auto"
+    )
 
 class LayoutElement(BaseModel):
     """Layout element in the result"""
@@ -56,6 +70,7 @@ class ProcessResponse(BaseModel):
     status: ProcessingStatus
     file_type: FileType
     original_filename: str
+    file_hash: Optional[str] = None  # sha256 of the uploaded file
     message: Optional[str] = None
     
     # Results (when completed)
@@ -67,6 +82,7 @@ class ProcessResponse(BaseModel):
     
     # Metadata
     total_pages: Optional[int] = None
+    page_numbers: Optional[List[int]] = None  # original 1-based page numbers of the processed pages
     processing_time: Optional[float] = None
     device_used: Optional[str] = None
     model_info: Optional[Dict[str, Any]] = None
@@ -85,6 +101,31 @@ class TaskStatusResponse(BaseModel):
     progress: Optional[int] = Field(default=None, ge=0, le=100)
     message: Optional[str] = None
     result_url: Optional[str] = None
+    total_pages: Optional[int] = None
+    finished_pages: Optional[int] = None
+
+class PageEstimate(BaseModel):
+    """Model input of one page"""
+    page_number: int  # original 1-based page number
+    width: int  # rendered page
+    height: int
+    input_width: int  # image sent to the model
+    input_height: int
+    visual_tokens: int
+
+class EstimateResponse(BaseModel):
+    """Work estimate of a document, computed without rendering or calling the model"""
+    file_type: FileType
+    original_filename: str
+    file_hash: Optional[str] = None
+    total_pages: int
+    pages: List[PageEstimate]
+    visual_tokens: int
+    throughput_tokens_per_s: float
+    throughput_source: str  # measured, file or default
+    estimated_seconds: float  # processing time of this document alone
+    pending_tokens: int  # visual tokens of the documents being processed
+    estimated_wait_seconds: float  # until this document would be done, behind the pending work
 
 class HealthResponse(BaseModel):
     """Health check response"""
@@ -0,0 +1,122 @@
+"""
+Asynchronous job API: submit a document, poll its progress, fetch the result
+"""
+import logging
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from api.models.schemas import (
+    PromptMode, ParseMethod, ProcessingStatus, ProcessResponse, TaskStatusResponse
+)
+from api.routers.process import _save_upload, _parse_bbox, _validate_pages
+from api.services.jobs import job_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1", tags=["Jobs"])
+
+def _get_task(task_id: str) -> dict:
+    task = job_service.get_task(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
+    return task
+
+def _task_status(task_id: str, task: dict) -> TaskStatusResponse:
+    status = ProcessingStatus(task["status"])
+    total, finished = task.get("total_pages"), task["finished_pages"]
+    done = status in (ProcessingStatus.COMPLETED, ProcessingStatus.FAILED)
+    if done:
+        progress = 100
+    elif total:
+        progress = finished * 100 // total
+    else:
+        progress = 0
+    return TaskStatusResponse(
+        task_id=task_id,
+        status=status,
+        progress=progress,
+        message=f"{finished}/{total} pages" if total is not None else "Waiting for a worker",
+        result_url=f"/api/v1/jobs/{task_id}/result" if done else None,
+        total_pages=total,
+        finished_pages=finished
+    )
+
+@router.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(..., description="File to process (PDF, Image, DOC, DOCX)"),
+    prompt_mode: PromptMode = Form(
+        default=PromptMode.LAYOUT_ALL,
+        description="Prompt mode for OCR processing"
+    ),
+    fitz_preprocess: bool = Form(
+        default=True,
+        description="Enable fitz preprocessing for images"
+    ),
+    bbox: Optional[str] = Form(
+        default=None,
+        description="Bounding box for grounding OCR, format: 'x1,y1,x2,y2'"
+    ),
+    pages: Optional[str] = Form(
+        default=None,
+        description="PDF pages to process, 1-based, e.g. '1-5,9,12-' (default: all pages)"
+    ),
+    parse_method: ParseMethod = Form(
+        default=ParseMethod.OCR,
+        description="PDF parse method: 'ocr' (model), 'txt' (PDF text layer) or 'auto' (per page)"
+    )
+):
+    """
+    **Queue a document, returns its task_id right away**
+
+    Same parameters as `/process`. The pages of the document are queued as separate jobs,
+    workers of the API process (`QUEUE_WORKERS`) or of `scripts/run_worker.py` parse them.
+    Follow the task with `GET /api/v1/jobs/{task_id}`, fetch the result with `GET /api/v1/jobs/{task_id}/result`.
+
+    **Example:**
+    ```bash
+    curl -X POST "http://localhost:8000/api/v1/jobs" -F "file=@document.pdf"
+    ```
+    """
+    bbox_list = _parse_bbox(bbox)
+    _validate_pages(pages)
+    upload_path, file_hash = await _save_upload(file)
+
+    task_id = await run_in_threadpool(
+        job_service.submit,
+        file_path=str(upload_path.resolve()),
+        original_filename=file.filename,
+        file_hash=file_hash,
+        prompt_mode=prompt_mode.value,
+        fitz_preprocess=fitz_preprocess,
+        bbox=bbox_list,
+        pages=pages,
+        parse_method=parse_method.value
+    )
+    return {
+        "task_id": task_id,
+        "status": ProcessingStatus.PENDING,
+        "file_hash": file_hash,
+        "status_url": f"/api/v1/jobs/{task_id}",
+        "result_url": f"/api/v1/jobs/{task_id}/result"
+    }
+
+@router.get("/jobs/{task_id}", response_model=TaskStatusResponse)
+def get_job_status(task_id: str):
+    """
+    Progress of a task: status, finished / total pages and `progress` in percent
+    """
+    return _task_status(task_id, _get_task(task_id))
+
+@router.get("/jobs/{task_id}/result", response_model=ProcessResponse)
+def get_job_result(task_id: str):
+    """
+    Result of a finished task, the same `ProcessResponse` as `/process`
+
+    Returns 202 with the task status while the task is still running.
+    """
+    task = _get_task(task_id)
+    if task.get("result") is None:
+        return JSONResponse(status_code=202, content=_task_status(task_id, task).model_dump(mode="json"))
+    return task["result"]
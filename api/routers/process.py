@@ -1,23 +1,131 @@
 """
 Unified processing API endpoint
 """
-import os
+import json
+import uuid
+import asyncio
+import hashlib
 import logging
+import functools
+import aiofiles
 from pathlib import Path
-from typing import Optional, List
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import JSONResponse
+from typing import Optional, List, Tuple
+from fastapi import APIRouter, UploadFile, File, Form, Query, HTTPException
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
 from api.config import settings
 from api.models.schemas import (
-    PromptMode, ProcessResponse, ErrorResponse
+    PromptMode, ParseMethod, ProcessingStatus, ProcessResponse,
+    PageEstimate, EstimateResponse
 )
 from api.services.ocr_service import ocr_service
+from api.services.admission import admission, AdmissionRejected
+from dots_ocr.utils.doc_utils import parse_page_ranges
+from dots_ocr.utils.metrics import counters
+from dots_ocr.utils.governor import governor_stats
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1", tags=["Process"])
 
+async def _save_upload(file: UploadFile) -> Tuple[Path, str]:
+    """
+    Stream an upload to a uniquely named file in UPLOAD_DIR, checking its extension and size
+    
+    Chunks go to disk as they arrive, memory use does not depend on the file size.
+    
+    Returns:
+        (path of the saved file, sha256 hex digest of its content)
+    """
+    # Check file extension
+    file_ext = Path(file.filename).suffix.lower()
+    if file_ext not in settings.ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {file_ext}. Allowed: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+        )
+    
+    # Unique name, concurrent uploads of the same filename do not overwrite each other
+    upload_path = settings.UPLOAD_DIR / f"{uuid.uuid4().hex}{file_ext}"
+    upload_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    file_size = 0
+    chunk_size = 1024 * 1024  # 1MB chunks
+    sha256 = hashlib.sha256()
+    try:
+        async with aiofiles.open(upload_path, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                file_size += len(chunk)
+                if file_size > settings.MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024:.0f}MB"
+                    )
+                sha256.update(chunk)
+                await f.write(chunk)
+    except BaseException:
+        upload_path.unlink(missing_ok=True)
+        raise
+    
+    file_hash = sha256.hexdigest()
+    logger.info(f"Uploaded file: {file.filename} ({file_size / 1024:.1f}KB, sha256 {file_hash[:12]})")
+    return upload_path, file_hash
+
+def _parse_bbox(bbox: Optional[str]) -> Optional[List[int]]:
+    """Parse 'x1,y1,x2,y2'"""
+    if not bbox:
+        return None
+    try:
+        bbox_list = [int(x.strip()) for x in bbox.split(',')]
+        if len(bbox_list) != 4:
+            raise ValueError("bbox must have 4 values")
+    except Exception as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid bbox format. Expected 'x1,y1,x2,y2', got: {bbox}"
+        )
+    return bbox_list
+
+def _validate_pages(pages: Optional[str]):
+    """Validate page selection if provided"""
+    if pages:
+        try:
+            parse_page_ranges(pages)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+async def _admit(upload_path: Path, pages: Optional[str], parse_method: ParseMethod, fitz_preprocess: bool) -> Optional[int]:
+    """
+    Reserve the estimated work of an upload, or reject it with 429/503 and Retry-After
+    
+    Returns the tokens to release when the document is finished, None if admission control is off.
+    """
+    if not admission.enabled:
+        return None
+    try:
+        tokens = await run_in_threadpool(
+            admission.estimate_tokens, str(upload_path), pages, parse_method.value, fitz_preprocess
+        )
+    except Exception as e:  # unreadable file, processing reports the error
+        logger.warning(f"Could not estimate {upload_path.name}: {e}")
+        tokens = 0
+    try:
+        return admission.admit(tokens)
+    except AdmissionRejected as e:
+        upload_path.unlink(missing_ok=True)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=e.detail,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+def _sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
 @router.post("/process", response_model=ProcessResponse)
 async def process_document(
     file: UploadFile = File(..., description="File to process (PDF, Image, DOC, DOCX)"),
@@ -32,6 +140,14 @@ async def process_document(
     bbox: Optional[str] = Form(
         default=None,
         description="Bounding box for grounding OCR, format: 'x1,y1,x2,y2'"
+    ),
+    pages: Optional[str] = Form(
+        default=None,
+        description="PDF pages to process, 1-based, e.g. '1-5,9,12-' (default: all pages)"
+    ),
+    parse_method: ParseMethod = Form(
+        default=ParseMethod.OCR,
+        description="PDF parse method: 'ocr' (model), 'txt' (PDF text layer) or 'auto' (per page)"
     )
 ):
     """
@@ -53,6 +169,14 @@ async def process_document(
     - `prompt_ocr`: OCR text only
     - `prompt_grounding_ocr`: OCR with bounding box (requires bbox parameter)
     
+    **Page selection:** `pages=1-5,9,12-` processes only those PDF pages,
+    the others are never rendered or sent to the model.
+    
+    **Parse methods (PDF only):**
+    - `ocr`: every page goes through the model (default)
+    - `txt`: layout is built from the PDF text layer, no model call
+    - `auto`: text layer for born-digital pages, model for scanned / image-heavy pages
+    
     **Example:**
     ```bash
     curl -X POST "http://localhost:8000/api/v1/process" \\
@@ -61,62 +185,30 @@ async def process_document(
     ```
     """
     try:
-        # Validate file size
-        file_size = 0
-        chunk_size = 1024 * 1024  # 1MB chunks
-        content = bytearray()
-        
-        while True:
-            chunk = await file.read(chunk_size)
-            if not chunk:
-                break
-            file_size += len(chunk)
-            content.extend(chunk)
-            
-            if file_size > settings.MAX_UPLOAD_SIZE:
-                raise HTTPException(
-                    status_code=413,
-                    detail=f"File too large. Max size: {settings.MAX_UPLOAD_SIZE / 1024 / 1024:.0f}MB"
-                )
-        
-        # Check file extension
-        file_ext = Path(file.filename).suffix.lower()
-        if file_ext not in settings.ALLOWED_EXTENSIONS:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported file type: {file_ext}. Allowed: {', '.join(settings.ALLOWED_EXTENSIONS)}"
-            )
-        
-        # Save uploaded file
-        upload_path = settings.UPLOAD_DIR / file.filename
-        upload_path.parent.mkdir(parents=True, exist_ok=True)
-        
-        with open(upload_path, "wb") as f:
-            f.write(content)
-        
-        logger.info(f"Uploaded file: {file.filename} ({file_size / 1024:.1f}KB)")
-        
-        # Parse bbox if provided
-        bbox_list = None
-        if bbox:
-            try:
-                bbox_list = [int(x.strip()) for x in bbox.split(',')]
-                if len(bbox_list) != 4:
-                    raise ValueError("bbox must have 4 values")
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Invalid bbox format. Expected 'x1,y1,x2,y2', got: {bbox}"
-                )
+        bbox_list = _parse_bbox(bbox)
+        _validate_pages(pages)
+        upload_path, file_hash = await _save_upload(file)
+        tokens = await _admit(upload_path, pages, parse_method, fitz_preprocess)
         
         # Process the file
-        response = await ocr_service.process_file(
-            file_path=str(upload_path),
-            original_filename=file.filename,
-            prompt_mode=prompt_mode,
-            fitz_preprocess=fitz_preprocess,
-            bbox=bbox_list
-        )
+        processed = False
+        response = None
+        try:
+            response = await ocr_service.process_file(
+                file_path=str(upload_path),
+                original_filename=file.filename,
+                file_hash=file_hash,
+                prompt_mode=prompt_mode,
+                fitz_preprocess=fitz_preprocess,
+                bbox=bbox_list,
+                pages=pages,
+                parse_method=parse_method
+            )
+            processed = response.status == ProcessingStatus.COMPLETED
+        finally:
+            if tokens is not None:
+                admission.release(tokens, processed=processed)
+            ocr_service.discard_upload(str(upload_path), response.task_id if response is not None else None)
         
         return response
         
@@ -129,6 +221,211 @@ async def process_document(
             detail=f"Processing failed: {str(e)}"
         )
 
+@router.post("/process/stream")
+async def process_document_stream(
+    file: UploadFile = File(..., description="File to process (PDF, Image, DOC, DOCX)"),
+    prompt_mode: PromptMode = Form(
+        default=PromptMode.LAYOUT_ALL,
+        description="Prompt mode for OCR processing"
+    ),
+    fitz_preprocess: bool = Form(
+        default=True,
+        description="Enable fitz preprocessing for images"
+    ),
+    bbox: Optional[str] = Form(
+        default=None,
+        description="Bounding box for grounding OCR, format: 'x1,y1,x2,y2'"
+    ),
+    pages: Optional[str] = Form(
+        default=None,
+        description="PDF pages to process, 1-based, e.g. '1-5,9,12-' (default: all pages)"
+    ),
+    parse_method: ParseMethod = Form(
+        default=ParseMethod.OCR,
+        description="PDF parse method: 'ocr' (model), 'txt' (PDF text layer) or 'auto' (per page)"
+    )
+):
+    """
+    **Same as `/process`, streamed as Server-Sent Events**
+    
+    Layout elements are sent as soon as the model generates them, instead of after the whole document:
+    - `event: cell`, `data: {"page": 1, "cell": {"bbox": [...], "category": "Text", "text": "..."}}`
+      (1-based page, bbox in original image coordinates; pages are processed concurrently, so cells of different pages interleave)
+    - `event: result`, `data`: the final `ProcessResponse`, as returned by `/process`
+    
+    **Example:**
+    ```bash
+    curl -N -X POST "http://localhost:8000/api/v1/process/stream" \\
+      -F "file=@document.pdf"
+    ```
+    """
+    bbox_list = _parse_bbox(bbox)
+    _validate_pages(pages)
+    upload_path, file_hash = await _save_upload(file)
+    tokens = await _admit(upload_path, pages, parse_method, fitz_preprocess)
+    
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    
+    def on_cell(page_no: int, cell: dict):
+        # called from the page worker threads
+        loop.call_soon_threadsafe(events.put_nowait, {"page": page_no + 1, "cell": cell})
+    
+    processing = loop.run_in_executor(ocr_service.executor, functools.partial(
+        ocr_service.process_file_sync,
+        file_path=str(upload_path),
+        original_filename=file.filename,
+        file_hash=file_hash,
+        prompt_mode=prompt_mode,
+        fitz_preprocess=fitz_preprocess,
+        bbox=bbox_list,
+        pages=pages,
+        parse_method=parse_method,
+        on_cell=on_cell
+    ))
+    
+    def on_done(future):
+        # queued after every cell of the worker threads
+        events.put_nowait(None)
+        response = None if future.cancelled() or future.exception() is not None else future.result()
+        if tokens is not None:
+            processed = response is not None and response.status == ProcessingStatus.COMPLETED
+            admission.release(tokens, processed=processed)
+        ocr_service.discard_upload(str(upload_path), response.task_id if response is not None else None)
+    processing.add_done_callback(on_done)
+    
+    async def event_stream():
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield _sse_event("cell", json.dumps(event, ensure_ascii=False))
+        response = await processing
+        yield _sse_event("result", response.model_dump_json())
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/estimate", response_model=EstimateResponse)
+async def estimate_document(
+    file: UploadFile = File(..., description="File to estimate (PDF, Image, DOC, DOCX)"),
+    fitz_preprocess: bool = Form(
+        default=True,
+        description="Enable fitz preprocessing for images"
+    ),
+    pages: Optional[str] = Form(
+        default=None,
+        description="PDF pages to process, 1-based, e.g. '1-5,9,12-' (default: all pages)"
+    ),
+    parse_method: ParseMethod = Form(
+        default=ParseMethod.OCR,
+        description="PDF parse method: 'ocr' (model), 'txt' (PDF text layer) or 'auto' (per page)"
+    )
+):
+    """
+    **Dry run: pages, visual tokens and latency of a document, without processing it**
+    
+    Page sizes are read from the PDF page boxes / image header, nothing is rendered or sent
+    to the model and nothing is kept. Same parameters as `/process`.
+    
+    The latency is `visual_tokens / throughput_tokens_per_s`, with the drain rate measured by
+    this process (`measured`), else the one saved in `THROUGHPUT_FILE` (`file`), else
+    `ADMISSION_DEFAULT_THROUGHPUT` (`default`). `estimated_wait_seconds` also counts the
+    documents being processed. `parse_method=auto` is counted as `ocr` (upper bound).
+    
+    **Example:**
+    ```bash
+    curl -X POST "http://localhost:8000/api/v1/estimate" -F "file=@document.pdf"
+    ```
+    """
+    _validate_pages(pages)
+    upload_path, file_hash = await _save_upload(file)
+    try:
+        file_type, estimates = await run_in_threadpool(
+            ocr_service.estimate_document,
+            str(upload_path), file.filename, pages, parse_method.value, fitz_preprocess
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Estimation error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Estimation failed: {str(e)}")
+    finally:
+        upload_path.unlink(missing_ok=True)
+    
+    tokens = sum(page["visual_tokens"] for page in estimates)
+    throughput, source = admission.throughput()
+    pending = admission.pending_tokens()
+    return EstimateResponse(
+        file_type=file_type,
+        original_filename=file.filename,
+        file_hash=file_hash,
+        total_pages=len(estimates),
+        pages=[
+            PageEstimate(
+                page_number=page["page_no"] + 1,
+                width=page["width"],
+                height=page["height"],
+                input_width=page["input_width"],
+                input_height=page["input_height"],
+                visual_tokens=page["visual_tokens"]
+            )
+            for page in estimates
+        ],
+        visual_tokens=tokens,
+        throughput_tokens_per_s=round(throughput, 1),
+        throughput_source=source,
+        estimated_seconds=round(tokens / throughput, 2),
+        pending_tokens=pending,
+        estimated_wait_seconds=round((pending + tokens) / throughput, 2)
+    )
+
+@router.get("/results/{task_id}/overlay")
+def get_layout_overlay(
+    task_id: str,
+    page: int = Query(default=1, ge=1, description="1-based page number"),
+    max_size: Optional[int] = Query(default=None, ge=64, le=4500, description="Longest side of the image in pixels")
+):
+    """
+    Layout overlay image of a processed page
+    
+    Rendered on demand from the stored layout JSON and the source document, so processing
+    does not spend time writing overlay images nobody looks at. Rendered images are cached.
+    """
+    try:
+        uuid.UUID(task_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail=f"Task not found: {task_id}")
+    try:
+        overlay_path = ocr_service.render_overlay(task_id, page_number=page, max_size=max_size)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return FileResponse(overlay_path, media_type="image/jpeg")
+
+@router.get("/metrics")
+async def metrics():
+    """
+    Process counters
+    
+    `repetition_stops` counts generations stopped early because the model looped,
+    also split per backend (`.hf`, `.vllm`) and per reason (`.periodic`, `.repeated_cells`).
+    
+    `admission` reports the estimated visual tokens of the documents being processed, the
+    measured drain rate and the admitted / rejected counts (`admission.*` counters).
+    
+    `concurrency` reports, per backend, the pages at the model (`inflight` of `max_inflight`),
+    the pages waiting for a slot (`queue_depth`) and how long they waited.
+    """
+    return {
+        "counters": counters.snapshot(),
+        "concurrency": governor_stats(),
+        "admission": admission.stats(),
+        "inference_cache": ocr_service.cache_stats()
+    }
+
 @router.get("/health")
 async def health_check():
     """
@@ -138,14 +435,10 @@ async def health_check():
     """
     import time
     
-    # Try to initialize model if not loaded
+    # Start loading the model if needed, the check itself never waits for it
     model_loaded = ocr_service.is_model_loaded()
     if not model_loaded:
-        try:
-            ocr_service.initialize_model()
-            model_loaded = True
-        except:
-            pass
+        ocr_service.start_model_loading()
     
     return {
         "status": "healthy",
@@ -153,5 +446,6 @@ async def health_check():
         "device": settings.device_name,
         "gpu_available": settings.is_gpu_available,
         "model_loaded": model_loaded,
+        "inference_cache": ocr_service.cache_stats(),
         "timestamp": time.time()
     }
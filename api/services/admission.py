@@ -0,0 +1,187 @@
+"""
+Admission control of the synchronous processing endpoints
+
+Every admitted document adds its estimated visual tokens (pages x smart_resize input size)
+to the pending work of the process until it is finished. A document is rejected up front
+when it would push the pending work over the budget (429), or when the backlog would take longer
+to drain than a client waits for a response (503). Both carry a Retry-After computed from the
+measured drain rate, instead of accepting the upload and timing out after spending GPU time on it.
+"""
+import math
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any, Tuple
+
+from dots_ocr.utils.consts import MAX_PIXELS
+from dots_ocr.utils.estimate import estimate_pages, visual_tokens, load_throughput, record_throughput
+from dots_ocr.utils.image_utils import smart_resize
+from dots_ocr.utils.metrics import counters
+from api.config import settings
+
+logger = logging.getLogger(__name__)
+
+class AdmissionRejected(Exception):
+    """The document was not admitted, retry after `retry_after` seconds"""
+
+    def __init__(self, status_code: int, retry_after: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.retry_after = retry_after
+        self.detail = detail
+
+class AdmissionController:
+    """
+    Pending work budget in visual tokens, with the drain rate measured as exponentially weighted
+    sums of drained tokens over busy seconds (documents finishing together do not skew it)
+    """
+
+    def __init__(
+        self,
+        max_pending_tokens: Optional[int],
+        max_wait: Optional[float] = None,
+        default_throughput: float = 1000.0,
+        ewma_alpha: float = 0.3,
+        max_retry_after: int = 300,
+        throughput_file: Optional[str] = None
+    ):
+        self.max_pending_tokens = max_pending_tokens
+        self.max_wait = max_wait
+        self.default_throughput = default_throughput
+        self.ewma_alpha = ewma_alpha
+        self.max_retry_after = max_retry_after
+        self.throughput_file = throughput_file
+        self._recorded_throughput = load_throughput(throughput_file) if throughput_file else None
+        self._lock = threading.Lock()
+        self._pending_tokens = 0
+        self._pending_requests = 0
+        self._drained_tokens = 0.0
+        self._busy_seconds = 0.0
+        self._last_drain: Optional[float] = None  # start of the current busy period or last completion
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_pending_tokens) or bool(self.max_wait)
+
+    def estimate_tokens(
+        self,
+        file_path: str,
+        pages: Optional[str] = None,
+        parse_method: str = "ocr",
+        fitz_preprocess: bool = True
+    ) -> int:
+        """Visual tokens of a document; DOC/DOCX count as one page of MAX_PIXELS until converted"""
+        if Path(file_path).suffix.lower() in (".doc", ".docx"):
+            max_pixels = settings.MAX_PIXELS or MAX_PIXELS
+            side = int(math.sqrt(max_pixels))
+            height, width = smart_resize(side, side, max_pixels=max_pixels)
+            return visual_tokens(width, height)
+        estimates = estimate_pages(
+            file_path,
+            dpi=settings.DPI,
+            min_pixels=settings.MIN_PIXELS,
+            max_pixels=settings.MAX_PIXELS,
+            pages=pages,
+            parse_method=parse_method,
+            fitz_preprocess=fitz_preprocess
+        )
+        return sum(page['visual_tokens'] for page in estimates)
+
+    @property
+    def _throughput(self) -> Optional[float]:
+        """Measured tokens/s, None until a document finished"""
+        if self._drained_tokens <= 0 or self._busy_seconds <= 0:
+            return None
+        return self._drained_tokens / self._busy_seconds
+
+    def throughput(self) -> Tuple[float, str]:
+        """Drain rate in tokens/s and where it comes from: 'measured', 'file' (THROUGHPUT_FILE) or 'default'"""
+        with self._lock:
+            if self._throughput is not None:
+                return self._throughput, "measured"
+        if self._recorded_throughput is not None:
+            return self._recorded_throughput, "file"
+        return self.default_throughput, "default"
+
+    def pending_tokens(self) -> int:
+        with self._lock:
+            return self._pending_tokens
+
+    def save_throughput(self):
+        """Fold the drain rate measured by this process into THROUGHPUT_FILE, for the next start"""
+        if not self.throughput_file:
+            return
+        with self._lock:
+            tokens, seconds = self._drained_tokens, self._busy_seconds
+        if tokens > 0 and seconds > 0:
+            rate = record_throughput(self.throughput_file, tokens, seconds, alpha=self.ewma_alpha)
+            logger.info(f"Recorded throughput {rate:.1f} tokens/s to {self.throughput_file}")
+
+    def _retry_after(self, tokens: float, throughput: float) -> int:
+        return max(1, min(self.max_retry_after, math.ceil(tokens / throughput)))
+
+    def admit(self, tokens: int) -> int:
+        """Reserve `tokens` of pending work, raises AdmissionRejected. Returns the tokens to `release`"""
+        with self._lock:
+            throughput = self._throughput or self._recorded_throughput or self.default_throughput
+            pending = self._pending_tokens
+            # an idle process always takes the document, even one larger than the budget
+            if self.max_pending_tokens and pending > 0 and pending + tokens > self.max_pending_tokens:
+                rejection = AdmissionRejected(
+                    429,
+                    self._retry_after(pending + tokens - self.max_pending_tokens, throughput),
+                    f"Server busy: {pending} visual tokens pending, budget {self.max_pending_tokens}"
+                )
+            elif (self.max_wait and pending > 0 and self._throughput is not None
+                    and (pending + tokens) / throughput > self.max_wait):
+                rejection = AdmissionRejected(
+                    503,
+                    self._retry_after(pending + tokens - self.max_wait * throughput, throughput),
+                    f"Server overloaded: estimated wait {(pending + tokens) / throughput:.0f}s exceeds {self.max_wait:.0f}s"
+                )
+            else:
+                if self._pending_requests == 0:
+                    self._last_drain = time.monotonic()
+                self._pending_tokens += tokens
+                self._pending_requests += 1
+                counters.inc('admission.admitted')
+                return tokens
+        counters.inc('admission.rejected')
+        counters.inc(f'admission.rejected.{rejection.status_code}')
+        logger.warning(f"Rejected document of {tokens} visual tokens ({rejection.status_code}): {rejection.detail}")
+        raise rejection
+
+    def release(self, tokens: int, processed: bool = True):
+        """Remove finished work; processed documents update the drain rate"""
+        with self._lock:
+            now = time.monotonic()
+            self._pending_tokens -= tokens
+            self._pending_requests -= 1
+            if self._last_drain is not None:
+                decay = 1 - self.ewma_alpha
+                self._busy_seconds = self._busy_seconds * decay + (now - self._last_drain)
+                self._drained_tokens = self._drained_tokens * decay + (tokens if processed else 0)
+            # drain rate is measured while busy only, idle time does not count
+            self._last_drain = now if self._pending_requests > 0 else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "pending_tokens": self._pending_tokens,
+                "pending_requests": self._pending_requests,
+                "max_pending_tokens": self.max_pending_tokens,
+                "max_wait": self.max_wait,
+                "throughput_tokens_per_s": round(self._throughput, 1) if self._throughput else None,
+                "admitted": counters.get('admission.admitted'),
+                "rejected": counters.get('admission.rejected')
+            }
+
+# Global admission controller instance
+admission = AdmissionController(
+    max_pending_tokens=settings.ADMISSION_MAX_PENDING_TOKENS,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    default_throughput=settings.ADMISSION_DEFAULT_THROUGHPUT,
+    throughput_file=settings.THROUGHPUT_FILE
+)
@@ -0,0 +1,274 @@
+"""
+Asynchronous jobs: submitted documents are split into page jobs on a queue,
+workers (threads of the API process or separate worker processes) pull and parse the pages
+"""
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+from datetime import datetime
+
+from dots_ocr.utils.doc_utils import get_pdf_page_count, select_pages
+from api.config import settings
+from api.models.schemas import FileType, ProcessingStatus, ProcessResponse
+from api.services.ocr_service import OCRService, ocr_service
+from api.services.task_queue import QueueBackend, make_queue_backend
+
+logger = logging.getLogger(__name__)
+
+# file type reported when the document failed before detection
+_FILE_TYPES_BY_EXT = {".pdf": "pdf", ".docx": "docx", ".doc": "doc"}
+
+class JobService:
+    """Submit documents as tasks, follow their progress and run the queue workers"""
+
+    def __init__(self, backend: QueueBackend, service: OCRService, max_attempts: int = 3):
+        self.backend = backend
+        self.service = service
+        self.max_attempts = max_attempts
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def submit(
+        self,
+        file_path: str,
+        original_filename: str,
+        prompt_mode: str,
+        fitz_preprocess: bool = True,
+        bbox: Optional[List[int]] = None,
+        pages: Optional[str] = None,
+        parse_method: str = "ocr",
+        file_hash: Optional[str] = None
+    ) -> str:
+        """Queue a document, returns its task_id"""
+        task_id = str(uuid.uuid4())
+        self.backend.create_task(task_id, {
+            "status": ProcessingStatus.PENDING.value,
+            "file_path": file_path,
+            "original_filename": original_filename,
+            "file_hash": file_hash,
+            "params": {
+                "prompt_mode": prompt_mode,
+                "fitz_preprocess": fitz_preprocess,
+                "bbox": bbox,
+                "pages": pages,
+                "parse_method": parse_method,
+            },
+            "total_pages": None,
+            "created_at": datetime.now().isoformat(),
+        })
+        self.backend.put_job({"type": "document", "task_id": task_id})
+        logger.info(f"[{task_id}] Queued {original_filename}")
+        return task_id
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self.backend.get_task(task_id)
+
+    # Workers
+
+    def start(self, num_threads: int):
+        """Start worker threads pulling jobs from the queue"""
+        self._stop.clear()
+        for i in range(num_threads):
+            thread = threading.Thread(target=self.run_worker, name=f"queue-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if num_threads:
+            logger.info(f"Started {num_threads} queue workers ({type(self.backend).__name__})")
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the workers after their current job"""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_worker(self):
+        """Pull and run jobs until `stop`"""
+        while not self._stop.is_set():
+            try:
+                job = self.backend.get_job(timeout=1.0)
+            except Exception as e:
+                logger.error(f"Queue error: {e}")
+                time.sleep(1.0)
+                continue
+            if job is None:
+                continue
+            try:
+                with self._heartbeat(job):
+                    if job.get("attempts", 1) > self.max_attempts:
+                        self._give_up(job)
+                    elif job["type"] == "document":
+                        self._run_document(job["task_id"])
+                    else:
+                        self._run_page(job["task_id"], job["page_idx"])
+                self.backend.ack_job(job)
+            except Exception as e:
+                # not acknowledged, the job is handed out again once its lease runs out
+                logger.error(f"[{job.get('task_id')}] Job failed: {e}", exc_info=True)
+
+    @contextmanager
+    def _heartbeat(self, job: Dict[str, Any]):
+        """Extend the lease of a job while it runs, the jobs of a dead worker are handed out again"""
+        if not self.backend.leases:
+            yield
+            return
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.backend.lease_timeout / 3):
+                try:
+                    self.backend.extend_lease(job)
+                except Exception as e:
+                    logger.warning(f"[{job.get('task_id')}] Heartbeat failed: {e}")
+
+        thread = threading.Thread(target=beat, name="queue-heartbeat", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _give_up(self, job: Dict[str, Any]):
+        """A job whose workers all died before finishing it: fail its page or document"""
+        task_id = job["task_id"]
+        task = self.backend.get_task(task_id)
+        if task is None or task.get("result") is not None:
+            return
+        error = f"worker lost {job['attempts'] - 1} times"
+        logger.error(f"[{task_id}] Giving up {job['type']} job: {error}")
+        if job["type"] == "document":
+            self._fail(task_id, task, error)
+            return
+        finished = self.backend.add_page_result(task_id, job["page_idx"], {"page_no": job["page_idx"], "error": error})
+        if finished == task["total_pages"]:
+            self._finalize(task_id)
+
+    def _run_document(self, task_id: str):
+        """Convert the document if needed and queue one job per page"""
+        task = self.backend.get_task(task_id)
+        if task is None:  # expired
+            return
+        params = task["params"]
+        result_dir = settings.RESULTS_DIR / task_id
+        result_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            process_path, file_type = self.service.prepare_document(
+                task_id, task["file_path"], task["original_filename"], result_dir
+            )
+            if file_type == FileType.PDF:
+                page_count = get_pdf_page_count(process_path)
+                page_ids = select_pages(params["pages"], page_count) if params["pages"] else list(range(page_count))
+            else:
+                page_ids = [0]
+        except Exception as e:
+            logger.error(f"[{task_id}] Processing failed: {e}", exc_info=True)
+            self._fail(task_id, task, str(e))
+            return
+
+        self.backend.update_task(
+            task_id,
+            status=ProcessingStatus.PROCESSING.value,
+            process_path=process_path,
+            file_type=file_type.value,
+            total_pages=len(page_ids),
+            started_at=time.time()
+        )
+        logger.info(f"[{task_id}] Queued {len(page_ids)} pages")
+        if not page_ids:
+            self._finalize(task_id)
+        for page_idx in page_ids:
+            self.backend.put_job({"type": "page", "task_id": task_id, "page_idx": page_idx})
+
+    def _run_page(self, task_id: str, page_idx: int):
+        task = self.backend.get_task(task_id)
+        if task is None or task.get("result") is not None:  # expired, or finished by a redelivered job
+            return
+        params = task["params"]
+        try:
+            self.service.initialize_model()
+            result = self.service.parser.parse_page(
+                task["process_path"],
+                page_idx,
+                filename=f"task_{task_id}",
+                prompt_mode=params["prompt_mode"],
+                save_dir=str(settings.RESULTS_DIR / task_id),
+                parse_method=params["parse_method"],
+                bbox=params["bbox"],
+                fitz_preprocess=params["fitz_preprocess"],
+                in_memory=True
+            )
+        except Exception as e:
+            logger.error(f"[{task_id}] Page {page_idx + 1} failed: {e}", exc_info=True)
+            result = {"page_no": page_idx, "error": str(e)}
+
+        finished = self.backend.add_page_result(task_id, page_idx, result)
+        # the count is atomic, a single worker sees the last page
+        if finished == task["total_pages"]:
+            self._finalize(task_id)
+
+    def _finalize(self, task_id: str):
+        """Build the ProcessResponse of a task whose pages are all finished"""
+        task = self.backend.get_task(task_id)
+        if task.get("result") is not None:
+            return
+        results = self.backend.get_page_results(task_id)
+        errors = [f"page {result['page_no'] + 1}: {result['error']}" for result in results if 'error' in result]
+        results = [result for result in results if 'error' not in result]
+
+        response = ProcessResponse(
+            task_id=task_id,
+            status=ProcessingStatus.FAILED if errors else ProcessingStatus.COMPLETED,
+            file_type=FileType(task["file_type"]),
+            original_filename=task["original_filename"],
+            file_hash=task.get("file_hash"),
+            created_at=task["created_at"]
+        )
+        try:
+            self.service.collect_results(
+                response, results, settings.RESULTS_DIR / task_id, task["process_path"], response.file_type
+            )
+        except Exception as e:
+            logger.error(f"[{task_id}] Collecting results failed: {e}", exc_info=True)
+            errors.append(str(e))
+            response.status = ProcessingStatus.FAILED
+        response.total_pages = task["total_pages"]
+        response.processing_time = time.time() - task["started_at"]
+        response.device_used = settings.device_name
+        response.completed_at = datetime.now()
+        if errors:
+            response.error = "; ".join(errors)
+        else:
+            response.message = f"Successfully processed {len(results)} {'page' if len(results) == 1 else 'pages'}"
+
+        # the result holds the content of every page, page results are not needed anymore
+        self.backend.update_task(
+            task_id, status=response.status.value, result=response.model_dump(mode="json"),
+            finished_pages=task["finished_pages"]
+        )
+        self.backend.delete_page_results(task_id)
+        self.service.discard_upload(task["file_path"], task_id)
+        logger.info(f"[{task_id}] Task {response.status.value} in {response.processing_time:.2f}s")
+
+    def _fail(self, task_id: str, task: Dict[str, Any], error: str):
+        response = ProcessResponse(
+            task_id=task_id,
+            status=ProcessingStatus.FAILED,
+            file_type=FileType(task.get("file_type") or _FILE_TYPES_BY_EXT.get(
+                Path(task["original_filename"]).suffix.lower(), FileType.IMAGE.value
+            )),
+            original_filename=task["original_filename"],
+            file_hash=task.get("file_hash"),
+            error=error,
+            created_at=task["created_at"],
+            completed_at=datetime.now()
+        )
+        self.backend.update_task(task_id, status=response.status.value, result=response.model_dump(mode="json"))
+        self.service.discard_upload(task["file_path"], task_id)
+
+# Global job service instance
+job_service = JobService(make_queue_backend(settings), ocr_service, max_attempts=settings.QUEUE_MAX_ATTEMPTS)
@@ -2,18 +2,30 @@
 OCR Service - Main processing logic
 """
 import os
+import re
 import uuid
 import time
 import json
+import shutil
+import asyncio
 import logging
+import functools
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Tuple
 from datetime import datetime
 
 from dots_ocr.parser import DotsOCRParser
+from dots_ocr.utils.inference_cache import InferenceCache
+from dots_ocr.utils.image_utils import fetch_image
+from dots_ocr.utils.doc_utils import render_pdf_page
+from dots_ocr.utils.estimate import estimate_pages
+from dots_ocr.utils.layout_utils import draw_layout_on_image
 from api.config import settings
 from api.models.schemas import (
-    FileType, ProcessingStatus, PromptMode, 
+    FileType, ProcessingStatus, PromptMode, ParseMethod,
     ProcessResponse, LayoutElement
 )
 from api.services.detector import FileTypeDetector
@@ -33,12 +45,30 @@ class OCRService:
         )
         self.parser: Optional[DotsOCRParser] = None
         self._model_loaded = False
+        self._model_lock = threading.Lock()
+        self._model_loading: Optional[Future] = None
+        # model inference, pdf rendering and file I/O are blocking, they run here instead of the event loop;
+        # the transformers backend shares one model, its documents are processed one at a time
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.OCR_WORKERS if settings.USE_VLLM else 1, thread_name_prefix="ocr"
+        )
+        self.inference_cache: Optional[InferenceCache] = None
+        if settings.INFERENCE_CACHE:
+            self.inference_cache = InferenceCache(
+                cache_dir=str(settings.INFERENCE_CACHE_DIR) if settings.INFERENCE_CACHE_DIR else None,
+                max_memory_entries=settings.INFERENCE_CACHE_MEMORY_ENTRIES,
+                max_disk_bytes=settings.INFERENCE_CACHE_MAX_BYTES
+            )
         
     def initialize_model(self):
         """Initialize the OCR model (lazy loading)"""
         if self._model_loaded:
             return
-        
+        with self._model_lock:  # concurrent first requests load the model once
+            if not self._model_loaded:
+                self._initialize_model()
+    
+    def _initialize_model(self):
         logger.info(f"Initializing dots.ocr model on {settings.device_name}...")
         start_time = time.time()
         
@@ -51,17 +81,43 @@ class OCRService:
                     dpi=settings.DPI,
                     min_pixels=settings.MIN_PIXELS,
                     max_pixels=settings.MAX_PIXELS,
-                    use_hf=False
+                    use_hf=False,
+                    repetition_stop=settings.REPETITION_STOP,
+                    inference_cache=self.inference_cache,
+                    timeout=settings.VLLM_TIMEOUT,
+                    image_format=settings.IMAGE_FORMAT,
+                    image_quality=settings.IMAGE_QUALITY,
+                    png_compress_level=settings.PNG_COMPRESS_LEVEL,
+                    grayscale=settings.IMAGE_GRAYSCALE,
+                    preprocess_engine=settings.PREPROCESS_ENGINE,
+                    output_profile=settings.OUTPUT_PROFILE,
+                    picture_mode=settings.PICTURE_MODE,
+                    max_inflight_pages=settings.MAX_INFLIGHT_PAGES
                 )
             else:
                 # Use HuggingFace Transformers (works on CPU)
-                # Note: model_path is hardcoded in DotsOCRParser._load_hf_model() as "./weights/DotsOCR"
                 self.parser = DotsOCRParser(
                     dpi=settings.DPI,
                     min_pixels=settings.MIN_PIXELS,
                     max_pixels=settings.MAX_PIXELS,
                     output_dir=str(settings.RESULTS_DIR),
-                    use_hf=True  # Use HuggingFace backend
+                    use_hf=True,  # Use HuggingFace backend
+                    repetition_stop=settings.REPETITION_STOP,
+                    hf_batch_size=settings.HF_BATCH_SIZE,
+                    hf_model_path=settings.MODEL_PATH,
+                    hf_profile=settings.HF_PROFILE or ("cpu" if settings.device_name == "cpu" else None),
+                    hf_device=settings.DEVICE,
+                    hf_attn_implementation=settings.HF_ATTN_IMPLEMENTATION,
+                    hf_dtype=settings.HF_DTYPE,
+                    hf_autocast_dtype=settings.HF_AUTOCAST_DTYPE,
+                    hf_num_threads=settings.HF_NUM_THREADS,
+                    hf_quantize=settings.HF_QUANTIZE,
+                    hf_max_new_tokens=settings.HF_MAX_NEW_TOKENS,
+                    inference_cache=self.inference_cache,
+                    preprocess_engine=settings.PREPROCESS_ENGINE,
+                    output_profile=settings.OUTPUT_PROFILE,
+                    picture_mode=settings.PICTURE_MODE,
+                    max_inflight_pages=settings.MAX_INFLIGHT_PAGES
                 )
             
             self._model_loaded = True
@@ -76,13 +132,40 @@ class OCRService:
         """Check if model is loaded"""
         return self._model_loaded
     
-    async def process_file(
+    def start_model_loading(self):
+        """Load the model in a worker thread without waiting for it"""
+        if self._model_loaded or (self._model_loading is not None and not self._model_loading.done()):
+            return
+        self._model_loading = self.executor.submit(self.initialize_model)
+    
+    def shutdown(self):
+        """Stop accepting work, running documents finish in their threads"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """Inference cache hit/miss counters (None if the cache is disabled)"""
+        if self.inference_cache is None:
+            return None
+        return self.inference_cache.stats()
+    
+    async def process_file(self, *args, **kwargs) -> ProcessResponse:
+        """Process a file in a worker thread, see `process_file_sync`"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self.process_file_sync, *args, **kwargs)
+        )
+    
+    def process_file_sync(
         self, 
         file_path: str,
         original_filename: str,
         prompt_mode: PromptMode = PromptMode.LAYOUT_ALL,
         fitz_preprocess: bool = True,
-        bbox: Optional[List[int]] = None
+        bbox: Optional[List[int]] = None,
+        pages: Optional[str] = None,
+        parse_method: ParseMethod = ParseMethod.OCR,
+        on_cell: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+        file_hash: Optional[str] = None
     ) -> ProcessResponse:
         """
         Process a file (auto-detect type and convert if needed)
@@ -93,6 +176,11 @@ class OCRService:
             prompt_mode: Prompt mode for OCR
             fitz_preprocess: Enable fitz preprocessing
             bbox: Bounding box for grounding OCR
+            pages: PDF page selection, e.g. "1-5,9,12-" (1-based)
+            parse_method: PDF parse method (ocr, txt, auto)
+            on_cell: Called with (page_no, cell) for every layout element as soon as the model
+                generates it, from the page worker threads
+            file_hash: sha256 of the uploaded file, returned in the response
             
         Returns:
             ProcessResponse with results
@@ -110,6 +198,7 @@ class OCRService:
             status=ProcessingStatus.PROCESSING,
             file_type=FileType.IMAGE,  # Will be updated
             original_filename=original_filename,
+            file_hash=file_hash,
             created_at=datetime.now()
         )
         
@@ -120,84 +209,43 @@ class OCRService:
             if not self._model_loaded:
                 self.initialize_model()
             
-            # Step 1: Detect file type
-            logger.info(f"[{task_id}] Detecting file type: {original_filename}")
-            file_type, ext = self.detector.detect(file_path)
+            # Step 1-2: Detect file type, convert if needed
+            process_path, file_type = self.prepare_document(task_id, file_path, original_filename, result_dir)
             response.file_type = file_type
             
-            # Step 2: Convert if needed
-            process_path = file_path
-            
-            if file_type in [FileType.DOC, FileType.DOCX]:
-                logger.info(f"[{task_id}] Converting DOCX to PDF...")
-                pdf_path = self.converter.docx_to_pdf(
-                    file_path, 
-                    output_path=str(result_dir / f"{Path(original_filename).stem}.pdf")
-                )
-                process_path = pdf_path
-                file_type = FileType.PDF
-                response.file_type = FileType.PDF
-            
             # Step 3: Process with OCR
             logger.info(f"[{task_id}] Processing with OCR (prompt: {prompt_mode})...")
             
+            # Parsed from the file on disk (pdf pages are rendered from it one at a time, the upload
+            # is never read into memory whole); cells and markdown come back in the results, result_dir
+            # only receives the artifacts of the output profile (json/md URLs, overlays)
             if file_type == FileType.PDF:
                 results = self.parser.parse_pdf(
-                    input_path=process_path,
-                    filename=f"task_{task_id}",
-                    prompt_mode=prompt_mode.value,
-                    save_dir=str(result_dir)
+                    str(process_path),
+                    f"task_{task_id}",
+                    prompt_mode.value,
+                    str(result_dir),
+                    pages=pages,
+                    parse_method=parse_method.value,
+                    on_cell=on_cell,
+                    in_memory=True
                 )
-                response.total_pages = len(results)
             else:
-                # Image processing
                 results = self.parser.parse_image(
-                    input_path=process_path,
-                    filename=f"task_{task_id}",
-                    prompt_mode=prompt_mode.value,
-                    save_dir=str(result_dir),
-                    fitz_preprocess=fitz_preprocess
+                    str(process_path),
+                    f"task_{task_id}",
+                    prompt_mode.value,
+                    str(result_dir),
+                    bbox=bbox,
+                    fitz_preprocess=fitz_preprocess,
+                    on_cell=on_cell,
+                    in_memory=True
                 )
-                response.total_pages = 1
+            response.total_pages = len(results)
             
             # Step 4: Parse results
             logger.info(f"[{task_id}] Parsing results...")
-            
-            # Combine markdown content
-            markdown_parts = []
-            all_layout_elements = []
-            
-            for result in results:
-                # Read markdown
-                if 'md_content_path' in result and os.path.exists(result['md_content_path']):
-                    with open(result['md_content_path'], 'r', encoding='utf-8') as f:
-                        markdown_parts.append(f.read())
-                
-                # Read layout elements
-                if 'layout_info_path' in result and os.path.exists(result['layout_info_path']):
-                    with open(result['layout_info_path'], 'r', encoding='utf-8') as f:
-                        layout_data = json.load(f)
-                        for elem in layout_data:
-                            all_layout_elements.append(
-                                LayoutElement(
-                                    bbox=elem.get('bbox', []),
-                                    category=elem.get('category', ''),
-                                    text=elem.get('text')
-                                )
-                            )
-            
-            response.markdown_content = "\n\n---\n\n".join(markdown_parts)
-            response.layout_elements = all_layout_elements
-            
-            # Set file URLs (relative to result directory)
-            if results:
-                first_result = results[0]
-                if 'layout_image_path' in first_result:
-                    response.layout_image_url = f"/results/{task_id}/{os.path.basename(first_result['layout_image_path'])}"
-                if 'layout_info_path' in first_result:
-                    response.json_url = f"/results/{task_id}/{os.path.basename(first_result['layout_info_path'])}"
-                if 'md_content_path' in first_result:
-                    response.markdown_url = f"/results/{task_id}/{os.path.basename(first_result['md_content_path'])}"
+            self.collect_results(response, results, result_dir, process_path, file_type)
             
             # Step 5: Finalize response
             processing_time = time.time() - start_time
@@ -221,5 +269,210 @@ class OCRService:
         
         return response
 
+    def prepare_document(self, task_id: str, file_path: str, original_filename: str, result_dir: Path):
+        """
+        Detect the file type and convert DOC/DOCX to PDF
+        
+        Returns:
+            (path of the file to parse, FileType of that file)
+        """
+        logger.info(f"[{task_id}] Detecting file type: {original_filename}")
+        file_type, ext = self.detector.detect(file_path)
+        
+        process_path = file_path
+        if file_type in [FileType.DOC, FileType.DOCX]:
+            logger.info(f"[{task_id}] Converting DOCX to PDF...")
+            process_path = self.converter.docx_to_pdf(
+                file_path, 
+                output_path=str(result_dir / f"{Path(original_filename).stem}.pdf")
+            )
+            file_type = FileType.PDF
+        return process_path, file_type
+    
+    def estimate_document(
+        self,
+        file_path: str,
+        original_filename: str,
+        pages: Optional[str] = None,
+        parse_method: str = "ocr",
+        fitz_preprocess: bool = True
+    ) -> Tuple[FileType, List[Dict[str, Any]]]:
+        """
+        Per-page model input size and visual tokens of a document, without rendering or inference
+        
+        DOC/DOCX are converted to PDF in a temporary directory to know their pages.
+        
+        Returns:
+            (FileType of the uploaded file, list of page estimates, see `estimate_pages`)
+        """
+        file_type, _ = self.detector.detect(file_path)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            process_path, process_type = self.prepare_document("estimate", file_path, original_filename, Path(temp_dir))
+            estimates = estimate_pages(
+                process_path,
+                dpi=settings.DPI,
+                min_pixels=settings.MIN_PIXELS,
+                max_pixels=settings.MAX_PIXELS,
+                pages=pages if process_type == FileType.PDF else None,
+                parse_method=parse_method,
+                fitz_preprocess=fitz_preprocess
+            )
+        return file_type, estimates
+    
+    def collect_results(
+        self,
+        response: ProcessResponse,
+        results: List[Dict[str, Any]],
+        result_dir: Path,
+        process_path: str,
+        file_type: FileType
+    ):
+        """Fill the markdown, layout elements and result URLs of a response from the page results"""
+        task_id = response.task_id
+        # Combine markdown content
+        markdown_parts = []
+        all_layout_elements = []
+
+        for result in results:
+            # Read markdown (kept in the result by the 'memory' output profile)
+            if 'md_content' in result:
+                markdown_parts.append(result['md_content'])
+            elif 'md_content_path' in result and os.path.exists(result['md_content_path']):
+                with open(result['md_content_path'], 'r', encoding='utf-8') as f:
+                    markdown_parts.append(f.read())
+
+            # Read layout elements
+            layout_data = None
+            if 'layout_info' in result:
+                layout_data = result['layout_info']
+            elif 'layout_info_path' in result and os.path.exists(result['layout_info_path']):
+                with open(result['layout_info_path'], 'r', encoding='utf-8') as f:
+                    layout_data = json.load(f)
+            if isinstance(layout_data, list):  # a raw string when the model output could not be parsed
+                for elem in layout_data:
+                    all_layout_elements.append(
+                        LayoutElement(
+                            bbox=elem.get('bbox', []),
+                            category=elem.get('category', ''),
+                            text=elem.get('text')
+                        )
+                    )
+
+        # picture links are relative to the md files, make them URLs of the served results
+        response.markdown_content = re.sub(
+            r"!\[\]\(images/",
+            f"![](/results/{task_id}/images/",
+            "\n\n---\n\n".join(markdown_parts)
+        )
+        response.page_numbers = [result['page_no'] + 1 for result in results]
+        response.layout_elements = all_layout_elements
+
+        # Source of the task, lets /results/{task_id}/overlay render layout images on demand
+        if any('layout_info_path' in result for result in results):
+            self._write_task_manifest(result_dir, process_path, file_type, results)
+
+        # Set file URLs (relative to result directory)
+        if results:
+            first_result = results[0]
+            if 'layout_image_path' in first_result:
+                response.layout_image_url = f"/results/{task_id}/{os.path.basename(first_result['layout_image_path'])}"
+            elif 'layout_info_path' in first_result:
+                response.layout_image_url = f"/api/v1/results/{task_id}/overlay?page={first_result['page_no'] + 1}"
+            if 'layout_info_path' in first_result:
+                response.json_url = f"/results/{task_id}/{os.path.basename(first_result['layout_info_path'])}"
+            if 'md_content_path' in first_result:
+                response.markdown_url = f"/results/{task_id}/{os.path.basename(first_result['md_content_path'])}"
+
+    def discard_upload(self, file_path: str, task_id: Optional[str] = None):
+        """
+        Remove an upload once its task is finished
+        
+        When the overlay manifest of the task renders from the upload, the file is moved next to
+        the results instead, so UPLOAD_DIR only holds the documents being processed.
+        """
+        upload_path = Path(file_path)
+        manifest_path = settings.RESULTS_DIR / task_id / "task.json" if task_id else None
+        try:
+            if manifest_path is not None and manifest_path.exists():
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest["source_path"] == os.path.abspath(file_path):
+                    source_path = manifest_path.parent / f"source{upload_path.suffix.lower()}"
+                    shutil.move(str(upload_path), source_path)
+                    manifest["source_path"] = str(source_path.resolve())
+                    with open(manifest_path, 'w', encoding='utf-8') as f:
+                        json.dump(manifest, f, ensure_ascii=False)
+                    return
+            upload_path.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Could not remove upload {upload_path.name}: {e}")
+    
+    @staticmethod
+    def _write_task_manifest(result_dir: Path, source_path: str, file_type: FileType, results: List[Dict[str, Any]]):
+        manifest = {
+            "source_path": os.path.abspath(source_path),
+            "file_type": file_type.value,
+            "dpi": settings.DPI,
+            "pages": {
+                str(result['page_no']): result['layout_info_path']
+                for result in results if 'layout_info_path' in result
+            },
+        }
+        with open(result_dir / "task.json", 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+    
+    def render_overlay(self, task_id: str, page_number: int = 1, max_size: Optional[int] = None) -> Path:
+        """
+        Render the layout overlay of a processed page from its stored json, on demand
+        
+        Rendered images are cached next to the results as overlays/page_{n}_{max_size}.jpg,
+        later requests for the same page and size are served from there.
+        
+        Args:
+            task_id: Task ID of a processed file
+            page_number: 1-based page number
+            max_size: Longest side of the returned image
+            
+        Returns:
+            Path of the jpg overlay
+            
+        Raises:
+            FileNotFoundError: Unknown task / page, or the layout json was not stored
+        """
+        max_size = max_size or settings.OVERLAY_MAX_SIZE
+        result_dir = settings.RESULTS_DIR / task_id
+        overlay_path = result_dir / "overlays" / f"page_{page_number}_{max_size}.jpg"
+        if overlay_path.exists():
+            return overlay_path
+        
+        manifest_path = result_dir / "task.json"
+        if not manifest_path.exists():
+            raise FileNotFoundError(f"Task not found: {task_id}")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        layout_path = manifest["pages"].get(str(page_number - 1))
+        if layout_path is None or not os.path.exists(layout_path):
+            raise FileNotFoundError(f"No stored layout for page {page_number} of task {task_id}")
+        with open(layout_path, 'r', encoding='utf-8') as f:
+            cells = json.load(f)
+        
+        # cells are in the coordinates of the page image the parser saw
+        if manifest["file_type"] == FileType.PDF.value:
+            import fitz
+            with fitz.open(manifest["source_path"]) as doc:
+                image, _ = render_pdf_page(doc[page_number - 1], dpi=manifest["dpi"])
+        else:
+            image = fetch_image(manifest["source_path"])
+        
+        if isinstance(cells, list):  # a raw string when the model output could not be parsed
+            image = draw_layout_on_image(image, cells)
+        image.thumbnail((max_size, max_size))
+        
+        overlay_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = overlay_path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        image.save(tmp_path, format="JPEG", quality=90)
+        os.replace(tmp_path, overlay_path)
+        return overlay_path
+
 # Global service instance
 ocr_service = OCRService()
@@ -0,0 +1,405 @@
+"""
+Task queue backends of the asynchronous job API
+
+A backend holds the queue of jobs pulled by the workers and the state of every task
+(status, page results). All of them are safe to use from several threads:
+- MemoryQueue: in-process, the API and its embedded workers only
+- SQLiteQueue: a database file, shared by the processes of one host
+- RedisQueue: a Redis server, shared by API pods and worker pods (requires `redis`)
+
+Tasks are dropped `ttl` seconds after their last update. The shared backends lease jobs:
+a job taken by a worker is handed out again once its lease runs out, unless the worker
+acknowledges it or keeps extending the lease (heartbeats) while it runs.
+"""
+import json
+import time
+import queue
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Any, Optional, List
+
+
+class QueueBackend(ABC):
+    """Job queue and task state store"""
+
+    # whether jobs of dead workers are handed out again, see `extend_lease`
+    leases = False
+    lease_timeout: Optional[float] = None
+
+    @abstractmethod
+    def put_job(self, job: Dict[str, Any]):
+        """Append a job to the queue"""
+
+    @abstractmethod
+    def get_job(self, timeout: float = 1.0) -> Optional[Dict[str, Any]]:
+        """
+        Take the next job, None if none arrived within timeout seconds. With leases the job carries
+        `attempts` (deliveries so far) and is handed out again if not acknowledged in time.
+        """
+
+    def ack_job(self, job: Dict[str, Any]):
+        """The job is done, it will not be handed out again"""
+
+    def extend_lease(self, job: Dict[str, Any]):
+        """Heartbeat of a running job, its lease restarts for `lease_timeout` seconds"""
+
+    @abstractmethod
+    def create_task(self, task_id: str, fields: Dict[str, Any]):
+        """Store a new task"""
+
+    @abstractmethod
+    def update_task(self, task_id: str, **fields):
+        """Set fields of a task"""
+
+    @abstractmethod
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Task fields plus `finished_pages`, None for an unknown task"""
+
+    @abstractmethod
+    def add_page_result(self, task_id: str, page_no: int, result: Dict[str, Any]) -> int:
+        """Store the result of a page, returns the number of finished pages of the task"""
+
+    @abstractmethod
+    def get_page_results(self, task_id: str) -> List[Dict[str, Any]]:
+        """Page results of a task, in page order"""
+
+    @abstractmethod
+    def delete_page_results(self, task_id: str):
+        """Drop the page results of a finished task, `finished_pages` keeps a stored value"""
+
+
+class MemoryQueue(QueueBackend):
+    """In-process backend, tasks are lost on restart. Jobs are not leased, workers die with the process"""
+
+    def __init__(self, ttl: Optional[int] = None):
+        self.ttl = ttl
+        self._jobs = queue.Queue()
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._pages: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._updated: Dict[str, float] = {}
+
+    def _touch(self, task_id):
+        self._updated[task_id] = time.monotonic()
+
+    def _purge_expired(self):
+        if not self.ttl:
+            return
+        deadline = time.monotonic() - self.ttl
+        for task_id in [task_id for task_id, updated in self._updated.items() if updated < deadline]:
+            del self._tasks[task_id], self._pages[task_id], self._updated[task_id]
+
+    def put_job(self, job):
+        self._jobs.put(job)
+
+    def get_job(self, timeout=1.0):
+        try:
+            return self._jobs.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def create_task(self, task_id, fields):
+        with self._lock:
+            self._purge_expired()
+            self._tasks[task_id] = dict(fields)
+            self._pages[task_id] = {}
+            self._touch(task_id)
+
+    def update_task(self, task_id, **fields):
+        with self._lock:
+            self._tasks[task_id].update(fields)
+            self._touch(task_id)
+
+    def get_task(self, task_id):
+        with self._lock:
+            if task_id not in self._tasks:
+                return None
+            return {"finished_pages": len(self._pages[task_id]), **self._tasks[task_id]}
+
+    def add_page_result(self, task_id, page_no, result):
+        with self._lock:
+            pages = self._pages[task_id]
+            pages[page_no] = result
+            self._touch(task_id)
+            return len(pages)
+
+    def get_page_results(self, task_id):
+        with self._lock:
+            pages = self._pages.get(task_id, {})
+            return [pages[page_no] for page_no in sorted(pages)]
+
+    def delete_page_results(self, task_id):
+        with self._lock:
+            if task_id in self._pages:
+                self._pages[task_id] = {}
+
+
+class SQLiteQueue(QueueBackend):
+    """
+    Backend on a SQLite database file (WAL mode), every process opening the same file
+    shares the queue. Workers poll the jobs table, a job stays in it until acknowledged.
+    """
+
+    leases = True
+
+    def __init__(self, path, poll_interval: float = 0.2, ttl: Optional[int] = None, lease_timeout: float = 120):
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+        self.lease_timeout = lease_timeout
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS tasks (task_id TEXT PRIMARY KEY, fields TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pages (task_id TEXT NOT NULL, page_no INTEGER NOT NULL, "
+                "result TEXT NOT NULL, PRIMARY KEY (task_id, page_no))"
+            )
+            # columns added after the first release, existing queue files are migrated
+            self._add_column(conn, "jobs", "leased_until", "REAL")
+            self._add_column(conn, "jobs", "attempts", "INTEGER NOT NULL DEFAULT 0")
+            self._add_column(conn, "tasks", "updated_at", "REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_updated_at ON tasks (updated_at)")
+            conn.execute("UPDATE tasks SET updated_at = ? WHERE updated_at IS NULL", (time.time(),))
+
+    @staticmethod
+    def _add_column(conn, table, column, declaration):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite connections are not shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connection()
+
+        class _Transaction:
+            def __enter__(self):
+                # take the write lock up front, read-then-write transactions never deadlock
+                conn.execute("BEGIN IMMEDIATE")
+                return conn
+
+            def __exit__(self, exc_type, exc, tb):
+                conn.execute("ROLLBACK" if exc_type else "COMMIT")
+
+        return _Transaction()
+
+    def put_job(self, job):
+        with self._transaction() as conn:
+            conn.execute("INSERT INTO jobs (job) VALUES (?)", (json.dumps(job),))
+
+    def get_job(self, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._transaction() as conn:
+                # new jobs and jobs whose worker stopped sending heartbeats
+                now = time.time()
+                row = conn.execute(
+                    "SELECT id, job, attempts FROM jobs WHERE leased_until IS NULL OR leased_until < ? "
+                    "ORDER BY id LIMIT 1", (now,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET leased_until = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now + self.lease_timeout, row[0])
+                    )
+                    return dict(json.loads(row[1]), attempts=row[2] + 1, _receipt=row[0])
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.poll_interval)
+
+    def ack_job(self, job):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job["_receipt"],))
+
+    def extend_lease(self, job):
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET leased_until = ? WHERE id = ?", (time.time() + self.lease_timeout, job["_receipt"]))
+
+    def create_task(self, task_id, fields):
+        with self._transaction() as conn:
+            if self.ttl:
+                expired = "SELECT task_id FROM tasks WHERE updated_at < ?"
+                conn.execute(f"DELETE FROM pages WHERE task_id IN ({expired})", (time.time() - self.ttl,))
+                conn.execute("DELETE FROM tasks WHERE updated_at < ?", (time.time() - self.ttl,))
+            conn.execute(
+                "INSERT OR REPLACE INTO tasks (task_id, fields, updated_at) VALUES (?, ?, ?)",
+                (task_id, json.dumps(fields), time.time())
+            )
+            conn.execute("DELETE FROM pages WHERE task_id = ?", (task_id,))
+
+    def update_task(self, task_id, **fields):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT fields FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                raise KeyError(task_id)
+            stored = json.loads(row[0])
+            stored.update(fields)
+            conn.execute(
+                "UPDATE tasks SET fields = ?, updated_at = ? WHERE task_id = ?",
+                (json.dumps(stored), time.time(), task_id)
+            )
+
+    def get_task(self, task_id):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT fields, (SELECT COUNT(*) FROM pages WHERE task_id = ?) FROM tasks WHERE task_id = ?",
+            (task_id, task_id)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"finished_pages": row[1], **json.loads(row[0])}
+
+    def add_page_result(self, task_id, page_no, result):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO pages (task_id, page_no, result) VALUES (?, ?, ?)",
+                (task_id, page_no, json.dumps(result, ensure_ascii=False))
+            )
+            conn.execute("UPDATE tasks SET updated_at = ? WHERE task_id = ?", (time.time(), task_id))
+            return conn.execute("SELECT COUNT(*) FROM pages WHERE task_id = ?", (task_id,)).fetchone()[0]
+
+    def get_page_results(self, task_id):
+        rows = self._connection().execute(
+            "SELECT result FROM pages WHERE task_id = ? ORDER BY page_no", (task_id,)
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete_page_results(self, task_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM pages WHERE task_id = ?", (task_id,))
+
+
+class RedisQueue(QueueBackend):
+    """
+    Backend on a Redis server: a list of jobs, one hash per task and one hash of page results
+    per task. Task keys expire after `ttl` seconds if set. A taken job moves to a processing
+    list (BLMOVE) with its lease deadline in a hash, expired ones are moved back to the jobs.
+    """
+
+    leases = True
+
+    def __init__(self, url: str, prefix: str = "dotsocr", ttl: Optional[int] = None, lease_timeout: float = 120):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("QUEUE_BACKEND=redis requires the redis package: pip install redis")
+        self._redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.lease_timeout = lease_timeout
+        self._next_requeue = 0.0
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def _expire(self, pipe, task_id):
+        if self.ttl:
+            pipe.expire(self._key("task", task_id), self.ttl)
+            pipe.expire(self._key("pages", task_id), self.ttl)
+
+    def put_job(self, job):
+        self._redis.rpush(self._key("jobs"), json.dumps(job))
+
+    def get_job(self, timeout=1.0):
+        self._requeue_expired()
+        # blocking timeouts are whole seconds, 0 would block forever
+        item = self._redis.blmove(
+            self._key("jobs"), self._key("processing"), max(1, int(round(timeout))), "LEFT", "RIGHT"
+        )
+        if item is None:
+            return None
+        self._redis.hset(self._key("leases"), item, time.time() + self.lease_timeout)
+        job = json.loads(item)
+        return dict(job, attempts=job.get("attempts", 1), _receipt=item.decode())
+
+    def ack_job(self, job):
+        pipe = self._redis.pipeline()
+        pipe.lrem(self._key("processing"), 1, job["_receipt"])
+        pipe.hdel(self._key("leases"), job["_receipt"])
+        pipe.execute()
+
+    def extend_lease(self, job):
+        self._redis.hset(self._key("leases"), job["_receipt"], time.time() + self.lease_timeout)
+
+    def _requeue_expired(self):
+        """Move the jobs of workers that stopped sending heartbeats back to the front of the queue"""
+        now = time.time()
+        if now < self._next_requeue:
+            return
+        self._next_requeue = now + self.lease_timeout / 3
+        for item in self._redis.lrange(self._key("processing"), 0, -1):
+            # a worker died between BLMOVE and setting the lease: give it one lease from now
+            self._redis.hsetnx(self._key("leases"), item, now + self.lease_timeout)
+            deadline = float(self._redis.hget(self._key("leases"), item) or 0)
+            # LREM succeeds for one of concurrent requeuers only
+            if deadline < now and self._redis.lrem(self._key("processing"), 1, item):
+                job = json.loads(item)
+                job["attempts"] = job.get("attempts", 1) + 1
+                pipe = self._redis.pipeline()
+                pipe.hdel(self._key("leases"), item)
+                pipe.lpush(self._key("jobs"), json.dumps(job))
+                pipe.execute()
+
+    def create_task(self, task_id, fields):
+        pipe = self._redis.pipeline()
+        pipe.delete(self._key("task", task_id), self._key("pages", task_id))
+        pipe.hset(self._key("task", task_id), mapping={k: json.dumps(v) for k, v in fields.items()})
+        self._expire(pipe, task_id)
+        pipe.execute()
+
+    def update_task(self, task_id, **fields):
+        pipe = self._redis.pipeline()
+        pipe.hset(self._key("task", task_id), mapping={k: json.dumps(v) for k, v in fields.items()})
+        self._expire(pipe, task_id)
+        pipe.execute()
+
+    def get_task(self, task_id):
+        pipe = self._redis.pipeline()
+        pipe.hgetall(self._key("task", task_id))
+        pipe.hlen(self._key("pages", task_id))
+        fields, finished = pipe.execute()
+        if not fields:
+            return None
+        task = {k.decode(): json.loads(v) for k, v in fields.items()}
+        task.setdefault("finished_pages", finished)
+        return task
+
+    def add_page_result(self, task_id, page_no, result):
+        pipe = self._redis.pipeline()  # MULTI/EXEC, the count includes this page
+        pipe.hset(self._key("pages", task_id), str(page_no), json.dumps(result, ensure_ascii=False))
+        pipe.hlen(self._key("pages", task_id))
+        self._expire(pipe, task_id)
+        return pipe.execute()[1]
+
+    def get_page_results(self, task_id):
+        pages = self._redis.hgetall(self._key("pages", task_id))
+        return [json.loads(pages[page_no]) for page_no in sorted(pages, key=int)]
+
+    def delete_page_results(self, task_id):
+        self._redis.delete(self._key("pages", task_id))
+
+
+def make_queue_backend(settings) -> QueueBackend:
+    """Backend selected by QUEUE_BACKEND (USE_REDIS=true selects redis)"""
+    backend = "redis" if settings.USE_REDIS else settings.QUEUE_BACKEND
+    if backend == "memory":
+        return MemoryQueue(ttl=settings.QUEUE_TASK_TTL)
+    if backend == "sqlite":
+        return SQLiteQueue(
+            settings.QUEUE_SQLITE_PATH, ttl=settings.QUEUE_TASK_TTL, lease_timeout=settings.QUEUE_LEASE_TIMEOUT
+        )
+    if backend == "redis":
+        return RedisQueue(settings.REDIS_URL, ttl=settings.QUEUE_TASK_TTL, lease_timeout=settings.QUEUE_LEASE_TIMEOUT)
+    raise ValueError(f"Unknown QUEUE_BACKEND: {backend} (memory, sqlite, redis)")
@@ -0,0 +1,243 @@
+import os
+import glob
+import json
+import time
+import functools
+import traceback
+from tqdm import tqdm
+
+from dots_ocr.utils.consts import image_extensions
+from dots_ocr.utils.image_utils import fetch_image
+from dots_ocr.utils.doc_utils import iter_pdf_pages, get_pdf_page_count, select_pages
+from dots_ocr.utils.estimate import result_visual_tokens
+from dots_ocr.utils.pipeline_utils import prefetch_iter, imap_unordered_bounded
+
+
+manifest_extensions = {'.txt', '.lst'}
+
+
+def collect_input_files(input_spec):
+    """Expand a batch input into a list of pdf/image files.
+
+    Args:
+        input_spec: a directory (searched recursively), a glob pattern such as "docs/**/*.pdf",
+            a manifest (.txt/.lst, one path per line, relative to the manifest, '#' comments)
+            or a single file.
+
+    Returns:
+        list: file paths, in a stable order
+    """
+    supported = image_extensions | {'.pdf'}
+    if os.path.isdir(input_spec):
+        paths = []
+        for root, _, files in os.walk(input_spec):
+            paths += [os.path.join(root, name) for name in files]
+        paths = sorted(paths)
+    elif glob.has_magic(input_spec):
+        paths = sorted(glob.glob(input_spec, recursive=True))
+    elif os.path.splitext(input_spec)[1].lower() in manifest_extensions:
+        base_dir = os.path.dirname(os.path.abspath(input_spec))
+        paths = []
+        with open(input_spec, 'r', encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+        return paths
+    else:
+        return [input_spec]
+    return [path for path in paths if os.path.splitext(path)[1].lower() in supported]
+
+
+def is_batch_input(input_spec):
+    return (
+        os.path.isdir(input_spec)
+        or glob.has_magic(input_spec)
+        or os.path.splitext(input_spec)[1].lower() in manifest_extensions
+    )
+
+
+def output_keys(input_files):
+    """Unique output path (without extension) of every input file, relative to the output dir.
+
+    Files keep their path relative to the deepest directory holding all of them, so inputs with the
+    same name in different subdirectories do not overwrite each other ('a/x.pdf' -> 'a/x').
+    Names still clashing ('x.pdf' and 'x.png') keep their extension ('x_png').
+    """
+    if not input_files:
+        return []
+    dirs = [os.path.dirname(os.path.abspath(path)) for path in input_files]
+    root = os.path.commonpath(dirs)
+    keys, used = [], set()
+    for path in input_files:
+        rel_path = os.path.relpath(os.path.abspath(path), root)
+        key, ext = os.path.splitext(rel_path)
+        if key in used:
+            key = f"{key}_{ext.lstrip('.')}"
+        used.add(key)
+        keys.append(key)
+    return keys
+
+
+class _FileState:
+    def __init__(self, input_path, output_dir, key=None):
+        self.input_path = input_path
+        self.filename, self.file_ext = os.path.splitext(os.path.basename(input_path))
+        key = key or self.filename
+        self.save_dir = os.path.join(output_dir, key)
+        self.jsonl_path = os.path.join(output_dir, key + '.jsonl')
+        self.expected = None  # number of pages, known once the file is opened
+        self.queued = 0
+        self.results = []
+        self.failed_pages = 0
+        self.errors = []
+        self.finished = False
+
+    def is_complete(self):
+        return self.expected is not None and len(self.results) + self.failed_pages >= self.expected
+
+
+class BatchParser:
+    """
+    parse many files with one global page queue
+
+    Pages of all files are flattened into a single work queue served by `num_thread` workers,
+    so small files do not leave the backend idle and big files do not hog it. Each file's
+    results are written as soon as its last page is done.
+    """
+
+    def __init__(self, parser, num_thread=None):
+        self.parser = parser
+        if parser.use_hf:
+            num_thread = parser.hf_batch_size
+        self.num_thread = num_thread or parser.num_thread
+
+    def _iter_page_tasks(self, files, prompt_mode, fitz_preprocess, pages, parse_method):
+        for state in files:
+            try:
+                if self.parser.output_profile != 'memory':
+                    os.makedirs(state.save_dir, exist_ok=True)
+                if state.file_ext.lower() == '.pdf':
+                    page_count = get_pdf_page_count(state.input_path)
+                    page_ids = select_pages(pages, page_count) if pages else list(range(page_count))
+                    state.expected = len(page_ids)
+                    page_source = iter_pdf_pages(
+                        state.input_path, dpi=self.parser.dpi, num_workers=self.parser.num_render_workers,
+                        page_ids=page_ids, parse_method=parse_method,
+                    )
+                    for page_idx, image, native_cells in page_source:
+                        state.queued += 1
+                        yield state, {
+                            "origin_image": image,
+                            "prompt_mode": prompt_mode,
+                            "save_dir": state.save_dir,
+                            "save_name": state.filename,
+                            "source": "pdf",
+                            "page_idx": page_idx,
+                            "native_cells": native_cells,
+                        }
+                elif state.file_ext.lower() in image_extensions:
+                    state.expected = 1
+                    origin_image = fetch_image(state.input_path)
+                    state.queued += 1
+                    yield state, {
+                        "origin_image": origin_image,
+                        "prompt_mode": prompt_mode,
+                        "save_dir": state.save_dir,
+                        "save_name": state.filename,
+                        "source": "image",
+                        "fitz_preprocess": fitz_preprocess,
+                    }
+                else:
+                    raise ValueError(f"file extension {state.file_ext} not supported, supported extensions are {image_extensions} and pdf")
+            except Exception as e:
+                # the file could not be opened / rendered, it is done once its queued pages are
+                state.errors.append(f"{type(e).__name__}: {e}")
+                state.expected = state.queued
+                yield state, None
+
+    def _finish_file(self, state):
+        state.finished = True
+        state.results.sort(key=lambda x: x["page_no"])
+        os.makedirs(os.path.dirname(state.jsonl_path), exist_ok=True)
+        with open(state.jsonl_path, 'w', encoding="utf-8") as w:
+            for result in state.results:
+                w.write(json.dumps(result, ensure_ascii=False) + '\n')
+
+    def parse_files(self, input_files, output_dir="", prompt_mode="prompt_layout_all_en",
+                    fitz_preprocess=False, pages=None, parse_method='ocr', on_cell=None):
+        """
+        on_cell: callable(input_path, page_no, cell) receiving every layout cell as soon as it is generated.
+
+        Returns:
+            dict: {'files', 'pages', 'failed_pages', 'visual_tokens', 'elapsed', 'pages_per_second',
+                   'failures': {path: [errors]}}
+        """
+        output_dir = os.path.abspath(output_dir or self.parser.output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+        files = [_FileState(path, output_dir, key) for path, key in zip(input_files, output_keys(input_files))]
+
+        def _execute_task(item):
+            state, task_args = item
+            if task_args is None:
+                return state, None, None
+            try:
+                if on_cell is not None:
+                    task_args = dict(task_args, on_cell=functools.partial(on_cell, state.input_path))
+                result = self.parser._parse_single_image(**task_args)
+                result['file_path'] = state.input_path
+                return state, result, None
+            except Exception as e:
+                traceback.print_exc()
+                return state, None, f"page {task_args.get('page_idx', 0)}: {type(e).__name__}: {e}"
+
+        tasks = prefetch_iter(
+            self._iter_page_tasks(files, prompt_mode, fitz_preprocess, pages, parse_method),
+            window=self.parser.prefetch_pages,
+        )
+        print(f"Parsing {len(files)} files using {self.num_thread} threads...")
+
+        start = time.time()
+        num_pages, num_failed, num_tokens = 0, 0, 0
+        with tqdm(desc="Processing pages", unit="page") as pbar:
+            for state, result, error in imap_unordered_bounded(_execute_task, tasks, self.num_thread):
+                if result is not None:
+                    state.results.append(result)
+                    num_pages += 1
+                    num_tokens += result_visual_tokens([result])
+                    pbar.update(1)
+                elif error is not None:
+                    state.errors.append(error)
+                    state.failed_pages += 1
+                    num_failed += 1
+                    pbar.update(1)
+                if not state.finished and state.is_complete():
+                    self._finish_file(state)
+        for state in files:
+            if not state.finished:
+                self._finish_file(state)
+
+        elapsed = time.time() - start
+        summary = {
+            'files': len(files),
+            'pages': num_pages,
+            'failed_pages': num_failed,
+            'visual_tokens': num_tokens,
+            'elapsed': elapsed,
+            'pages_per_second': num_pages / elapsed if elapsed > 0 else 0.0,
+            'failures': {state.input_path: state.errors for state in files if state.errors},
+        }
+        return summary
+
+
+def print_batch_summary(summary):
+    print(
+        f"Parsed {summary['pages']} pages of {summary['files']} files in {summary['elapsed']:.1f}s "
+        f"({summary['pages_per_second']:.2f} pages/s), {summary['failed_pages']} pages failed"
+    )
+    if summary['failures']:
+        print(f"{len(summary['failures'])} files with failures:")
+        for path, errors in summary['failures'].items():
+            print(f"  {path}")
+            for error in errors:
+                print(f"    - {error}")
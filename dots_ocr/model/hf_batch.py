@@ -0,0 +1,104 @@
+import threading
+import time
+
+
+class _Request:
+    def __init__(self, image, prompt):
+        self.image = image
+        self.prompt = prompt
+        # pages of the same input size have the same number of visual tokens, batching them
+        # together keeps padding to the prompt text only
+        self.key = image.size
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class HFBatcher:
+    """
+    dynamic batcher for the HuggingFace backend
+
+    Page threads call `submit` concurrently, a single worker thread owns the model: it collects up
+    to `batch_size` pending pages of the same image size, waiting at most `max_wait` seconds for a
+    batch to fill, runs `generate_fn` on them at once and hands every page its own output.
+
+    Args:
+        generate_fn: callable(images, prompts) -> list of responses, in the same order.
+        batch_size (int): maximum number of pages generated together.
+        max_wait (float): seconds the worker waits for more compatible pages before running a partial batch.
+    """
+
+    def __init__(self, generate_fn, batch_size=4, max_wait=0.05):
+        self.generate_fn = generate_fn
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._worker = None
+        self.batches = 0  # number of generate_fn calls, for stats
+        self.pages = 0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name="hf-batcher", daemon=True)
+            self._worker.start()
+
+    def submit(self, image, prompt):
+        """Blocks until the page has been generated, returns its response."""
+        request = _Request(image, prompt)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("HFBatcher is closed")
+            self._ensure_worker()
+            self._pending.append(request)
+            self._cond.notify_all()
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.response
+
+    def _take_batch(self):
+        # called with the lock held and at least one pending request; the oldest page decides
+        # the image size of the batch so no page waits behind others forever
+        key = self._pending[0].key
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            compatible = [request for request in self._pending if request.key == key]
+            remaining = deadline - time.monotonic()
+            if len(compatible) >= self.batch_size or remaining <= 0 or self._closed:
+                break
+            self._cond.wait(remaining)
+        batch = compatible[:self.batch_size]
+        self._pending = [request for request in self._pending if request not in batch]
+        return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch = self._take_batch()
+
+            try:
+                responses = self.generate_fn([r.image for r in batch], [r.prompt for r in batch])
+                assert len(responses) == len(batch), "generate_fn returned a wrong number of responses"
+                for request, response in zip(batch, responses):
+                    request.response = response
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.batches += 1
+            self.pages += len(batch)
+            for request in batch:
+                request.done.set()
+
+    def close(self):
+        """Finishes the pending pages and stops the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._worker is not None:
+            self._worker.join()
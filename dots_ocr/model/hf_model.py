@@ -0,0 +1,144 @@
+import os
+import contextlib
+
+
+# presets of the HuggingFace backend, explicit arguments override them
+hf_profiles = {
+    # flash attention and bf16 weights on a CUDA device
+    'gpu': {'device': 'cuda', 'attn_implementation': 'flash_attention_2', 'dtype': 'bfloat16'},
+    # SDPA attention, fp32 weights with bf16 autocast where the cpu has bf16 instructions,
+    # one intra-op thread per available cpu
+    'cpu': {'device': 'cpu', 'attn_implementation': 'sdpa', 'dtype': 'float32', 'autocast_dtype': 'auto'},
+}
+
+
+def resolve_device(device='auto'):
+    import torch
+    if device in (None, 'auto'):
+        if torch.cuda.is_available():
+            return 'cuda'
+        if getattr(torch.backends, 'mps', None) is not None and torch.backends.mps.is_available():
+            return 'mps'
+        return 'cpu'
+    return device
+
+
+def resolve_dtype(dtype='auto', device='cpu'):
+    """torch dtype of a name, 'auto' is bfloat16 on CUDA and float32 elsewhere."""
+    import torch
+    if dtype in (None, 'auto'):
+        return torch.bfloat16 if device.startswith('cuda') else torch.float32
+    if isinstance(dtype, torch.dtype):
+        return dtype
+    return getattr(torch, dtype)
+
+
+def resolve_attn_implementation(attn_implementation=None, device='cpu'):
+    """flash_attention_2 on CUDA when flash-attn is installed, sdpa otherwise."""
+    if attn_implementation:
+        return attn_implementation
+    if device.startswith('cuda'):
+        try:
+            import flash_attn  # noqa: F401
+            return 'flash_attention_2'
+        except ImportError:
+            pass
+    return 'sdpa'
+
+
+def load_hf_model(
+        model_path="./weights/DotsOCR",
+        device='auto',
+        attn_implementation=None,
+        dtype='auto',
+        num_threads=None,
+        quantize=False,
+        ):
+    """
+    Load the model and processor of the HuggingFace backend.
+
+    Args:
+        device: 'auto', 'cuda', 'cuda:1', 'mps' or 'cpu'. 'auto' shards over the visible GPUs
+            like `device_map="auto"`, or falls back to the CPU.
+        attn_implementation: 'flash_attention_2', 'sdpa' or 'eager', None picks the fastest available.
+        dtype: weight dtype name, 'auto' is bfloat16 on CUDA and float32 elsewhere.
+        num_threads: torch intra-op threads, None keeps the torch default.
+        quantize: dynamic int8 quantization of the language model linear layers, CPU only.
+
+    Returns:
+        tuple: (model, processor, device)
+    """
+    import torch
+    from transformers import AutoModelForCausalLM, AutoProcessor
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    resolved_device = resolve_device(device)
+    torch_dtype = resolve_dtype(dtype, resolved_device)
+    if quantize and resolved_device != 'cpu':
+        raise ValueError("int8 dynamic quantization is only supported on the cpu")
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_path,
+        attn_implementation=resolve_attn_implementation(attn_implementation, resolved_device),
+        torch_dtype=torch.float32 if quantize else torch_dtype,
+        device_map="auto" if device in (None, 'auto') and resolved_device == 'cuda' else resolved_device,
+        trust_remote_code=True
+    )
+    model.eval()
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, _quantizable_linears(model), dtype=torch.qint8)
+
+    processor = AutoProcessor.from_pretrained(model_path, trust_remote_code=True, use_fast=True)
+    # batched generation needs the prompts right-aligned so every row continues from its last token
+    processor.tokenizer.padding_side = "left"
+    return model, processor, resolved_device
+
+
+def _quantizable_linears(model):
+    """
+    qconfig of the linear layers outside the vision encoder. The encoder runs once per page, and
+    reads its dtype from a linear weight (`blocks[0].mlp.fc2.weight.dtype`), a method once quantized
+    """
+    import torch
+    vision = getattr(model, 'vision_tower', None) or getattr(model, 'visual', None)
+    vision_modules = set(vision.modules()) if vision is not None else set()
+    return {
+        name: torch.ao.quantization.default_dynamic_qconfig
+        for name, module in model.named_modules()
+        if isinstance(module, torch.nn.Linear) and module not in vision_modules
+    }
+
+
+def _cpu_supports_bf16():
+    import torch
+    for name in ('_is_avx512_bf16_supported', '_is_amx_tile_supported'):
+        check = getattr(torch.cpu, name, None)
+        if check is not None and check():
+            return True
+    return False
+
+
+def hf_autocast(device, autocast_dtype=None):
+    """
+    autocast context of the generation, a no-op without autocast_dtype.
+    'auto' uses bfloat16 on CUDA and on CPUs with native bf16, emulated bf16 is slower than fp32.
+    """
+    if autocast_dtype == 'auto':
+        if device.startswith('cuda') or (device == 'cpu' and _cpu_supports_bf16()):
+            autocast_dtype = 'bfloat16'
+        else:
+            autocast_dtype = None
+    if not autocast_dtype:
+        return contextlib.nullcontext()
+    import torch
+    device_type = device.split(':')[0]
+    return torch.autocast(device_type=device_type, dtype=resolve_dtype(autocast_dtype, device))
+
+
+def default_cpu_threads():
+    """Physical cores are not exposed by the stdlib, use the cpus this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
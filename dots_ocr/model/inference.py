@@ -1,12 +1,96 @@
 import requests
 from dots_ocr.utils.image_utils import PILimage_to_base64
-from openai import OpenAI
+from dots_ocr.utils.repetition import RepetitionDetector, record_repetition_stop
+from openai import OpenAI, AsyncOpenAI, NOT_GIVEN
+import asyncio
+import weakref
+import threading
+import httpx
 import os
 
 
+# long-lived clients, one per (base_url, api_key): each client owns a keep-alive connection pool,
+# building one per page pays client construction and TCP setup on every request
+_clients = {}
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> {(base_url, api_key): (client, max_connections)}
+_clients_lock = threading.Lock()
+
+
+def _get_api_key(api_key=None):
+    return api_key or "{}".format(os.environ.get("API_KEY", "0"))
+
+
+def get_openai_client(base_url, api_key=None, max_connections=64):
+    """Returns the shared OpenAI client of `base_url`.
+
+    Args:
+        max_connections (int): size of the keep-alive pool, should match the number of concurrent requests.
+            The client is rebuilt with a larger pool if a caller needs more connections. The old one is
+            left to its current users and closed by garbage collection, requests in flight on it complete.
+    """
+    api_key = _get_api_key(api_key)
+    key = (base_url, api_key)
+    with _clients_lock:
+        entry = _clients.get(key)
+        if entry is None or entry[1] < max_connections:
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=httpx.Client(limits=limits),
+            )
+            entry = (client, max_connections)
+            _clients[key] = entry
+    return entry[0]
+
+
+def get_async_openai_client(base_url, api_key=None, max_connections=64):
+    """Async counterpart of `get_openai_client`, one client per event loop.
+
+    Clients of closed loops are dropped on the next call: their connections hold the loop, so the
+    weak keys alone would never let them go.
+    """
+    api_key = _get_api_key(api_key)
+    key = (base_url, api_key)
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        for closed_loop in [other for other in _async_clients if other.is_closed()]:
+            del _async_clients[closed_loop]
+        loop_clients = _async_clients.setdefault(loop, {})
+        entry = loop_clients.get(key)
+        if entry is None or entry[1] < max_connections:
+            limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=httpx.AsyncClient(limits=limits),
+            )
+            entry = (client, max_connections)
+            loop_clients[key] = entry
+    return entry[0]
+
+
+def build_messages(image, prompt, image_encoding=None):
+    """
+    image_encoding: keyword arguments of `PILimage_to_base64` (see `image_utils.get_image_encoding`), PNG by default.
+    """
+    return [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image_url",
+                    "image_url": {"url":  PILimage_to_base64(image, **(image_encoding or {}))},
+                },
+                {"type": "text", "text": f"<|img|><|imgpad|><|endofimg|>{prompt}"}  # if no "<|img|><|imgpad|><|endofimg|>" here,vllm v1 will add "\n" here
+            ],
+        }
+    ]
+
+
 def inference_with_vllm(
         image,
-        prompt, 
+        prompt,
         protocol="http",
         ip="localhost",
         port=8000,
@@ -14,33 +98,103 @@ def inference_with_vllm(
         top_p=0.9,
         max_completion_tokens=32768,
         model_name='rednote-hilab/dots.ocr',
+        timeout=None,
+        max_connections=64,
+        image_encoding=None,
+        repetition_stop=False,
+        on_text=None,
         ):
-    
+    """
+    timeout: request timeout in seconds, None keeps the client default.
+    max_connections: keep-alive pool size of the shared client, usually the parser's num_thread.
+    image_encoding: wire format of the image, see `build_messages`.
+    repetition_stop: stream the response and abort the request once the model loops (see RepetitionDetector),
+        the partial output is returned.
+    on_text: callable(str) receiving the response text as it is generated, streams the response.
+    """
     addr = f"{protocol}://{ip}:{port}/v1"
-    client = OpenAI(api_key="{}".format(os.environ.get("API_KEY", "0")), base_url=addr)
-    messages = []
-    messages.append(
-        {
-            "role": "user",
-            "content": [
-                {
-                    "type": "image_url",
-                    "image_url": {"url":  PILimage_to_base64(image)},
-                },
-                {"type": "text", "text": f"<|img|><|imgpad|><|endofimg|>{prompt}"}  # if no "<|img|><|imgpad|><|endofimg|>" here,vllm v1 will add "\n" here
-            ],
-        }
-    )
+    client = get_openai_client(addr, max_connections=max_connections)
+    messages = build_messages(image, prompt, image_encoding=image_encoding)
     try:
-        response = client.chat.completions.create(
-            messages=messages, 
-            model=model_name, 
+        request_kwargs = dict(
+            messages=messages,
+            model=model_name,
             max_completion_tokens=max_completion_tokens,
             temperature=temperature,
-            top_p=top_p)
-        response = response.choices[0].message.content
-        return response
+            top_p=top_p,
+            timeout=NOT_GIVEN if timeout is None else timeout)
+        if not repetition_stop and on_text is None:
+            response = client.chat.completions.create(**request_kwargs)
+            response = response.choices[0].message.content
+            return response
+
+        detector = RepetitionDetector() if repetition_stop else None
+        parts = []
+        stream = client.chat.completions.create(stream=True, **request_kwargs)
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                parts.append(delta)
+                if on_text is not None:
+                    on_text(delta)
+                if detector is not None and detector.feed(delta):
+                    record_repetition_stop('vllm', detector)
+                    break
+        finally:
+            stream.close()  # dropping the connection aborts the request on the server
+        return "".join(parts)
     except requests.exceptions.RequestException as e:
         print(f"request error: {e}")
         return None
 
+
+async def inference_with_vllm_async(
+        image,
+        prompt,
+        protocol="http",
+        ip="localhost",
+        port=8000,
+        temperature=0.1,
+        top_p=0.9,
+        max_completion_tokens=32768,
+        model_name='rednote-hilab/dots.ocr',
+        timeout=None,
+        max_connections=64,
+        image_encoding=None,
+        repetition_stop=False,
+        on_text=None,
+        ):
+    """`inference_with_vllm` on an AsyncOpenAI client, for callers running an event loop."""
+    addr = f"{protocol}://{ip}:{port}/v1"
+    client = get_async_openai_client(addr, max_connections=max_connections)
+    messages = build_messages(image, prompt, image_encoding=image_encoding)
+    request_kwargs = dict(
+        messages=messages,
+        model=model_name,
+        max_completion_tokens=max_completion_tokens,
+        temperature=temperature,
+        top_p=top_p,
+        timeout=NOT_GIVEN if timeout is None else timeout)
+    if not repetition_stop and on_text is None:
+        response = await client.chat.completions.create(**request_kwargs)
+        return response.choices[0].message.content
+
+    detector = RepetitionDetector() if repetition_stop else None
+    parts = []
+    stream = await client.chat.completions.create(stream=True, **request_kwargs)
+    try:
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if not delta:
+                continue
+            parts.append(delta)
+            if on_text is not None:
+                on_text(delta)
+            if detector is not None and detector.feed(delta):
+                record_repetition_stop('vllm', detector)
+                break
+    finally:
+        await stream.close()  # dropping the connection aborts the request on the server
+    return "".join(parts)
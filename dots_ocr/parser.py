@@ -1,17 +1,39 @@
 import os
+import sys
 import json
+import time
+import logging
+import functools
+import contextlib
+import threading
+from collections import Counter
 from tqdm import tqdm
-from multiprocessing.pool import ThreadPool, Pool
 import argparse
+from io import BytesIO
+from PIL import Image
 
 
 from dots_ocr.model.inference import inference_with_vllm
-from dots_ocr.utils.consts import image_extensions, MIN_PIXELS, MAX_PIXELS
-from dots_ocr.utils.image_utils import get_image_by_fitz_doc, fetch_image, smart_resize
-from dots_ocr.utils.doc_utils import fitz_doc_to_image, load_images_from_pdf
+from dots_ocr.model.hf_batch import HFBatcher
+from dots_ocr.model.hf_model import load_hf_model, hf_autocast, hf_profiles, default_cpu_threads
+from dots_ocr.utils.consts import image_extensions, output_profiles, MIN_PIXELS, MAX_PIXELS
+from dots_ocr.utils.image_utils import get_image_by_fitz_doc, get_image_by_resample, fetch_image, smart_resize, get_image_encoding, image_transport_formats
+from dots_ocr.utils.doc_utils import fitz_doc_to_image, iter_pdf_pages, get_pdf_page_count, select_pages
+from dots_ocr.utils.pipeline_utils import prefetch_iter, imap_unordered_bounded
+from dots_ocr.utils.inference_cache import InferenceCache, make_cache_key
+from dots_ocr.utils.repetition import make_repetition_stopping_criteria, record_repetition_stop
+from dots_ocr.utils.governor import get_governor
+from dots_ocr.utils.estimate import estimate_pages, load_throughput, record_throughput, result_visual_tokens
 from dots_ocr.utils.prompts import dict_promptmode_to_prompt
-from dots_ocr.utils.layout_utils import post_process_output, draw_layout_on_image, pre_process_bboxes
-from dots_ocr.utils.format_transformer import layoutjson2md
+from dots_ocr.utils.layout_utils import post_process_output, post_process_cells, draw_layout_on_image, pre_process_bboxes
+from dots_ocr.utils.cell_stream import CellStreamParser
+from dots_ocr.utils.format_transformer import layoutjson2md, encode_picture_crops, save_picture_crops
+
+logger = logging.getLogger(__name__)
+
+
+def _cell_key(cell):
+    return (str(cell.get('bbox')), cell.get('category'), cell.get('text'))
 
 
 class DotsOCRParser:
@@ -33,8 +55,42 @@ class DotsOCRParser:
             min_pixels=None,
             max_pixels=None,
             use_hf=False,
+            prefetch_pages=4,
+            num_render_workers=1,
+            inference_cache=None,
+            timeout=None,
+            image_format='png',
+            image_quality=None,
+            png_compress_level=None,
+            grayscale=False,
+            preprocess_engine='resample',
+            output_profile='full',
+            picture_mode='inline',
+            hf_batch_size=1,
+            hf_model_path="./weights/DotsOCR",
+            hf_profile=None,
+            hf_device=None,
+            hf_attn_implementation=None,
+            hf_dtype=None,
+            hf_autocast_dtype=None,
+            hf_num_threads=None,
+            hf_quantize=False,
+            hf_max_new_tokens=24000,
+            repetition_stop=True,
+            max_inflight_pages=None,
         ):
         self.dpi = dpi
+        # how fitz_preprocess upsamples image inputs: 'resample' resizes once to the size the
+        # fitz route would produce, 'fitz' renders through a pdf page like the original pipeline
+        assert preprocess_engine in ('resample', 'fitz'), f"unknown preprocess_engine {preprocess_engine}"
+        self.preprocess_engine = preprocess_engine
+        # number of pdf pages rendered ahead of inference, peak memory scales with
+        # num_thread + prefetch_pages rather than with the page count
+        self.prefetch_pages = prefetch_pages
+        # processes used to rasterize pdf pages, 1 renders in the parsing process
+        self.num_render_workers = num_render_workers
+        # optional InferenceCache, a hit skips the model call entirely
+        self.inference_cache = inference_cache
 
         # default args for vllm server
         self.protocol = protocol
@@ -46,77 +102,141 @@ class DotsOCRParser:
         self.top_p = top_p
         self.max_completion_tokens = max_completion_tokens
         self.num_thread = num_thread
+        # stop generating once the model loops (see RepetitionDetector), the cleaner gets the partial output
+        self.repetition_stop = repetition_stop
+        # request timeout of the vllm backend in seconds, None keeps the openai client default
+        self.timeout = timeout
+        # wire format of the page images sent to the vllm backend, see image_utils.image_transport_formats
+        self.image_encoding = get_image_encoding(
+            image_format, quality=image_quality, compress_level=png_compress_level, grayscale=grayscale,
+        )
         self.output_dir = output_dir
+        # which per-page artifacts are produced, see consts.output_profiles; skipped artifacts are
+        # neither rendered nor written
+        assert output_profile in output_profiles, f"output_profile should be one of {list(output_profiles)}"
+        self.output_profile = output_profile
+        # how Picture crops appear in the markdown: 'inline' base64 data URIs, or 'file' content-addressed
+        # pngs in <save_dir>/images referenced by relative links. Either way each crop is encoded once per page.
+        # The 'memory' profile writes no files, its pictures are always inline
+        assert picture_mode in ('inline', 'file'), f"unknown picture_mode {picture_mode}"
+        self.picture_mode = picture_mode
         self.min_pixels = min_pixels
         self.max_pixels = max_pixels
 
         self.use_hf = use_hf
+        # hf backend, unset options come from the profile (see hf_model.hf_profiles), then from
+        # auto-detection: cuda if available, flash attention if installed, bf16 on cuda / fp32 on cpu
+        assert hf_profile is None or hf_profile in hf_profiles, f"hf_profile should be one of {list(hf_profiles)}"
+        profile = hf_profiles[hf_profile] if hf_profile else {}
+        self.hf_model_path = hf_model_path
+        self.hf_device = hf_device or profile.get('device', 'auto')
+        self.hf_attn_implementation = hf_attn_implementation or profile.get('attn_implementation')
+        self.hf_dtype = hf_dtype or profile.get('dtype', 'auto')
+        self.hf_autocast_dtype = hf_autocast_dtype or profile.get('autocast_dtype')
+        self.hf_num_threads = hf_num_threads or (default_cpu_threads() if hf_profile == 'cpu' else None)
+        self.hf_quantize = hf_quantize
+        self.hf_max_new_tokens = hf_max_new_tokens
+        # pages generated together by the hf backend, pages of the same size are batched by HFBatcher
+        self.hf_batch_size = max(1, hf_batch_size)
+        self._hf_batcher = None
         if self.use_hf:
             self._load_hf_model()
-            print(f"use hf model, num_thread will be set to 1")
+            if self.hf_batch_size > 1:
+                self._hf_batcher = HFBatcher(self._generate_with_hf, batch_size=self.hf_batch_size)
+            print(f"use hf model, num_thread will be set to {self.hf_batch_size}")
         else:
             print(f"use vllm model, num_thread will be set to {self.num_thread}")
         assert self.min_pixels is None or self.min_pixels >= MIN_PIXELS
         assert self.max_pixels is None or self.max_pixels <= MAX_PIXELS
+        # model calls in flight at the backend, shared by every parser and document of the process
+        # (see governor.ConcurrencyGovernor); None keeps the current limit, unlimited by default.
+        # The hf backend is one model in this process: one generate call (or HFBatcher batch) at a time
+        if self.use_hf:
+            max_inflight_pages = self.hf_batch_size
+        self.governor = get_governor('hf' if self.use_hf else f"vllm:{protocol}://{ip}:{port}", max_inflight_pages)
 
     def _load_hf_model(self):
-        import torch
-        from transformers import AutoModelForCausalLM, AutoProcessor, AutoTokenizer
         from qwen_vl_utils import process_vision_info
 
-        model_path = "./weights/DotsOCR"
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            attn_implementation="flash_attention_2",
-            torch_dtype=torch.bfloat16,
-            device_map="auto",
-            trust_remote_code=True
+        self.model, self.processor, self.hf_device = load_hf_model(
+            self.hf_model_path,
+            device=self.hf_device,
+            attn_implementation=self.hf_attn_implementation,
+            dtype=self.hf_dtype,
+            num_threads=self.hf_num_threads,
+            quantize=self.hf_quantize,
         )
-        self.processor = AutoProcessor.from_pretrained(model_path,  trust_remote_code=True,use_fast=True)
         self.process_vision_info = process_vision_info
 
-    def _inference_with_hf(self, image, prompt):
+    def _generate_with_hf(self, images, prompts):
+        """Generate the responses of several pages in one `model.generate` call."""
+        import torch
+
         messages = [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "image",
-                        "image": image
-                    },
-                    {"type": "text", "text": prompt}
-                ]
-            }
+            [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "image",
+                            "image": image
+                        },
+                        {"type": "text", "text": prompt}
+                    ]
+                }
+            ] for image, prompt in zip(images, prompts)
         ]
 
         # Preparation for inference
-        text = self.processor.apply_chat_template(
-            messages, 
-            tokenize=False, 
-            add_generation_prompt=True
-        )
+        texts = [
+            self.processor.apply_chat_template(
+                message, 
+                tokenize=False, 
+                add_generation_prompt=True
+            ) for message in messages
+        ]
         image_inputs, video_inputs = self.process_vision_info(messages)
         inputs = self.processor(
-            text=[text],
+            text=texts,
             images=image_inputs,
             videos=video_inputs,
             padding=True,
             return_tensors="pt",
         )
 
-        inputs = inputs.to("cuda")
+        inputs = inputs.to(self.model.device)
 
         # Inference: Generation of the output
-        generated_ids = self.model.generate(**inputs, max_new_tokens=24000)
+        tokenizer = self.processor.tokenizer
+        stopping_criteria, detectors = None, []
+        if self.repetition_stop:
+            stopping_criteria, detectors = make_repetition_stopping_criteria(
+                tokenizer, prompt_length=inputs.input_ids.shape[1], batch_size=len(texts),
+            )
+        with torch.inference_mode(), hf_autocast(self.hf_device, self.hf_autocast_dtype):
+            generated_ids = self.model.generate(
+                **inputs,
+                max_new_tokens=self.hf_max_new_tokens,
+                pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+                stopping_criteria=stopping_criteria,
+            )
+        for detector in detectors:
+            if detector.triggered:
+                record_repetition_stop('hf', detector)
         generated_ids_trimmed = [
             out_ids[len(in_ids) :] for in_ids, out_ids in zip(inputs.input_ids, generated_ids)
         ]
-        response = self.processor.batch_decode(
+        responses = self.processor.batch_decode(
             generated_ids_trimmed, skip_special_tokens=True, clean_up_tokenization_spaces=False
-        )[0]
-        return response
+        )
+        return responses
+
+    def _inference_with_hf(self, image, prompt):
+        if self._hf_batcher is not None:
+            return self._hf_batcher.submit(image, prompt)
+        return self._generate_with_hf([image], [prompt])[0]
 
-    def _inference_with_vllm(self, image, prompt):
+    def _inference_with_vllm(self, image, prompt, on_text=None):
         response = inference_with_vllm(
             image,
             prompt, 
@@ -127,9 +247,49 @@ class DotsOCRParser:
             temperature=self.temperature,
             top_p=self.top_p,
             max_completion_tokens=self.max_completion_tokens,
+            timeout=self.timeout,
+            max_connections=self.num_thread,
+            image_encoding=self.image_encoding,
+            repetition_stop=self.repetition_stop,
+            on_text=on_text,
         )
         return response
 
+    def _inference(self, image, prompt, on_text=None, group=None):
+        """
+        on_text: called with every chunk of the response as the vllm backend generates it,
+            cached responses and the HF backend return the whole response at once.
+        group: the document of the page, free backend slots go to the waiting documents in turn.
+        """
+        cache_key = None
+        if self.inference_cache is not None:
+            cache_key = make_cache_key(
+                image,
+                prompt,
+                backend='hf' if self.use_hf else 'vllm',
+                model_name=self.model_name,
+                temperature=self.temperature,
+                top_p=self.top_p,
+                max_tokens=self.hf_max_new_tokens if self.use_hf else self.max_completion_tokens,
+                image_encoding=None if self.use_hf else self.image_encoding,  # lossy formats change the model input
+                # numerics of the local model
+                hf_variant=(self.hf_dtype, self.hf_autocast_dtype, self.hf_quantize) if self.use_hf else None,
+                repetition_stop=self.repetition_stop,
+            )
+            response = self.inference_cache.get(cache_key)
+            if response is not None:
+                return response
+
+        with self.governor.slot(group):
+            if self.use_hf:
+                response = self._inference_with_hf(image, prompt)
+            else:
+                response = self._inference_with_vllm(image, prompt, on_text=on_text)
+
+        if cache_key is not None:
+            self.inference_cache.put(cache_key, response)
+        return response
+
     def get_prompt(self, prompt_mode, bbox=None, origin_image=None, image=None, min_pixels=None, max_pixels=None):
         prompt = dict_promptmode_to_prompt[prompt_mode]
         if prompt_mode == 'prompt_grounding_ocr':
@@ -150,7 +310,19 @@ class DotsOCRParser:
         page_idx=0, 
         bbox=None,
         fitz_preprocess=False,
+        native_cells=None,
+        on_cell=None,
+        in_memory=False,
         ):
+        """
+        save_dir: directory of the artifacts of the output profile, None writes no files.
+        in_memory: also return the cells ('layout_info') and markdown ('md_content') in the result,
+            always done with the 'memory' output profile.
+        native_cells: layout cells extracted from the pdf text layer (see `doc_utils.render_pdf_page`),
+            when given, layout and ocr prompts skip the model and use them directly.
+        on_cell: callable(page_idx, cell) receiving the layout cells of the page in origin_image coordinates,
+            each one as soon as the model closes it when the backend streams, all at the end of the page otherwise.
+        """
         min_pixels, max_pixels = self.min_pixels, self.max_pixels
         if prompt_mode == "prompt_grounding_ocr":
             min_pixels = min_pixels or MIN_PIXELS  # preprocess image to the final input
@@ -158,111 +330,226 @@ class DotsOCRParser:
         if min_pixels is not None: assert min_pixels >= MIN_PIXELS, f"min_pixels should >= {MIN_PIXELS}"
         if max_pixels is not None: assert max_pixels <= MAX_PIXELS, f"max_pixels should <= {MAX_PIXELS}"
 
-        if source == 'image' and fitz_preprocess:
-            image = get_image_by_fitz_doc(origin_image, target_dpi=self.dpi)
-            image = fetch_image(image, min_pixels=min_pixels, max_pixels=max_pixels)
+        use_text_layer = native_cells is not None and prompt_mode != 'prompt_grounding_ocr'
+        streamed = Counter()  # cells already handed to on_cell while the page was generated
+        if use_text_layer:
+            # cells are already in origin_image coordinates, no model input to prepare
+            image = origin_image
+            input_height, input_width = origin_image.height, origin_image.width
+            response = "\n\n".join(
+                cell['text'] for cell in native_cells
+                if cell.get('text') and cell['category'] not in ['Page-header', 'Page-footer']
+            )
         else:
-            image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
-        input_height, input_width = smart_resize(image.height, image.width)
-        prompt = self.get_prompt(prompt_mode, bbox, origin_image, image, min_pixels=min_pixels, max_pixels=max_pixels)
-        if self.use_hf:
-            response = self._inference_with_hf(image, prompt)
-        else:
-            response = self._inference_with_vllm(image, prompt)
+            if source == 'image' and fitz_preprocess and self.preprocess_engine == 'resample':
+                image = get_image_by_resample(origin_image, target_dpi=self.dpi, min_pixels=min_pixels, max_pixels=max_pixels)
+            elif source == 'image' and fitz_preprocess:
+                image = get_image_by_fitz_doc(origin_image, target_dpi=self.dpi)
+                image = fetch_image(image, min_pixels=min_pixels, max_pixels=max_pixels)
+            else:
+                image = fetch_image(origin_image, min_pixels=min_pixels, max_pixels=max_pixels)
+            input_height, input_width = smart_resize(image.height, image.width)
+            prompt = self.get_prompt(prompt_mode, bbox, origin_image, image, min_pixels=min_pixels, max_pixels=max_pixels)
+            on_text = None
+            if on_cell is not None and prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en']:
+                stream_parser = CellStreamParser()
+
+                def on_text(delta):
+                    for cell in stream_parser.feed(delta):
+                        try:
+                            cell = post_process_cells(origin_image, [cell], image.width, image.height, min_pixels=min_pixels, max_pixels=max_pixels)[0]
+                        except Exception as e:  # malformed bbox, the final post process reports it
+                            logger.warning("streamed cell post process error: %s", e)
+                            continue
+                        streamed[_cell_key(cell)] += 1
+                        on_cell(page_idx, cell)
+            response = self._inference(image, prompt, on_text=on_text, group=(save_dir, save_name))
         result = {'page_no': page_idx,
             "input_height": input_height,
-            "input_width": input_width
+            "input_width": input_width,
+            "parse_method": 'txt' if use_text_layer else 'ocr',
         }
         if source == 'pdf':
             save_name = f"{save_name}_page_{page_idx}"
+        artifacts = output_profiles[self.output_profile] if save_dir else set()
+        in_memory = in_memory or self.output_profile == 'memory'
         if prompt_mode in ['prompt_layout_all_en', 'prompt_layout_only_en', 'prompt_grounding_ocr']:
-            cells, filtered = post_process_output(
-                response, 
-                prompt_mode, 
-                origin_image, 
-                image,
-                min_pixels=min_pixels, 
-                max_pixels=max_pixels,
-                )
+            if use_text_layer:
+                cells, filtered = native_cells, False
+                if prompt_mode == 'prompt_layout_only_en':
+                    cells = [{'bbox': cell['bbox'], 'category': cell['category']} for cell in cells]
+            else:
+                cells, filtered = post_process_output(
+                    response, 
+                    prompt_mode, 
+                    origin_image, 
+                    image,
+                    min_pixels=min_pixels, 
+                    max_pixels=max_pixels,
+                    )
+            if on_cell is not None and not filtered:
+                # the cells the stream did not deliver: recovered by the final parse or repair only
+                # (the salvaged last cell of a truncated output), or whose streamed post process failed
+                for cell in cells:
+                    key = _cell_key(cell)
+                    if streamed[key] > 0:
+                        streamed[key] -= 1
+                    else:
+                        on_cell(page_idx, cell)
             if filtered and prompt_mode != 'prompt_layout_only_en':  # model output json failed, use filtered process
-                json_file_path = os.path.join(save_dir, f"{save_name}.json")
-                with open(json_file_path, 'w', encoding="utf-8") as w:
-                    json.dump(response, w, ensure_ascii=False)
+                if 'json' in artifacts:
+                    json_file_path = os.path.join(save_dir, f"{save_name}.json")
+                    with open(json_file_path, 'w', encoding="utf-8") as w:
+                        json.dump(response, w, ensure_ascii=False)
+                    result['layout_info_path'] = json_file_path
 
-                image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-                origin_image.save(image_layout_path)
-                result.update({
-                    'layout_info_path': json_file_path,
-                    'layout_image_path': image_layout_path,
-                })
+                if 'layout_image' in artifacts:
+                    image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
+                    origin_image.save(image_layout_path)
+                    result['layout_image_path'] = image_layout_path
 
-                md_file_path = os.path.join(save_dir, f"{save_name}.md")
-                with open(md_file_path, "w", encoding="utf-8") as md_file:
-                    md_file.write(cells)
-                result.update({
-                    'md_content_path': md_file_path
-                })
+                if 'md' in artifacts:
+                    md_file_path = os.path.join(save_dir, f"{save_name}.md")
+                    with open(md_file_path, "w", encoding="utf-8") as md_file:
+                        md_file.write(cells)
+                    result['md_content_path'] = md_file_path
+                if in_memory:
+                    result.update({
+                        'layout_info': response,
+                        'md_content': cells,
+                    })
                 result.update({
                     'filtered': True
                 })
             else:
-                try:
-                    image_with_layout = draw_layout_on_image(origin_image, cells)
-                except Exception as e:
-                    print(f"Error drawing layout on image: {e}")
-                    image_with_layout = origin_image
+                if 'layout_image' in artifacts:
+                    try:
+                        image_with_layout = draw_layout_on_image(origin_image, cells)
+                    except Exception as e:
+                        print(f"Error drawing layout on image: {e}")
+                        image_with_layout = origin_image
+                    image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
+                    image_with_layout.save(image_layout_path)
+                    result['layout_image_path'] = image_layout_path
 
-                json_file_path = os.path.join(save_dir, f"{save_name}.json")
-                with open(json_file_path, 'w', encoding="utf-8") as w:
-                    json.dump(cells, w, ensure_ascii=False)
+                if 'json' in artifacts:
+                    json_file_path = os.path.join(save_dir, f"{save_name}.json")
+                    with open(json_file_path, 'w', encoding="utf-8") as w:
+                        json.dump(cells, w, ensure_ascii=False)
+                    result['layout_info_path'] = json_file_path
+                if in_memory:
+                    result['layout_info'] = cells
 
+                if prompt_mode != "prompt_layout_only_en":  # no text md when detection only
+                    if 'md' in artifacts or 'md_nohf' in artifacts or in_memory:
+                        if self.picture_mode == 'file' and save_dir and self.output_profile != 'memory':
+                            picture_refs = save_picture_crops(origin_image, cells, os.path.join(save_dir, 'images'))
+                        else:
+                            picture_refs = encode_picture_crops(origin_image, cells)
+                    if 'md' in artifacts or in_memory:
+                        md_content = layoutjson2md(origin_image, cells, text_key='text', picture_refs=picture_refs)
+                    if 'md' in artifacts:
+                        md_file_path = os.path.join(save_dir, f"{save_name}.md")
+                        with open(md_file_path, "w", encoding="utf-8") as md_file:
+                            md_file.write(md_content)
+                        result['md_content_path'] = md_file_path
+                    if in_memory:
+                        result['md_content'] = md_content
+                    if 'md_nohf' in artifacts:
+                        md_content_no_hf = layoutjson2md(origin_image, cells, text_key='text', no_page_hf=True, picture_refs=picture_refs) # used for clean output or metric of omnidocbench、olmbench 
+                        md_nohf_file_path = os.path.join(save_dir, f"{save_name}_nohf.md")
+                        with open(md_nohf_file_path, "w", encoding="utf-8") as md_file:
+                            md_file.write(md_content_no_hf)
+                        result['md_content_nohf_path'] = md_nohf_file_path
+        else:
+            if 'layout_image' in artifacts:
                 image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-                image_with_layout.save(image_layout_path)
+                origin_image.save(image_layout_path)
                 result.update({
-                    'layout_info_path': json_file_path,
                     'layout_image_path': image_layout_path,
                 })
-                if prompt_mode != "prompt_layout_only_en":  # no text md when detection only
-                    md_content = layoutjson2md(origin_image, cells, text_key='text')
-                    md_content_no_hf = layoutjson2md(origin_image, cells, text_key='text', no_page_hf=True) # used for clean output or metric of omnidocbench、olmbench 
-                    md_file_path = os.path.join(save_dir, f"{save_name}.md")
-                    with open(md_file_path, "w", encoding="utf-8") as md_file:
-                        md_file.write(md_content)
-                    md_nohf_file_path = os.path.join(save_dir, f"{save_name}_nohf.md")
-                    with open(md_nohf_file_path, "w", encoding="utf-8") as md_file:
-                        md_file.write(md_content_no_hf)
-                    result.update({
-                        'md_content_path': md_file_path,
-                        'md_content_nohf_path': md_nohf_file_path,
-                    })
-        else:
-            image_layout_path = os.path.join(save_dir, f"{save_name}.jpg")
-            origin_image.save(image_layout_path)
-            result.update({
-                'layout_image_path': image_layout_path,
-            })
 
             md_content = response
-            md_file_path = os.path.join(save_dir, f"{save_name}.md")
-            with open(md_file_path, "w", encoding="utf-8") as md_file:
-                md_file.write(md_content)
-            result.update({
-                'md_content_path': md_file_path,
-            })
+            if artifacts:  # the markdown is the only output of the text prompts, every file profile keeps it
+                md_file_path = os.path.join(save_dir, f"{save_name}.md")
+                with open(md_file_path, "w", encoding="utf-8") as md_file:
+                    md_file.write(md_content)
+                result.update({
+                    'md_content_path': md_file_path,
+                })
+            if in_memory:
+                result['md_content'] = md_content
 
         return result
     
-    def parse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False):
+    def parse_image(self, input_path, filename, prompt_mode, save_dir, bbox=None, fitz_preprocess=False, on_cell=None,
+                    in_memory=False):
         origin_image = fetch_image(input_path)
-        result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess)
+        result = self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox, fitz_preprocess=fitz_preprocess, on_cell=on_cell, in_memory=in_memory)
         result['file_path'] = input_path
         return [result]
-        
-    def parse_pdf(self, input_path, filename, prompt_mode, save_dir):
-        print(f"loading pdf: {input_path}")
-        images_origin = load_images_from_pdf(input_path, dpi=self.dpi)
-        total_pages = len(images_origin)
-        tasks = [
+
+    def parse_pil(self, image, prompt_mode, save_dir=None, filename="image", bbox=None, fitz_preprocess=False,
+                  on_cell=None):
+        """
+        Parse a PIL image without any disk round trip. The cells ('layout_info') and markdown
+        ('md_content') are returned in the result; with save_dir the artifacts of the output
+        profile are written there as well. Returns the page result.
+        """
+        if save_dir:
+            os.makedirs(save_dir, exist_ok=True)
+        origin_image = fetch_image(image)
+        return self._parse_single_image(origin_image, prompt_mode, save_dir, filename, source="image", bbox=bbox,
+                                        fitz_preprocess=fitz_preprocess, on_cell=on_cell, in_memory=True)
+
+    def parse_bytes(self, data, prompt_mode, save_dir=None, filename="document", pages=None, parse_method='ocr',
+                    bbox=None, fitz_preprocess=False, on_result=None, on_cell=None):
+        """
+        Parse a pdf or an image given as bytes (e.g. an upload), see `parse_pil`. pdf pages are rendered
+        from memory, the arguments are those of `parse_pdf` and `parse_image`. Returns the page results.
+        """
+        if b'%PDF' in data[:1024]:
+            if save_dir:
+                os.makedirs(save_dir, exist_ok=True)
+            return self.parse_pdf(data, filename, prompt_mode, save_dir, pages=pages, parse_method=parse_method,
+                                  on_result=on_result, on_cell=on_cell, in_memory=True)
+        with BytesIO(data) as bio:
+            image = Image.open(bio)
+            image.load()
+        result = self.parse_pil(image, prompt_mode, save_dir, filename, bbox=bbox, fitz_preprocess=fitz_preprocess,
+                                on_cell=on_cell)
+        if on_result is not None:
+            on_result(result)
+        return [result]
+
+    def parse_pdf(self, input_path, filename, prompt_mode, save_dir, pages=None, parse_method='ocr',
+                  skip_pages=None, on_result=None, on_cell=None, in_memory=False):
+        """
+        input_path: path of the pdf, or its content as bytes.
+        pages: optional 1-based page selection such as "1-5,9,12-", unselected pages are
+            neither rendered nor sent to the model. Results keep the original page index in `page_no`.
+        parse_method: 'ocr' sends every page to the model, 'txt' builds the layout from the pdf text layer,
+            'auto' uses the text layer of born-digital pages and the model for scanned / image-heavy ones.
+        skip_pages: 0-based page ids already parsed, e.g. by an interrupted run, they are not rendered again.
+        on_result: called with each page result as soon as the page is finished.
+        on_cell: callable(page_no, cell) receiving the layout cells while the pages are generated.
+        in_memory: also return the cells and markdown in the results, see `_parse_single_image`.
+        """
+        from_bytes = not isinstance(input_path, str)
+        print(f"loading pdf: {f'{len(input_path)} bytes' if from_bytes else input_path}")
+        page_count = get_pdf_page_count(input_path)
+        page_ids = select_pages(pages, page_count) if pages else list(range(page_count))
+        if skip_pages:
+            page_ids = [page_id for page_id in page_ids if page_id not in skip_pages]
+        total_pages = len(page_ids)
+        page_images = prefetch_iter(
+            iter_pdf_pages(
+                input_path, dpi=self.dpi, num_workers=self.num_render_workers,
+                page_ids=page_ids, parse_method=parse_method,
+            ),
+            window=self.prefetch_pages,
+        )
+        tasks = (
             {
                 "origin_image": image,
                 "prompt_mode": prompt_mode,
@@ -270,54 +557,137 @@ class DotsOCRParser:
                 "save_name": filename,
                 "source":"pdf",
                 "page_idx": i,
-            } for i, image in enumerate(images_origin)
-        ]
+                "native_cells": native_cells,
+                "on_cell": on_cell,
+                "in_memory": in_memory,
+            } for i, image, native_cells in page_images
+        )
 
         def _execute_task(task_args):
             return self._parse_single_image(**task_args)
 
         if self.use_hf:
-            num_thread =  1
+            num_thread = max(1, min(total_pages, self.hf_batch_size))  # enough pages in flight to fill a batch
         else:
-            num_thread = min(total_pages, self.num_thread)
+            num_thread = max(1, min(total_pages, self.num_thread))
         print(f"Parsing PDF with {total_pages} pages using {num_thread} threads...")
 
         results = []
-        with ThreadPool(num_thread) as pool:
-            with tqdm(total=total_pages, desc="Processing PDF pages") as pbar:
-                for result in pool.imap_unordered(_execute_task, tasks):
-                    results.append(result)
-                    pbar.update(1)
+        with tqdm(total=total_pages, desc="Processing PDF pages") as pbar:
+            for result in imap_unordered_bounded(_execute_task, tasks, num_thread):
+                if not from_bytes:
+                    result['file_path'] = input_path
+                if on_result is not None:
+                    on_result(result)
+                results.append(result)
+                pbar.update(1)
 
         results.sort(key=lambda x: x["page_no"])
-        for i in range(len(results)):
-            results[i]['file_path'] = input_path
         return results
 
+    def parse_page(self, input_path, page_idx, filename, prompt_mode, save_dir, parse_method='ocr',
+                   bbox=None, fitz_preprocess=False, on_cell=None, in_memory=False):
+        """
+        Parse one page of a pdf (0-based page_idx) or an image (page 0), for callers that
+        distribute the pages of a document over several workers. Returns the page result.
+        """
+        if not input_path.lower().endswith('.pdf'):
+            return self.parse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox,
+                                    fitz_preprocess=fitz_preprocess, on_cell=on_cell, in_memory=in_memory)[0]
+        for i, image, native_cells in iter_pdf_pages(input_path, dpi=self.dpi, page_ids=[page_idx],
+                                                     parse_method=parse_method):
+            result = self._parse_single_image(
+                image, prompt_mode, save_dir, filename, source="pdf", page_idx=i,
+                native_cells=native_cells, on_cell=on_cell, in_memory=in_memory,
+            )
+            result['file_path'] = input_path
+            return result
+        raise ValueError(f"page {page_idx + 1} not found in {input_path}")
+
+    @staticmethod
+    def _load_finished_results(jsonl_path):
+        """Read the page results of a previous run, keeping those whose artifacts all exist."""
+        finished = {}
+        if not os.path.exists(jsonl_path):
+            return finished
+        with open(jsonl_path, 'r', encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:  # partial line written when the previous run died
+                    continue
+                artifacts = [v for k, v in result.items() if k.endswith('_path') and k != 'file_path']
+                if artifacts and all(os.path.exists(path) for path in artifacts):
+                    finished[result['page_no']] = result
+                elif not artifacts and ('layout_info' in result or 'md_content' in result):  # 'memory' profile
+                    finished[result['page_no']] = result
+        return finished
+
+    @staticmethod
+    def _write_results(jsonl_path, results):
+        tmp_path = f"{jsonl_path}.tmp"
+        with open(tmp_path, 'w', encoding="utf-8") as w:
+            for result in results:
+                w.write(json.dumps(result, ensure_ascii=False) + '\n')
+        os.replace(tmp_path, jsonl_path)
+
     def parse_file(self, 
         input_path, 
         output_dir="", 
         prompt_mode="prompt_layout_all_en",
         bbox=None,
-        fitz_preprocess=False
+        fitz_preprocess=False,
+        pages=None,
+        parse_method='ocr',
+        resume=False,
+        on_cell=None,
         ):
+        """
+        Page results are appended to `<output_dir>/<filename>.jsonl` as soon as each page finishes,
+        with the 'memory' output profile the jsonl is the only file written and carries the content.
+        With resume=True, pages recorded there by a previous run whose artifacts still exist are kept,
+        only the missing pages are rendered and parsed.
+        on_cell: callable(page_no, cell) receiving each layout cell as soon as it is generated
+            (layout prompts), pages are parsed concurrently so cells of different pages interleave.
+        """
         output_dir = output_dir or self.output_dir
         output_dir = os.path.abspath(output_dir)
         filename, file_ext = os.path.splitext(os.path.basename(input_path))
         save_dir = os.path.join(output_dir, filename)
-        os.makedirs(save_dir, exist_ok=True)
-
-        if file_ext == '.pdf':
-            results = self.parse_pdf(input_path, filename, prompt_mode, save_dir)
-        elif file_ext in image_extensions:
-            results = self.parse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox, fitz_preprocess=fitz_preprocess)
+        if self.output_profile == 'memory':
+            os.makedirs(output_dir, exist_ok=True)
         else:
-            raise ValueError(f"file extension {file_ext} not supported, supported extensions are {image_extensions} and pdf")
-        
-        print(f"Parsing finished, results saving to {save_dir}")
-        with open(os.path.join(output_dir, os.path.basename(filename)+'.jsonl'), 'w', encoding="utf-8") as w:
-            for result in results:
+            os.makedirs(save_dir, exist_ok=True)
+        jsonl_path = os.path.join(output_dir, os.path.basename(filename)+'.jsonl')
+
+        finished = self._load_finished_results(jsonl_path) if resume else {}
+        if finished:
+            print(f"Resuming, {len(finished)} pages already parsed in {jsonl_path}")
+        # drop partial lines / results with missing artifacts, then append new pages durably
+        self._write_results(jsonl_path, [finished[page_no] for page_no in sorted(finished)])
+
+        with open(jsonl_path, 'a', encoding="utf-8") as w:
+            def _append_result(result):
                 w.write(json.dumps(result, ensure_ascii=False) + '\n')
+                w.flush()
+                os.fsync(w.fileno())
+
+            if file_ext == '.pdf':
+                results = self.parse_pdf(
+                    input_path, filename, prompt_mode, save_dir, pages=pages, parse_method=parse_method,
+                    skip_pages=set(finished), on_result=_append_result, on_cell=on_cell,
+                )
+            elif file_ext in image_extensions:
+                results = []
+                if 0 not in finished:
+                    results = self.parse_image(input_path, filename, prompt_mode, save_dir, bbox=bbox, fitz_preprocess=fitz_preprocess, on_cell=on_cell)
+                    _append_result(results[0])
+            else:
+                raise ValueError(f"file extension {file_ext} not supported, supported extensions are {image_extensions} and pdf")
+
+        results = sorted(list(finished.values()) + results, key=lambda x: x["page_no"])
+        print(f"Parsing finished, results saving to {save_dir}")
+        self._write_results(jsonl_path, results)
 
         return results
 
@@ -331,7 +701,7 @@ def main():
     
     parser.add_argument(
         "input_path", type=str,
-        help="Input PDF/image file path"
+        help="Input PDF/image file path, or for batch mode a directory, a glob pattern or a manifest (.txt/.lst, one path per line)"
     )
     
     parser.add_argument(
@@ -350,6 +720,18 @@ def main():
         metavar=('x1', 'y1', 'x2', 'y2'),
         help='should give this argument if you want to prompt_grounding_ocr'
     )
+    parser.add_argument(
+        "--pages", type=str, default=None,
+        help="pdf pages to parse, 1-based, e.g. '1-5,9,12-' (default: all pages)"
+    )
+    parser.add_argument(
+        "--parse_method", type=str, choices=['ocr', 'txt', 'auto'], default="ocr",
+        help="pdf only: 'ocr' sends every page to the model, 'txt' uses the pdf text layer, 'auto' uses the text layer of born-digital pages and the model for scanned ones"
+    )
+    parser.add_argument(
+        "--resume", action='store_true',
+        help="keep the pages finished by a previous (interrupted) run of the same file, parse only the missing ones"
+    )
     parser.add_argument(
         "--protocol", type=str, choices=['http', 'https'], default="http",
         help=""
@@ -386,10 +768,64 @@ def main():
         "--num_thread", type=int, default=16,
         help=""
     )
+    parser.add_argument(
+        "--timeout", type=float, default=None,
+        help="request timeout of the vllm backend in seconds"
+    )
+    parser.add_argument(
+        "--image_format", type=str, choices=list(image_transport_formats), default="png",
+        help="wire format of the page images sent to the vllm backend"
+    )
+    parser.add_argument(
+        "--image_quality", type=int, default=None,
+        help="jpeg/webp quality, for webp_lossless the encoder effort (0 fastest)"
+    )
+    parser.add_argument(
+        "--png_compress_level", type=int, default=None,
+        help="png zlib level 0-9, lower is faster and larger"
+    )
+    parser.add_argument(
+        "--grayscale", action='store_true',
+        help="send single-channel images, for monochrome scans"
+    )
+    parser.add_argument(
+        "--prefetch_pages", type=int, default=4,
+        help="number of pdf pages rendered ahead of inference, bounds the memory used by page images"
+    )
+    parser.add_argument(
+        "--num_render_workers", type=int, default=1,
+        help="number of processes rasterizing pdf pages in parallel"
+    )
+    parser.add_argument(
+        "--cache_dir", type=str, default=None,
+        help="directory of the on-disk inference cache, identical requests skip the model"
+    )
+    parser.add_argument(
+        "--cache_max_bytes", type=int, default=1 << 30,
+        help="size limit of the on-disk inference cache, least recently used entries are evicted"
+    )
+    parser.add_argument(
+        "--cache_memory_entries", type=int, default=256,
+        help="number of responses kept in the in-memory cache tier"
+    )
     parser.add_argument(
         "--no_fitz_preprocess", action='store_true',
         help="False will use tikz dpi upsample pipeline, good for images which has been render with low dpi, but maybe result in higher computational costs"
     )
+    parser.add_argument(
+        "--preprocess_engine", type=str, choices=["resample", "fitz"], default="resample",
+        help="dpi upsample of image inputs: resample resizes once, fitz renders through a pdf page (original pipeline)"
+    )
+    parser.add_argument(
+        "--output_profile", type=str, choices=list(output_profiles), default="full",
+        help="per-page artifacts: full (json, layout jpg, md, nohf md), text (json, md), minimal (json), "
+             "memory (no page files, content kept in the jsonl results, pictures inline)"
+    )
+    parser.add_argument(
+        "--picture_mode", type=str, choices=["inline", "file"], default="inline",
+        help="pictures in the markdown: inline base64, or png files in <output>/<name>/images linked by relative url "
+             "(inline with --output_profile memory)"
+    )
     parser.add_argument(
         "--min_pixels", type=int, default=None,
         help=""
@@ -402,8 +838,95 @@ def main():
         "--use_hf", type=bool, default=False,
         help=""
     )
+    parser.add_argument(
+        "--max_inflight_pages", type=int, default=None,
+        help="pages sent to the model at the same time, across all files (default: no limit beyond --num_thread)"
+    )
+    parser.add_argument(
+        "--no_repetition_stop", action='store_true',
+        help="let looping generations run to the token limit instead of stopping them early"
+    )
+    parser.add_argument(
+        "--stream", type=str, default=None, metavar="PATH",
+        help="write every layout cell as a jsonl line {file_path, page_no, cell} as soon as it is generated, '-' for stdout"
+    )
+    parser.add_argument(
+        "--estimate", action='store_true',
+        help="dry run: print a jsonl line per file with the pages, model input sizes, visual tokens and estimated "
+             "seconds, without rendering pages, loading the model or calling it"
+    )
+    parser.add_argument(
+        "--throughput_file", type=str, default=None, metavar="PATH",
+        help="json file of the measured visual tokens/s: read by --estimate, updated after every run "
+             "(except with --resume or --cache_dir, whose skipped pages would inflate it)"
+    )
+    parser.add_argument(
+        "--hf_batch_size", type=int, default=1,
+        help="pages of the same size generated together by the hf backend"
+    )
+    parser.add_argument(
+        "--hf_model_path", type=str, default="./weights/DotsOCR",
+        help="checkpoint of the hf backend"
+    )
+    parser.add_argument(
+        "--hf_profile", type=str, choices=list(hf_profiles), default=None,
+        help="hf backend preset: gpu (flash attention, bf16) or cpu (sdpa, fp32 weights with native bf16 autocast, all cores)"
+    )
+    parser.add_argument(
+        "--hf_device", type=str, default=None,
+        help="auto, cuda, cuda:N, mps or cpu"
+    )
+    parser.add_argument(
+        "--hf_attn_implementation", type=str, choices=["flash_attention_2", "sdpa", "eager"], default=None,
+        help="attention kernel of the hf backend, default: flash_attention_2 if installed on cuda, else sdpa"
+    )
+    parser.add_argument(
+        "--hf_dtype", type=str, choices=["auto", "bfloat16", "float16", "float32"], default=None,
+        help="weight dtype of the hf backend, auto: bfloat16 on cuda, float32 otherwise"
+    )
+    parser.add_argument(
+        "--hf_autocast_dtype", type=str, choices=["auto", "bfloat16", "float16"], default=None,
+        help="run generation under torch.autocast with this dtype, auto: bfloat16 where it is native"
+    )
+    parser.add_argument(
+        "--hf_num_threads", type=int, default=None,
+        help="torch intra-op threads of the hf backend"
+    )
+    parser.add_argument(
+        "--hf_quantize", action='store_true',
+        help="dynamic int8 quantization of the language model linear layers (cpu only)"
+    )
+    parser.add_argument(
+        "--hf_max_new_tokens", type=int, default=24000,
+        help="token budget per page of the hf backend"
+    )
     args = parser.parse_args()
 
+    if args.estimate:
+        _estimate(args)
+    elif args.stream == '-':
+        stream_file = sys.stdout
+        # keep stdout for the jsonl, progress logs go to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            _run(args, stream_file)
+    elif args.stream:
+        with open(args.stream, 'w', encoding="utf-8") as stream_file:
+            _run(args, stream_file)
+    else:
+        _run(args)
+
+
+def _run(args, stream_file=None):
+    from dots_ocr.batch import BatchParser, collect_input_files, is_batch_input, print_batch_summary
+
+    inference_cache = None
+    if args.cache_dir:
+        inference_cache = InferenceCache(
+            cache_dir=args.cache_dir,
+            max_memory_entries=args.cache_memory_entries,
+            max_disk_bytes=args.cache_max_bytes,
+        )
+
     dots_ocr_parser = DotsOCRParser(
         protocol=args.protocol,
         ip=args.ip,
@@ -418,18 +941,116 @@ def main():
         min_pixels=args.min_pixels,
         max_pixels=args.max_pixels,
         use_hf=args.use_hf,
+        repetition_stop=not args.no_repetition_stop,
+        max_inflight_pages=args.max_inflight_pages,
+        hf_batch_size=args.hf_batch_size,
+        hf_model_path=args.hf_model_path,
+        hf_profile=args.hf_profile,
+        hf_device=args.hf_device,
+        hf_attn_implementation=args.hf_attn_implementation,
+        hf_dtype=args.hf_dtype,
+        hf_autocast_dtype=args.hf_autocast_dtype,
+        hf_num_threads=args.hf_num_threads,
+        hf_quantize=args.hf_quantize,
+        hf_max_new_tokens=args.hf_max_new_tokens,
+        prefetch_pages=args.prefetch_pages,
+        num_render_workers=args.num_render_workers,
+        inference_cache=inference_cache,
+        timeout=args.timeout,
+        image_format=args.image_format,
+        image_quality=args.image_quality,
+        png_compress_level=args.png_compress_level,
+        grayscale=args.grayscale,
+        preprocess_engine=args.preprocess_engine,
+        output_profile=args.output_profile,
+        picture_mode=args.picture_mode,
     )
 
     fitz_preprocess = not args.no_fitz_preprocess
     if fitz_preprocess:
         print(f"Using fitz preprocess for image input, check the change of the image pixels")
+
+    on_cell = None
+    if stream_file is not None:
+        stream_lock = threading.Lock()
+
+        def on_cell(input_path, page_no, cell):
+            line = json.dumps({'file_path': input_path, 'page_no': page_no, 'cell': cell}, ensure_ascii=False)
+            with stream_lock:  # pages stream concurrently
+                stream_file.write(line + '\n')
+                stream_file.flush()
+
+    record = args.throughput_file and not args.resume and inference_cache is None
+    start = time.time()
+    if is_batch_input(args.input_path):
+        input_files = collect_input_files(args.input_path)
+        summary = BatchParser(dots_ocr_parser).parse_files(
+            input_files,
+            prompt_mode=args.prompt,
+            fitz_preprocess=fitz_preprocess,
+            pages=args.pages,
+            parse_method=args.parse_method,
+            on_cell=on_cell,
+        )
+        print_batch_summary(summary)
+        if inference_cache is not None:
+            print(f"inference cache: {inference_cache.stats()}")
+        if record:
+            _record_throughput(args.throughput_file, summary['visual_tokens'], summary['elapsed'])
+        return
+
     result = dots_ocr_parser.parse_file(
         args.input_path, 
         prompt_mode=args.prompt,
         bbox=args.bbox,
         fitz_preprocess=fitz_preprocess,
+        pages=args.pages,
+        parse_method=args.parse_method,
+        resume=args.resume,
+        on_cell=None if on_cell is None else functools.partial(on_cell, args.input_path),
         )
-    
+    if inference_cache is not None:
+        print(f"inference cache: {inference_cache.stats()}")
+    if record:
+        _record_throughput(args.throughput_file, result_visual_tokens(result), time.time() - start)
+
+
+def _record_throughput(path, tokens, seconds):
+    rate = record_throughput(path, tokens, seconds)
+    if rate is not None:
+        print(f"{tokens} visual tokens in {seconds:.1f}s, throughput {rate:.1f} tokens/s recorded to {path}")
+
+
+def _estimate(args):
+    """Work estimate of every input file, one jsonl line each on stdout, a total on stderr."""
+    from dots_ocr.batch import collect_input_files, is_batch_input
+
+    input_files = collect_input_files(args.input_path) if is_batch_input(args.input_path) else [args.input_path]
+    throughput = load_throughput(args.throughput_file) if args.throughput_file else None
+    total_pages, total_tokens = 0, 0
+    for input_path in input_files:
+        try:
+            estimates = estimate_pages(
+                input_path, dpi=args.dpi, min_pixels=args.min_pixels, max_pixels=args.max_pixels,
+                pages=args.pages, parse_method=args.parse_method, fitz_preprocess=not args.no_fitz_preprocess,
+            )
+        except Exception as e:
+            print(json.dumps({'file_path': input_path, 'error': f"{type(e).__name__}: {e}"}, ensure_ascii=False))
+            continue
+        tokens = sum(page['visual_tokens'] for page in estimates)
+        total_pages += len(estimates)
+        total_tokens += tokens
+        print(json.dumps({
+            'file_path': input_path,
+            'pages': [dict(page, page_no=page['page_no'] + 1) for page in estimates],  # 1-based like --pages
+            'total_pages': len(estimates),
+            'visual_tokens': tokens,
+            'estimated_seconds': round(tokens / throughput, 2) if throughput else None,
+        }, ensure_ascii=False))
+    total = f"{total_pages} pages of {len(input_files)} files, {total_tokens} visual tokens"
+    if throughput:
+        total += f", ~{total_tokens / throughput:.1f}s at {throughput:.1f} tokens/s"
+    print(total, file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+import re
+import json
+
+
+_CELL_START = '{"bbox"'
+_STRING_TOKEN = re.compile(r'["\\]|\{"bbox"')
+_STRUCTURE_TOKEN = re.compile(r'[\[\]{}"]')
+_CLOSERS = {'[': ']', '{': '}'}
+_DECODER = json.JSONDecoder(strict=False)  # raw newlines / tabs inside the strings
+
+
+class CellStreamParser:
+    """
+    Incremental parser of the layout json the model generates, `[{"bbox": ..., "category": ..., "text": ...}, ...]`.
+
+    Text is fed as it is generated; every cell is returned as soon as its closing brace arrives, so a
+    consumer can show cells while the page is still being generated, and a stream cut short (timeout,
+    early stop, token limit) still yields every completed cell. Only the cell being generated is kept
+    in memory.
+
+    The scan tolerates the usual generation defects in the same pass: missing commas between cells, a
+    missing opening bracket, raw control characters in strings, and unescaped quotes in a text, which
+    break the string state until the next `{"bbox"`, that can only be the start of a new cell.
+    Objects that still do not load as a cell are counted in `skipped`.
+    """
+
+    def __init__(self):
+        self.cells = []  # every completed cell so far
+        self.skipped = 0  # closed objects that were not a valid cell
+        self._buffer = ""
+        self._scan_pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._cell_start = None
+        self._cell_depth = 0  # depth around the open cell
+        self._last_cell_text = None
+        self._last_cell = None
+
+    def feed(self, chunk):
+        """Append generated text, returns the cells completed by it."""
+        if not chunk:
+            return []
+        self._buffer += chunk
+        completed = []
+        text = self._buffer
+        stop = len(text)
+        pos = self._scan_pos
+        # a cell start split over two chunks is decided with the next one
+        brace = text.rfind('{', max(pos, stop - len(_CELL_START) + 1))
+        if brace >= 0 and _CELL_START.startswith(text[brace:]):
+            stop = brace
+        # jump from one structural character to the next, the text in between is never looked at
+        while pos < stop:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    pos += 1
+                    continue
+                match = _STRING_TOKEN.search(text, pos, stop)
+                if match is None:
+                    break
+                token = match.group()
+                pos = match.end()
+                if token == '"':
+                    self._in_string = False
+                elif token == '\\':
+                    self._escape = True
+                else:
+                    # an unescaped quote earlier in the text, the string state was wrong
+                    pos = match.start() + 1
+                    self._resync(match.start())
+                continue
+
+            match = _STRUCTURE_TOKEN.search(text, pos, stop)
+            if match is None:
+                break
+            char, start = match.group(), match.start()
+            pos = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._cell_start is not None or self._depth > 1:
+                    # cells are never nested
+                    if text.startswith(_CELL_START, start):
+                        self._resync(start)
+                        continue
+                if self._depth <= 1 and self._cell_start is None:
+                    # objects of the top-level array, or top-level objects when the '[' is missing;
+                    # a complete, well-formed cell is decoded in one call, the rest is scanned
+                    if self._last_cell_text and text.startswith(self._last_cell_text, start):
+                        # a looping generation repeats the same cell, do not decode it again
+                        cell, end = dict(self._last_cell), start + len(self._last_cell_text)
+                    else:
+                        try:
+                            cell, end = _DECODER.raw_decode(text, start)
+                            self._last_cell_text, self._last_cell = text[start:end], cell
+                        except ValueError:
+                            cell, end = None, None
+                    if end is not None and end <= stop:
+                        if isinstance(cell, dict) and 'bbox' in cell:
+                            completed.append(cell)
+                        else:
+                            self.skipped += 1
+                        pos = end
+                        continue
+                    self._cell_start = start
+                    self._cell_depth = self._depth
+                self._depth += 1
+            elif char == '[':
+                self._depth += 1
+            else:
+                self._depth = max(0, self._depth - 1)
+                if char == '}' and self._cell_start is not None and self._depth == self._cell_depth:
+                    cell = self._load_cell(text[self._cell_start:pos])
+                    if cell is not None:
+                        completed.append(cell)
+                    else:
+                        self.skipped += 1
+                    self._cell_start = None
+
+        # drop the text of completed cells
+        keep_from = self._cell_start if self._cell_start is not None else stop
+        self._buffer = text[keep_from:]
+        self._scan_pos = stop - keep_from
+        if self._cell_start is not None:
+            self._cell_start = 0
+        self.cells.extend(completed)
+        return completed
+
+    def _resync(self, pos):
+        if self._cell_start is not None:
+            self.skipped += 1
+            self._depth = self._cell_depth
+        self._in_string = False
+        self._escape = False
+        self._cell_start = pos
+        self._cell_depth = self._depth
+        self._depth += 1
+
+    def finish(self):
+        """
+        End of the generation: salvage the cell left open by a truncated output by closing its
+        string and brackets. Returns it in a list, empty when there is nothing to recover.
+        """
+        if self._cell_start is None:
+            return []
+        text = self._buffer[self._cell_start:]
+        self._cell_start = None
+        stack = []
+        in_string, escape = False, False
+        last_field_end = None  # last comma between two fields of the cell
+        for pos, char in enumerate(text):
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == '\\':
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in '[{':
+                stack.append(char)
+            elif char in ']}':
+                if stack:
+                    stack.pop()
+            elif char == ',' and len(stack) == 1:
+                last_field_end = pos
+
+        if escape:
+            text = text[:-1]
+        closed = text + ('"' if in_string else '')
+        closed = closed.rstrip().rstrip(',') + ''.join(_CLOSERS[char] for char in reversed(stack))
+        cell = self._load_cell(closed)
+        if cell is None and last_field_end is not None:
+            # cut inside a key or before a value, drop the unfinished field
+            cell = self._load_cell(text[:last_field_end] + '}')
+        if cell is None or not (isinstance(cell['bbox'], list) and len(cell['bbox']) == 4):
+            return []
+        self.cells.append(cell)
+        return [cell]
+
+    @staticmethod
+    def _load_cell(cell_text):
+        try:
+            cell = _DECODER.decode(cell_text)
+        except ValueError:
+            return None
+        if not isinstance(cell, dict) or 'bbox' not in cell:
+            return None
+        return cell
@@ -3,3 +3,12 @@ MAX_PIXELS=11289600
 IMAGE_FACTOR=28
 
 image_extensions = {'.jpg', '.jpeg', '.png'}
+
+# per-page artifacts written by each output profile, 'memory' writes none and keeps
+# the layout json / markdown in the page result instead
+output_profiles = {
+    'full': {'json', 'layout_image', 'md', 'md_nohf'},
+    'text': {'json', 'md'},
+    'minimal': {'json'},
+    'memory': set(),
+}
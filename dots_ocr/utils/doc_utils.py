@@ -1,6 +1,9 @@
 import fitz
 import numpy as np
 import enum
+import itertools
+import multiprocessing
+from collections import deque
 from pydantic import BaseModel, Field
 from PIL import Image
 
@@ -8,6 +11,7 @@ from PIL import Image
 class SupportedPdfParseMethod(enum.Enum):
     OCR = 'ocr'
     TXT = 'txt'
+    AUTO = 'auto'  # decided per page by `classify_pdf_page`
 
 
 class PageInfo(BaseModel):
@@ -39,22 +43,292 @@ def fitz_doc_to_image(doc, target_dpi=200, origin_dpi=None) -> dict:
     return image
 
 
-def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None) -> list:
-    images = []
-    with fitz.open(pdf_file) as doc:
-        pdf_page_num = doc.page_count
-        end_page_id = (
-            end_page_id
-            if end_page_id is not None and end_page_id >= 0
-            else pdf_page_num - 1
-        )
-        if end_page_id > pdf_page_num - 1:
-            print('end_page_id is out of range, use images length')
-            end_page_id = pdf_page_num - 1
+def open_pdf(pdf_file):
+    """Open a pdf given as a path or as bytes (e.g. an upload), without a temporary file."""
+    if isinstance(pdf_file, (bytes, bytearray, memoryview)):
+        return fitz.open(stream=pdf_file, filetype="pdf")
+    return fitz.open(pdf_file)
+
+
+def get_pdf_page_count(pdf_file) -> int:
+    with open_pdf(pdf_file) as doc:
+        return doc.page_count
+
+
+def parse_page_ranges(spec):
+    """Parse a page selection spec such as "1-5,9,12-" into inclusive ranges.
+
+    Page numbers are 1-based as shown by pdf viewers. "12-" means from page 12 to the end,
+    "-3" means the first 3 pages.
+
+    Returns:
+        list: [(first, last), ...] 1-based, last is None for open ranges
+
+    Raises:
+        ValueError: if the spec is malformed
+    """
+    ranges = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                first, last = (x.strip() for x in part.split('-', 1))
+                first = int(first) if first else 1
+                last = int(last) if last else None
+            else:
+                first = last = int(part)
+        except ValueError:
+            raise ValueError(f"invalid page selection '{part}' in '{spec}', expected e.g. '1-5,9,12-'")
+        if first < 1:
+            raise ValueError(f"invalid page range '{part}' in '{spec}', pages are numbered from 1")
+        if last is not None and last < first:
+            raise ValueError(f"invalid page range '{part}' in '{spec}', range end is before its start")
+        ranges.append((first, last))
+    if not ranges:
+        raise ValueError(f"empty page selection '{spec}'")
+    return ranges
+
+
+def select_pages(spec, page_count) -> list:
+    """Resolve a page selection spec (see `parse_page_ranges`) against a document.
+
+    Returns:
+        list: sorted, unique 0-based page ids. Pages beyond the end of the document are ignored.
+    """
+    page_ids = set()
+    for first, last in parse_page_ranges(spec):
+        last = page_count if last is None else min(last, page_count)
+        page_ids.update(range(first - 1, last))
+    if not page_ids:
+        raise ValueError(f"page selection '{spec}' selects no page of a {page_count}-page document")
+    return sorted(page_ids)
+
+
+def _resolve_page_range(pdf_page_num, start_page_id=0, end_page_id=None):
+    end_page_id = (
+        end_page_id
+        if end_page_id is not None and end_page_id >= 0
+        else pdf_page_num - 1
+    )
+    if end_page_id > pdf_page_num - 1:
+        print('end_page_id is out of range, use images length')
+        end_page_id = pdf_page_num - 1
+    return start_page_id, end_page_id
+
+
+def classify_pdf_page(page, min_chars=50, min_text_coverage=0.01, max_image_coverage=0.5) -> SupportedPdfParseMethod:
+    """Decide whether a pdf page can be parsed from its text layer.
+
+    A page goes to the model (OCR) when it has too few glyphs, its text covers almost nothing,
+    images cover a large part of it (scans, posters) or its text layer is garbled.
+
+    Args:
+        page: fitz page
+        min_chars (int): minimum number of non-blank glyphs in the text layer.
+        min_text_coverage (float): minimum fraction of the page covered by text blocks.
+        max_image_coverage (float): maximum fraction of the page covered by images.
+
+    Returns:
+        SupportedPdfParseMethod: TXT or OCR
+    """
+    page_area = abs(page.rect) or 1
+    text_area, image_area, num_chars, num_bad_chars = 0, 0, 0, 0
+    for block in page.get_text("dict")["blocks"]:
+        area = abs(fitz.Rect(block["bbox"]) & page.rect)
+        if block["type"] == 1:
+            image_area += area
+            continue
+        text_area += area
+        for line in block["lines"]:
+            for span in line["spans"]:
+                text = "".join(span["text"].split())
+                num_chars += len(text)
+                num_bad_chars += text.count("\ufffd")
+
+    if num_chars < min_chars or num_bad_chars > 0.1 * num_chars:
+        return SupportedPdfParseMethod.OCR
+    if text_area / page_area < min_text_coverage or image_area / page_area > max_image_coverage:
+        return SupportedPdfParseMethod.OCR
+    return SupportedPdfParseMethod.TXT
+
+
+def extract_text_cells(page, image_width, image_height) -> list:
+    """Build layout cells from the text layer of a pdf page.
+
+    The cells follow the model output schema consumed by `layoutjson2md`,
+    {"bbox": [x1, y1, x2, y2], "category": ..., "text": ...}, with bboxes in the pixel space
+    of the page rendered at `image_width` x `image_height`.
+
+    Categories are derived from the layout: images are `Picture`, short blocks in the top/bottom
+    margin are `Page-header`/`Page-footer`, short blocks set in a clearly larger font than the body
+    text are `Section-header`, everything else is `Text`.
+    """
+    scale_x = image_width / page.rect.width
+    scale_y = image_height / page.rect.height
+    blocks = page.get_text("dict", sort=True)["blocks"]
+
+    # body font size: the size carrying the most glyphs
+    size_chars = {}
+    for block in blocks:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                size = round(span["size"], 1)
+                size_chars[size] = size_chars.get(size, 0) + len(span["text"].strip())
+    body_size = max(size_chars, key=size_chars.get) if size_chars else 0
 
-        for index in range(0, doc.page_count):
-            if start_page_id <= index <= end_page_id:
+    cells = []
+    for block in blocks:
+        rect = fitz.Rect(block["bbox"]) & page.rect
+        if rect.is_empty:
+            continue
+        bbox = [
+            max(0, int(rect.x0 * scale_x)),
+            max(0, int(rect.y0 * scale_y)),
+            min(image_width, int(rect.x1 * scale_x)),
+            min(image_height, int(rect.y1 * scale_y)),
+        ]
+        if bbox[2] <= bbox[0] or bbox[3] <= bbox[1]:
+            continue
+        if block["type"] == 1:
+            cells.append({"bbox": bbox, "category": "Picture"})
+            continue
+
+        lines, max_size = [], 0
+        for line in block["lines"]:
+            line_text = "".join(span["text"] for span in line["spans"]).strip()
+            if line_text:
+                lines.append(line_text)
+            max_size = max([max_size] + [span["size"] for span in line["spans"]])
+        if not lines:
+            continue
+        text = " ".join(lines)
+
+        category = "Text"
+        is_short = len(text) < 200
+        if is_short and rect.y1 <= page.rect.height * 0.06:
+            category = "Page-header"
+        elif is_short and rect.y0 >= page.rect.height * 0.94:
+            category = "Page-footer"
+        elif is_short and body_size and max_size >= body_size * 1.25:
+            category = "Section-header"
+            text = f"## {text}"
+        cells.append({"bbox": bbox, "category": category, "text": text})
+    return cells
+
+
+def render_pdf_page(page, dpi=200, parse_method=SupportedPdfParseMethod.OCR):
+    """Render a pdf page and, for text-layer pages, extract its layout cells.
+
+    Args:
+        parse_method (SupportedPdfParseMethod or str): OCR never reads the text layer, TXT always
+            does, AUTO reads it when `classify_pdf_page` finds a usable text layer.
+
+    Returns:
+        tuple: (PIL image, cells), cells is None when the page has to go to the model
+    """
+    parse_method = SupportedPdfParseMethod(parse_method)
+    image = fitz_doc_to_image(page, target_dpi=dpi)
+    if parse_method == SupportedPdfParseMethod.AUTO:
+        parse_method = classify_pdf_page(page)
+    cells = None
+    if parse_method == SupportedPdfParseMethod.TXT:
+        cells = extract_text_cells(page, image.width, image.height)
+    return image, cells
+
+
+# per-process state of the rasterization pool, the document is opened once per worker
+_worker_doc = None
+_worker_dpi = 200
+_worker_parse_method = SupportedPdfParseMethod.OCR
+
+
+def _init_render_worker(pdf_file, dpi, parse_method):
+    global _worker_doc, _worker_dpi, _worker_parse_method
+    _worker_doc = open_pdf(pdf_file)
+    _worker_dpi = dpi
+    _worker_parse_method = parse_method
+
+
+def _render_page_in_worker(page_idx):
+    image, cells = render_pdf_page(_worker_doc[page_idx], dpi=_worker_dpi, parse_method=_worker_parse_method)
+    # raw buffer pickles much cheaper than a PIL image
+    return page_idx, image.mode, image.size, image.tobytes(), cells
+
+
+def _iter_pdf_pages_pool(pdf_file, page_ids, dpi, num_workers, parse_method):
+    """Render `page_ids` in a pool of worker processes, yielding pages in order.
+
+    At most 2 * num_workers pages are in flight, so the pool never runs far ahead of the consumer.
+    """
+    page_ids = iter(page_ids)
+    # spawn: the parser renders from a background thread, forking a threaded process is unsafe
+    ctx = multiprocessing.get_context("spawn")
+    pool = ctx.Pool(num_workers, initializer=_init_render_worker, initargs=(pdf_file, dpi, parse_method))
+    pending = deque()
+    try:
+        for page_idx in itertools.islice(page_ids, 2 * num_workers):
+            pending.append(pool.apply_async(_render_page_in_worker, (page_idx,)))
+        while pending:
+            page_idx, mode, size, data, cells = pending.popleft().get()
+            for next_page_idx in itertools.islice(page_ids, 1):
+                pending.append(pool.apply_async(_render_page_in_worker, (next_page_idx,)))
+            yield page_idx, Image.frombytes(mode, size, data), cells
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def iter_pdf_pages(pdf_file, dpi=200, start_page_id=0, end_page_id=None, num_workers=1, page_ids=None,
+                   parse_method=SupportedPdfParseMethod.OCR):
+    """Lazily render pdf pages, one page at a time.
+
+    Unlike `load_images_from_pdf`, only the pages being rendered are held in memory,
+    so the caller decides how many rendered pages are alive at once.
+
+    Args:
+        pdf_file (str or bytes): path or content of the pdf.
+        num_workers (int): number of rasterization processes. PyMuPDF rendering is CPU-bound,
+            with num_workers > 1 every worker opens the document once and pages are rendered in parallel.
+        page_ids (list, optional): 0-based ids of the pages to render, overrides start_page_id/end_page_id.
+            Other pages are never rendered.
+        parse_method (SupportedPdfParseMethod or str): see `render_pdf_page`.
+
+    Yields:
+        tuple: (page_idx, PIL image, cells) in page order, page_idx is the index of the page in the pdf,
+            cells are the text-layer layout cells or None if the page needs OCR
+    """
+    parse_method = SupportedPdfParseMethod(parse_method)
+    with open_pdf(pdf_file) as doc:
+        if page_ids is None:
+            start_page_id, end_page_id = _resolve_page_range(doc.page_count, start_page_id, end_page_id)
+            page_ids = range(start_page_id, end_page_id + 1)
+        else:
+            page_ids = [index for index in page_ids if 0 <= index < doc.page_count]
+        num_workers = min(num_workers or 1, len(page_ids))
+        if num_workers <= 1:
+            for index in page_ids:
                 page = doc[index]
-                img = fitz_doc_to_image(page, target_dpi=dpi)
-                images.append(img)
-    return images
\ No newline at end of file
+                image, cells = render_pdf_page(page, dpi=dpi, parse_method=parse_method)
+                yield index, image, cells
+            return
+
+    yield from _iter_pdf_pages_pool(pdf_file, page_ids, dpi, num_workers, parse_method)
+
+
+def iter_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None, num_workers=1, page_ids=None):
+    """Same as `iter_pdf_pages` without text-layer cells, yields (page_idx, PIL image)."""
+    for index, image, _ in iter_pdf_pages(
+        pdf_file, dpi=dpi, start_page_id=start_page_id, end_page_id=end_page_id,
+        num_workers=num_workers, page_ids=page_ids,
+    ):
+        yield index, image
+
+
+def load_images_from_pdf(pdf_file, dpi=200, start_page_id=0, end_page_id=None, num_workers=1) -> list:
+    return [
+        img for _, img in iter_images_from_pdf(
+            pdf_file, dpi=dpi, start_page_id=start_page_id, end_page_id=end_page_id, num_workers=num_workers
+        )
+    ]
@@ -0,0 +1,127 @@
+import os
+import json
+import math
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from dots_ocr.utils.consts import IMAGE_FACTOR, MIN_PIXELS, MAX_PIXELS
+from dots_ocr.utils.doc_utils import open_pdf, select_pages
+from dots_ocr.utils.image_utils import smart_resize, get_fitz_equivalent_size
+
+
+def page_input_size(width, height, min_pixels=None, max_pixels=None):
+    """(input_width, input_height) of the image the model sees for a width x height page."""
+    if min_pixels or max_pixels:  # fetch_image resize
+        height, width = smart_resize(
+            height, width, factor=IMAGE_FACTOR,
+            min_pixels=min_pixels or MIN_PIXELS, max_pixels=max_pixels or MAX_PIXELS,
+        )
+    height, width = smart_resize(height, width)  # server side resize
+    return width, height
+
+
+def visual_tokens(input_width, input_height):
+    """Image tokens of a model input, one per 28x28 patch after the 2x2 merge."""
+    return (input_width // IMAGE_FACTOR) * (input_height // IMAGE_FACTOR)
+
+
+def _pdf_render_size(page, dpi):
+    # same size as the pixmap of doc_utils.fitz_doc_to_image, without rendering it
+    def _size(target_dpi):
+        scale = target_dpi / 72
+        return (
+            max(1, math.ceil(page.rect.width * scale - 1e-3)),
+            max(1, math.ceil(page.rect.height * scale - 1e-3)),
+        )
+
+    width, height = _size(dpi)
+    if width > 4500 or height > 4500:
+        width, height = _size(72)
+    return width, height
+
+
+def _is_pdf(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return b'%PDF' in bytes(source[:1024])
+    return str(source).lower().endswith('.pdf')
+
+
+def estimate_pages(source, dpi=200, min_pixels=None, max_pixels=None, pages=None, parse_method='ocr',
+                   fitz_preprocess=True):
+    """
+    Size and visual tokens of the model input of every page of a pdf or an image, read from the
+    pdf page boxes / image header without rendering anything.
+
+    Args:
+        source: path or bytes of a pdf or an image.
+        pages: 1-based pdf page selection, see `doc_utils.select_pages`.
+        parse_method: with 'txt' pdf pages come from the text layer and cost no tokens;
+            'auto' is decided per page while parsing, counted as 'ocr' here (upper bound).
+        fitz_preprocess: images are upsampled to `dpi` like `DotsOCRParser.parse_image` does.
+
+    Returns:
+        list of dicts: page_no (0-based), width, height (rendered page), input_width, input_height,
+        visual_tokens
+    """
+    sizes = []
+    if _is_pdf(source):
+        with open_pdf(source) as doc:
+            page_ids = select_pages(pages, doc.page_count) if pages else range(doc.page_count)
+            for page_no in page_ids:
+                sizes.append((page_no, _pdf_render_size(doc[page_no], dpi)))
+    else:
+        with Image.open(BytesIO(source) if isinstance(source, (bytes, bytearray)) else source) as image:
+            size = get_fitz_equivalent_size(image, target_dpi=dpi) if fitz_preprocess else image.size
+        sizes.append((0, size))
+        parse_method = 'ocr'
+
+    estimates = []
+    for page_no, (width, height) in sizes:
+        input_width, input_height = page_input_size(width, height, min_pixels, max_pixels)
+        estimates.append({
+            'page_no': page_no,
+            'width': width,
+            'height': height,
+            'input_width': input_width,
+            'input_height': input_height,
+            'visual_tokens': 0 if parse_method == 'txt' else visual_tokens(input_width, input_height),
+        })
+    return estimates
+
+
+def load_throughput(path):
+    """Visual tokens per second recorded in a throughput file, None if there is none yet."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return float(json.load(f)['tokens_per_s'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def record_throughput(path, tokens, seconds, alpha=0.3):
+    """
+    Fold the throughput of a run (visual tokens parsed in `seconds` of wall time) into a json
+    throughput file, as an exponentially weighted average of the runs. Returns the new tokens/s.
+    """
+    if tokens <= 0 or seconds <= 0:
+        return load_throughput(path)
+    rate = tokens / seconds
+    previous = load_throughput(path)
+    if previous is not None:
+        rate = previous + alpha * (rate - previous)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'tokens_per_s': rate, 'updated_at': time.time()}, f)
+    os.replace(tmp_path, path)
+    return rate
+
+
+def result_visual_tokens(results):
+    """Visual tokens the model read for parsed page results, text-layer pages cost none."""
+    return sum(
+        visual_tokens(result['input_width'], result['input_height'])
+        for result in results if result.get('parse_method', 'ocr') == 'ocr'
+    )
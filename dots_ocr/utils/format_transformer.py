@@ -2,6 +2,7 @@ import os
 import sys
 import json
 import re
+import hashlib
 
 from PIL import Image
 from dots_ocr.utils.image_utils import PILimage_to_base64
@@ -142,7 +143,59 @@ def clean_text(text: str) -> str:
     return text
 
 
-def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_page_hf: bool = False) -> str:
+def _crop_picture(image: Image.Image, cell: dict) -> Image.Image:
+    x1, y1, x2, y2 = [int(coord) for coord in cell['bbox']]
+    return image.crop((x1, y1, x2, y2))
+
+
+def encode_picture_crops(image: Image.Image, cells: list) -> dict:
+    """
+    Crops every Picture cell once and encodes it as a base64 PNG data URI.
+    
+    Returns:
+        dict: {cell index: data URI}, to pass as `picture_refs` to `layoutjson2md`.
+    """
+    return {
+        i: PILimage_to_base64(_crop_picture(image, cell))
+        for i, cell in enumerate(cells) if cell['category'] == 'Picture'
+    }
+
+
+def save_picture_crops(image: Image.Image, cells: list, images_dir: str, url_prefix: str = 'images') -> dict:
+    """
+    Writes every Picture cell crop as a content-addressed PNG file `<images_dir>/<sha256>.png`.
+    
+    Crops with identical pixels (logos, repeated figures) share one file, a crop whose file
+    already exists is not encoded again.
+    
+    Args:
+        image: A PIL Image object.
+        cells: A list of dictionaries, each representing a layout cell.
+        images_dir: Directory of the picture files.
+        url_prefix: Prefix of the returned references, relative to the markdown file.
+        
+    Returns:
+        dict: {cell index: "<url_prefix>/<sha256>.png"}, to pass as `picture_refs` to `layoutjson2md`.
+    """
+    picture_refs = {}
+    for i, cell in enumerate(cells):
+        if cell['category'] != 'Picture':
+            continue
+        image_crop = _crop_picture(image, cell)
+        digest = hashlib.sha256(f"{image_crop.mode}:{image_crop.width}x{image_crop.height}:".encode())
+        digest.update(image_crop.tobytes())
+        file_name = f"{digest.hexdigest()}.png"
+        file_path = os.path.join(images_dir, file_name)
+        if not os.path.exists(file_path):
+            os.makedirs(images_dir, exist_ok=True)
+            tmp_path = f"{file_path}.{os.getpid()}.{id(image_crop)}.tmp"
+            image_crop.save(tmp_path, format='PNG')
+            os.replace(tmp_path, file_path)
+        picture_refs[i] = f"{url_prefix}/{file_name}"
+    return picture_refs
+
+
+def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_page_hf: bool = False, picture_refs: dict = None) -> str:
     """
     Converts a layout JSON format to Markdown.
     
@@ -153,6 +206,8 @@ def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_pa
         cells: A list of dictionaries, each representing a layout cell.
         text_key: The key for the text field in the cell dictionary.
         no_page_header_footer: If True, skips page headers and footers.
+        picture_refs: Optional {cell index: URL} of the Picture cells, from `encode_picture_crops`
+            or `save_picture_crops`. Pictures without a reference are cropped and inlined as base64.
         
     Returns:
         str: The text in Markdown format.
@@ -167,9 +222,12 @@ def layoutjson2md(image: Image.Image, cells: list, text_key: str = 'text', no_pa
             continue
         
         if cell['category'] == 'Picture':
-            image_crop = image.crop((x1, y1, x2, y2))
-            image_base64 = PILimage_to_base64(image_crop)
-            text_items.append(f"![]({image_base64})")
+            if picture_refs is not None and i in picture_refs:
+                text_items.append(f"![]({picture_refs[i]})")
+            else:
+                image_crop = image.crop((x1, y1, x2, y2))
+                image_base64 = PILimage_to_base64(image_crop)
+                text_items.append(f"![]({image_base64})")
         elif cell['category'] == 'Formula':
             text_items.append(get_formula_in_markdown(text))
         else:            
@@ -0,0 +1,125 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class ConcurrencyGovernor:
+    """
+    Process-wide limit of the pages in flight at one inference backend.
+
+    Every parser instance and request talking to the same backend shares one governor (see
+    `get_governor`), so concurrent documents cannot together flood the server: each model call
+    takes a slot, callers beyond `max_inflight` wait. Waiting callers are grouped (one group per
+    document) and a freed slot goes to the groups in turn, so the pages of many documents
+    interleave instead of a large document holding every slot until it is done.
+
+    max_inflight: None or <= 0 for no limit, slots are still counted for the stats.
+    """
+
+    def __init__(self, max_inflight=None):
+        self.max_inflight = max_inflight
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._waiting = OrderedDict()  # group -> deque of tickets, in turn order
+        self._granted = set()
+        # stats
+        self._acquired = 0
+        self._waited = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._max_queue_depth = 0
+
+    def set_limit(self, max_inflight):
+        with self._cond:
+            self.max_inflight = max_inflight
+            self._grant_free_slots()
+
+    def _has_free_slot(self):
+        return not self.max_inflight or self.max_inflight <= 0 or self._inflight < self.max_inflight
+
+    def _queue_depth(self):
+        return sum(len(tickets) for tickets in self._waiting.values())
+
+    def _grant_free_slots(self):
+        while self._waiting and self._has_free_slot():
+            # round robin: the first group gets the slot and goes to the back of the line
+            group, tickets = self._waiting.popitem(last=False)
+            self._granted.add(tickets.popleft())
+            self._inflight += 1
+            if tickets:
+                self._waiting[group] = tickets
+        self._cond.notify_all()
+
+    def acquire(self, group=None):
+        """Take a slot, waiting for one if the limit is reached. Returns the seconds waited."""
+        with self._cond:
+            self._acquired += 1
+            if not self._waiting and self._has_free_slot():
+                self._inflight += 1
+                return 0.0
+            ticket = object()
+            self._waiting.setdefault(group, deque()).append(ticket)
+            self._max_queue_depth = max(self._max_queue_depth, self._queue_depth())
+            start = time.perf_counter()
+            self._cond.wait_for(lambda: ticket in self._granted)
+            self._granted.discard(ticket)
+            waited = time.perf_counter() - start
+            self._waited += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            return waited
+
+    def release(self):
+        with self._cond:
+            self._inflight -= 1
+            self._grant_free_slots()
+
+    @contextmanager
+    def slot(self, group=None):
+        self.acquire(group)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'max_inflight': self.max_inflight,
+                'inflight': self._inflight,
+                'queue_depth': self._queue_depth(),
+                'waiting_groups': len(self._waiting),
+                'max_queue_depth': self._max_queue_depth,
+                'acquired': self._acquired,
+                'waited': self._waited,
+                'wait_seconds_total': round(self._wait_seconds, 3),
+                'wait_seconds_avg': round(self._wait_seconds / self._waited, 3) if self._waited else 0.0,
+                'wait_seconds_max': round(self._max_wait_seconds, 3),
+            }
+
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_governor(backend, max_inflight=None):
+    """
+    The governor of a backend ('hf', or the vllm server url), created on first use.
+    A max_inflight given here replaces the limit of an existing governor.
+    """
+    with _governors_lock:
+        governor = _governors.get(backend)
+        if governor is None:
+            governor = _governors[backend] = ConcurrencyGovernor(max_inflight)
+            return governor
+    if max_inflight is not None and max_inflight != governor.max_inflight:
+        governor.set_limit(max_inflight)
+    return governor
+
+
+def governor_stats() -> dict:
+    """Stats of every backend governor, keyed by backend."""
+    with _governors_lock:
+        governors = dict(_governors)
+    return {backend: governor.stats() for backend, governor in sorted(governors.items())}
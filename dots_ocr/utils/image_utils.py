@@ -64,13 +64,59 @@ def smart_resize(
 
 
 
-def PILimage_to_base64(image, format='PNG'):
+def PILimage_to_base64(image, format='PNG', quality=None, compress_level=None, lossless=False, grayscale=False):
+    """Encode a PIL image as a base64 data URI.
+
+    Args:
+        format (str): PNG, WEBP or JPEG.
+        quality (int, optional): JPEG/WEBP quality. For lossless WEBP it trades encode speed for size (0 fastest).
+        compress_level (int, optional): PNG zlib level 0-9, lower is faster and larger (PIL default 6).
+        lossless (bool): lossless WEBP.
+        grayscale (bool): encode a single channel, for monochrome scans.
+    """
+    format = format.upper()
+    if format == 'JPG':
+        format = 'JPEG'
+    if grayscale:
+        image = image.convert('L')
+    save_kwargs = {}
+    if format == 'PNG' and compress_level is not None:
+        save_kwargs['compress_level'] = compress_level
+    elif format == 'WEBP':
+        save_kwargs['lossless'] = lossless
+        if quality is not None:
+            save_kwargs['quality'] = quality
+    elif format == 'JPEG' and quality is not None:
+        save_kwargs['quality'] = quality
     buffered = BytesIO()
-    image.save(buffered, format=format)
+    image.save(buffered, format=format, **save_kwargs)
     base64_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
     return f"data:image/{format.lower()};base64,{base64_str}"
 
 
+# wire formats of the images sent to the inference server
+image_transport_formats = {
+    'png': {'format': 'PNG'},
+    'webp_lossless': {'format': 'WEBP', 'lossless': True},
+    'webp': {'format': 'WEBP'},
+    'jpeg': {'format': 'JPEG'},
+}
+
+
+def get_image_encoding(image_format='png', quality=None, compress_level=None, grayscale=False) -> dict:
+    """Keyword arguments of `PILimage_to_base64` for a transport format name of `image_transport_formats`."""
+    if image_format not in image_transport_formats:
+        raise ValueError(f"image_format {image_format} not supported, supported formats are {list(image_transport_formats)}")
+    encoding = dict(image_transport_formats[image_format])
+    if quality is not None:
+        encoding['quality'] = quality
+    if compress_level is not None:
+        encoding['compress_level'] = compress_level
+    if grayscale:
+        encoding['grayscale'] = True
+    return encoding
+
+
 def to_rgb(pil_image: Image.Image) -> Image.Image:
     if pil_image.mode == 'RGBA':
         white_background = Image.new("RGB", pil_image.size, (255, 255, 255))
@@ -194,3 +240,67 @@ def get_image_by_fitz_doc(image, target_dpi=200):
     image_fitz = fitz_doc_to_image(page, target_dpi=target_dpi, origin_dpi=origin_dpi)
 
     return image_fitz
+
+
+def get_fitz_equivalent_size(image, target_dpi=200, origin_dpi=None) -> Tuple[int, int]:
+    """The (width, height) `get_image_by_fitz_doc` produces for `image`, computed without rendering.
+
+    Mirrors MuPDF: the image becomes a page of width * 72 / dpi points, where dpi is the horizontal
+    resolution of the file (96 when absent, 72 when outside [72, 4800]); the page is rendered at
+    `target_dpi`, or at 72 dpi if that exceeds 4500 pixels on a side.
+
+    Args:
+        image: PIL image, always treated as 96 dpi since the fitz route re-encodes it without resolution.
+        origin_dpi: resolution of the source file, for images loaded from disk.
+    """
+    xres = 96
+    if origin_dpi:
+        xres = round(origin_dpi[0])
+        if xres < 72 or xres > 4800:
+            xres = 72
+
+    def _render_size(dpi):
+        # MuPDF rounds the rendered rect outwards with a small tolerance
+        return (
+            max(1, math.ceil(image.width * dpi / xres - 1e-3)),
+            max(1, math.ceil(image.height * dpi / xres - 1e-3)),
+        )
+
+    width, height = _render_size(target_dpi)
+    if width > 4500 or height > 4500:
+        width, height = _render_size(72)
+    return width, height
+
+
+def get_image_by_resample(image, target_dpi=200, min_pixels=None, max_pixels=None) -> Image.Image:
+    """Fast equivalent of `get_image_by_fitz_doc` followed by `fetch_image`.
+
+    Computes the same effective dpi rescale and the model input size, then resizes once,
+    instead of encoding PNG, converting to PDF and rasterizing a pixmap.
+    """
+    origin_dpi = None
+    if not isinstance(image, Image.Image):
+        assert isinstance(image, str)
+        _, file_ext = os.path.splitext(image)
+        assert file_ext in {'.jpg', '.jpeg', '.png'}
+        if image.startswith("http://") or image.startswith("https://"):
+            with requests.get(image, stream=True) as response:
+                response.raise_for_status()
+                image = Image.open(BytesIO(response.content))
+        else:
+            image = Image.open(image)
+        origin_dpi = image.info.get('dpi', None)
+    image = to_rgb(image)
+
+    width, height = get_fitz_equivalent_size(image, target_dpi=target_dpi, origin_dpi=origin_dpi)
+    if min_pixels or max_pixels:
+        height, width = smart_resize(
+            height,
+            width,
+            factor=IMAGE_FACTOR,
+            min_pixels=min_pixels or MIN_PIXELS,
+            max_pixels=max_pixels or MAX_PIXELS,
+        )
+    if (width, height) == image.size:
+        return image
+    return image.resize((width, height), resample=Image.Resampling.BICUBIC)
@@ -0,0 +1,144 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(image, prompt, **params) -> str:
+    """Content address of an inference request.
+
+    Args:
+        image: the PIL image exactly as it is sent to the model (after resizing).
+        prompt: the prompt text.
+        params: everything else that changes the model output, e.g. model_name, temperature,
+            top_p, max tokens.
+
+    Returns:
+        str: sha256 hex digest
+    """
+    h = hashlib.sha256()
+    h.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+    h.update(image.tobytes())
+    h.update(prompt.encode('utf-8'))
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return h.hexdigest()
+
+
+class InferenceCache:
+    """Two-tier cache of raw model responses keyed by `make_cache_key`.
+
+    An in-memory LRU holds the most recent responses, an optional on-disk tier keeps up to
+    `max_disk_bytes` of responses across runs and evicts the least recently used entries.
+    Thread-safe, one instance can be shared by several parsers.
+    """
+
+    def __init__(self, cache_dir=None, max_memory_entries=256, max_disk_bytes=1 << 30):
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> response
+        self._disk = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'disk_evictions': 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._load_disk_index()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _load_disk_index(self):
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                stat = os.stat(os.path.join(root, name))
+                entries.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._counters['disk_evictions'] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _remember(self, key, response):
+        if self.max_memory_entries <= 0:
+            return
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached response, or None on a miss."""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return self._memory[key]
+            on_disk = key in self._disk
+
+        response = None
+        if on_disk:
+            path = self._path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    response = json.load(f)['response']
+                os.utime(path)
+            except (OSError, ValueError, KeyError):
+                response = None
+
+        with self._lock:
+            if response is None:
+                if on_disk and key in self._disk:  # unreadable entry
+                    self._disk_bytes -= self._disk.pop(key)
+                self._counters['misses'] += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._counters['disk_hits'] += 1
+            self._remember(key, response)
+            return response
+
+    def put(self, key, response):
+        if response is None:
+            return
+        with self._lock:
+            self._remember(key, response)
+        if not self.cache_dir:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'response': response}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+            self._evict_disk()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats['hits'] = stats['memory_hits'] + stats['disk_hits']
+            stats['memory_entries'] = len(self._memory)
+            stats['disk_entries'] = len(self._disk)
+            stats['disk_bytes'] = self._disk_bytes
+        return stats
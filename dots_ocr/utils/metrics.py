@@ -0,0 +1,29 @@
+import threading
+from collections import defaultdict
+
+
+class Counters:
+    """Process-wide, thread-safe event counters, e.g. `counters.inc('repetition_stops.vllm')`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self._values[name] += value
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self._values.items()))
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+counters = Counters()
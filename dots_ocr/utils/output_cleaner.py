@@ -17,6 +17,8 @@ from dataclasses import dataclass
 from collections import Counter
 import traceback
 
+from dots_ocr.utils.output_repair import repair_layout_output
+
 
 @dataclass
 class CleanedData:
@@ -416,6 +418,9 @@ class OutputCleaner:
         return cleaned_data
 
     def clean_model_output(self, model_output: str):
+        if not isinstance(model_output, list):
+            # single pass, replaces the regex pipeline of clean_string_data
+            return repair_layout_output(str(model_output))
         try:
             # Select cleaning method based on data type
             if isinstance(model_output, list):
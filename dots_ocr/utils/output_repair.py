@@ -0,0 +1,77 @@
+import logging
+from collections import Counter
+
+from dots_ocr.utils.cell_stream import CellStreamParser
+
+logger = logging.getLogger(__name__)
+
+
+def remove_duplicate_cells(cells, min_text_repeats=5):
+    """
+    Drop the repeats of a looping generation, keeping the first occurrence: cells whose
+    (category, text) appears at least `min_text_repeats` times, and cells whose bbox appears twice.
+    Same rules as `OutputCleaner.remove_duplicate_category_text_pairs_and_bbox`.
+    """
+    if len(cells) <= 1:
+        return cells
+    pair_counts = Counter(
+        (cell['category'], cell['text']) for cell in cells if 'category' in cell and 'text' in cell
+    )
+    repeated_pairs = {pair for pair, count in pair_counts.items() if count >= min_text_repeats}
+
+    kept, seen_pairs, seen_bboxes = [], set(), set()
+    for cell in cells:
+        duplicate = False
+        if repeated_pairs and 'category' in cell and 'text' in cell:
+            pair = (cell['category'], cell['text'])
+            duplicate = pair in seen_pairs
+            if pair in repeated_pairs:
+                seen_pairs.add(pair)
+        bbox = cell.get('bbox')
+        if isinstance(bbox, list) and bbox:
+            bbox = tuple(bbox)
+            try:
+                duplicate = duplicate or bbox in seen_bboxes
+                seen_bboxes.add(bbox)
+            except TypeError:  # nested lists, not comparable
+                pass
+        if not duplicate:
+            kept.append(cell)
+    if len(kept) < len(cells):
+        logger.debug("removed %d duplicate cells, %d left", len(cells) - len(kept), len(kept))
+    return kept
+
+
+def repair_layout_output(text, stats=None):
+    """
+    Recover the layout cells of a model output that is not valid json, in a single pass.
+
+    Completed cells are kept in order, whatever breaks the json around them: truncation, missing
+    commas or opening bracket, unescaped quotes or raw control characters in a text (see
+    `CellStreamParser`). A truncated last cell is dropped, unless it is the only one, then it is
+    closed and kept. Repeats of a looping generation are removed.
+
+    Args:
+        stats (dict): optional, filled with the number of 'cells' returned, 'skipped' objects that
+            could not be loaded, 'salvaged' truncated cells and 'duplicates' removed.
+
+    Returns:
+        list: layout cells
+    """
+    parser = CellStreamParser()
+    cells = parser.feed(text)
+    salvaged = [] if cells else parser.finish()
+    repaired = remove_duplicate_cells(cells or salvaged)
+
+    if stats is not None:
+        stats.update({
+            'cells': len(repaired),
+            'skipped': parser.skipped,
+            'salvaged': len(salvaged),
+            'duplicates': len(cells or salvaged) - len(repaired),
+        })
+    logger.debug(
+        "repaired model output of %d chars: %d cells, %d skipped, %d salvaged",
+        len(text), len(repaired), parser.skipped, len(salvaged),
+    )
+    return repaired
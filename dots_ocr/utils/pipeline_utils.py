@@ -0,0 +1,88 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+_END = object()
+
+
+def prefetch_iter(iterable, window=4):
+    """Consume `iterable` in a background thread, keeping at most `window` items buffered.
+
+    Used to overlap page rendering with inference: while the consumer works on page N,
+    the producer thread is already rendering pages N+1 ... N+window.
+
+    Args:
+        iterable: any iterable, typically a lazy page generator.
+        window (int): max number of produced but not yet consumed items.
+
+    Yields:
+        the items of `iterable`, in order. Exceptions raised by the producer are re-raised here.
+    """
+    if window is None or window <= 0:
+        yield from iterable
+        return
+
+    buffer = queue.Queue(maxsize=window)
+    stop = threading.Event()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except BaseException as e:
+            _put((_END, e))
+            return
+        _put((_END, None))
+
+    producer = threading.Thread(target=_produce, name="prefetch_iter", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _END:
+                if error is not None:
+                    raise error
+                return
+            yield item
+            del item
+    finally:
+        # consumer stopped early (exception / generator closed), let the producer exit
+        stop.set()
+        producer.join()
+
+
+def imap_unordered_bounded(func, tasks, num_thread):
+    """A `ThreadPool.imap_unordered` that never pulls more than `num_thread` tasks ahead.
+
+    `ThreadPool.imap_unordered` drains its input eagerly, which would render every page of a
+    lazily produced pdf up front. Here a new task is only taken from `tasks` once a running
+    one has finished, and a task's arguments are dropped as soon as `func` returns.
+
+    Yields:
+        results of `func`, in completion order
+    """
+    num_thread = max(1, num_thread)
+    with ThreadPoolExecutor(max_workers=num_thread) as executor:
+        pending = set()
+        for task in tasks:
+            pending.add(executor.submit(func, task))
+            del task
+            if len(pending) >= num_thread:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
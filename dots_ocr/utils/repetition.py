@@ -0,0 +1,120 @@
+from dots_ocr.utils.metrics import counters
+from dots_ocr.utils.cell_stream import CellStreamParser
+
+
+class RepetitionDetector:
+    """
+    Detects a degenerate generation while it is being produced.
+
+    The model sometimes loops, emitting the same line or cell until it runs out of tokens; the
+    output cleaner drops the repeats afterwards. Feeding the streamed text to this detector lets
+    the backends stop as soon as the loop is evident and hand the partial output to the cleaner.
+
+    Two signals, both conservative so regular pages are never cut:
+        - periodic tail: the last `min_repeat_chars` characters (and at least `min_repeats` periods)
+          are one unit of at most `max_period` characters repeated, e.g. a line or a cell without bbox.
+        - repeated cells: `max_repeated_cells` consecutive layout cells whose bbox already appeared.
+          Repeated text alone is not a loop: tables, forms and ledgers hold many cells of the same
+          value ("0.00") in different places.
+
+    Args:
+        check_interval (int): characters fed between two periodicity checks.
+    """
+
+    def __init__(self, min_repeat_chars=3000, min_repeats=20, max_period=300, max_repeated_cells=10, check_interval=64):
+        self.min_repeat_chars = min_repeat_chars
+        self.min_repeats = min_repeats
+        self.max_period = max_period
+        self.max_repeated_cells = max_repeated_cells
+        self.check_interval = check_interval
+
+        # tail of the generated text, enough for the periodicity check
+        self._text = ""
+        self.triggered = None  # reason once degenerate: 'periodic' or 'repeated_cells'
+        self._unchecked = 0
+        self._cells = CellStreamParser()
+        self._seen_bboxes = set()
+        self._repeated_run = 0
+
+    def feed(self, chunk):
+        """Append generated text, returns True once the generation is degenerate."""
+        if self.triggered or not chunk:
+            return self.triggered is not None
+        self._text += chunk
+        for cell in self._cells.feed(chunk):
+            self._on_cell(cell)
+        self._unchecked += len(chunk)
+        if not self.triggered and self._unchecked >= self.check_interval:
+            self._unchecked = 0
+            if self._is_periodic_tail():
+                self.triggered = 'periodic'
+        keep = max(self.min_repeat_chars, self.max_period * self.min_repeats) + self.max_period + 64
+        if len(self._text) > keep + 4096:  # amortize the copy
+            self._text = self._text[-keep:]
+        return self.triggered is not None
+
+    def _is_periodic_tail(self):
+        text = self._text
+        probe = 32
+        for period in range(1, self.max_period + 1):
+            span = max(self.min_repeat_chars, period * self.min_repeats)
+            if len(text) < span + period:
+                break
+            # cheap rejection on the last characters before comparing the whole span
+            if text[-probe:] != text[-probe - period:-period]:
+                continue
+            if text[-span:] == text[-span - period:-period]:
+                return True
+        return False
+
+    def _on_cell(self, cell):
+        if self.triggered:
+            return
+        bbox = cell.get('bbox')
+        bbox = tuple(bbox) if isinstance(bbox, list) else None
+        repeated = bbox is not None and bbox in self._seen_bboxes
+        if bbox is not None:
+            self._seen_bboxes.add(bbox)
+        self._repeated_run = self._repeated_run + 1 if repeated else 0
+        if self._repeated_run >= self.max_repeated_cells:
+            self.triggered = 'repeated_cells'
+
+
+def make_repetition_stopping_criteria(tokenizer, prompt_length, batch_size, decode_every=16, **detector_kwargs):
+    """
+    transformers StoppingCriteria running one RepetitionDetector per generated sequence.
+
+    Args:
+        prompt_length (int): length of the (left padded) input ids, generated tokens start there.
+        decode_every (int): tokens accumulated before decoding them for the detector.
+
+    Returns:
+        (criteria, detectors): the StoppingCriteriaList to pass to `generate` and the per-row detectors.
+    """
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList
+
+    detectors = [RepetitionDetector(**detector_kwargs) for _ in range(batch_size)]
+
+    class _RepetitionStoppingCriteria(StoppingCriteria):
+        def __init__(self):
+            self.offsets = [prompt_length] * batch_size
+
+        def __call__(self, input_ids, scores, **kwargs):
+            stop = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+            for row, detector in enumerate(detectors):
+                if input_ids.shape[1] - self.offsets[row] >= decode_every:
+                    chunk = tokenizer.decode(input_ids[row, self.offsets[row]:], skip_special_tokens=True)
+                    self.offsets[row] = input_ids.shape[1]
+                    detector.feed(chunk)
+                stop[row] = detector.triggered is not None
+            return stop
+
+    return StoppingCriteriaList([_RepetitionStoppingCriteria()]), detectors
+
+
+def record_repetition_stop(backend, detector):
+    """Count an early stop in the process metrics, per backend and per reason."""
+    counters.inc('repetition_stops')
+    counters.inc(f'repetition_stops.{backend}')
+    counters.inc(f'repetition_stops.{detector.triggered}')
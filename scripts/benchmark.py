@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for the dots.ocr pipeline
+
+Usage:
+    python scripts/benchmark.py client --requests 500 --threads 16
+    python scripts/benchmark.py encode
+    python scripts/benchmark.py preprocess
+    python scripts/benchmark.py overlay
+    python scripts/benchmark.py tiny-model --output ./weights/tiny
+    python scripts/benchmark.py hf-batch --model_path ./weights/DotsOCR --batch_sizes 1 4
+    python scripts/benchmark.py hf-cpu --model_path ./weights/DotsOCR --threads 4 8
+    python scripts/benchmark.py repair
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class _StubChatHandler(BaseHTTPRequestHandler):
+    """Minimal OpenAI-compatible /v1/chat/completions endpoint answering instantly"""
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "model",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": '[{"bbox": [0, 0, 10, 10], "category": "Text", "text": "stub"}]'},
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubChatHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _run(fn, num_requests, num_threads):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(num_threads) as executor:
+        list(executor.map(lambda _: fn(), range(num_requests)))
+    return time.perf_counter() - start
+
+
+def bench_client(args):
+    """Per-request overhead of a new OpenAI client per page vs the pooled client"""
+    from PIL import Image
+    from openai import OpenAI
+    from dots_ocr.model.inference import inference_with_vllm, build_messages
+
+    server = start_stub_server()
+    port = server.server_address[1]
+    image = Image.new("RGB", (28, 28), "white")  # tiny payload, measure the client only
+
+    def new_client_per_request():
+        client = OpenAI(api_key="0", base_url=f"http://127.0.0.1:{port}/v1")
+        client.chat.completions.create(messages=build_messages(image, "p"), model="model")
+
+    def pooled_client():
+        inference_with_vllm(image, "p", ip="127.0.0.1", port=port, model_name="model", max_connections=args.threads)
+
+    for name, fn in [("new client per request", new_client_per_request), ("pooled client", pooled_client)]:
+        fn()  # warm up
+        elapsed = _run(fn, args.requests, args.threads)
+        print(f"{name:>24}: {args.requests / elapsed:8.1f} req/s, {elapsed / args.requests * 1000 * args.threads:7.2f} ms/request per thread")
+    server.shutdown()
+
+
+def synthetic_pages(max_pixels=1280 * 28 * 28):
+    """A born-digital text page and a noisy grayscale scan, A4 resized like the model input"""
+    import random
+    from PIL import Image, ImageDraw, ImageFilter
+    from dots_ocr.utils.image_utils import smart_resize
+
+    height, width = smart_resize(2339, 1653, max_pixels=max_pixels)
+    rng = random.Random(0)
+
+    text_page = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(text_page)
+    for y in range(40, height - 40, 18):
+        words = " ".join("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(2, 9))) for _ in range(14))
+        draw.text((40, y), words, fill=(0, 0, 0))
+    draw.rectangle((width // 2, height // 3, width - 60, height // 2), fill=(200, 60, 60))
+
+    noise = Image.effect_noise((width, height), 24).convert("L")
+    scan_page = Image.merge("RGB", [Image.blend(text_page.convert("L"), noise, 0.25).filter(ImageFilter.SMOOTH)] * 3)
+    return {"text": text_page, "scan": scan_page}
+
+
+def bench_encode(args):
+    """Encode time and payload size of each transport format"""
+    from dots_ocr.utils.image_utils import PILimage_to_base64, get_image_encoding
+
+    options = [
+        ("png (default)", get_image_encoding("png")),
+        ("png level 1", get_image_encoding("png", compress_level=1)),
+        ("png level 1 gray", get_image_encoding("png", compress_level=1, grayscale=True)),
+        ("webp lossless q0", get_image_encoding("webp_lossless", quality=0)),
+        ("webp q90", get_image_encoding("webp", quality=90)),
+        ("jpeg q90", get_image_encoding("jpeg", quality=90)),
+        ("jpeg q90 gray", get_image_encoding("jpeg", quality=90, grayscale=True)),
+    ]
+    for page_name, page in synthetic_pages().items():
+        print(f"{page_name} page {page.width}x{page.height}")
+        for name, encoding in options:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                payload = PILimage_to_base64(page, **encoding)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"  {name:>18}: {elapsed * 1000:7.1f} ms, {len(payload) / 1024:8.1f} KB base64")
+
+
+def bench_preprocess(args):
+    """Per-image latency of the fitz_preprocess upsample: pdf round trip vs a single resize"""
+    import numpy as np
+    from PIL import Image
+    from dots_ocr.utils.consts import MIN_PIXELS, MAX_PIXELS
+    from dots_ocr.utils.image_utils import get_image_by_fitz_doc, get_image_by_resample, fetch_image
+
+    def fitz_engine(image):
+        image = get_image_by_fitz_doc(image, target_dpi=args.dpi)
+        return fetch_image(image, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS)
+
+    def resample_engine(image):
+        return get_image_by_resample(image, target_dpi=args.dpi, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS)
+
+    page = synthetic_pages()["scan"]
+    inputs = {
+        "low-res scan 600x850": page.resize((600, 850)),
+        "screenshot 1280x720": page.crop((0, 0, 1280, 720)) if page.width >= 1280 else page.resize((1280, 720)),
+        "a4 at 200dpi 1653x2339": page.resize((1653, 2339)),
+    }
+    for input_name, image in inputs.items():
+        outputs = {}
+        print(input_name)
+        for name, engine in [("fitz", fitz_engine), ("resample", resample_engine)]:
+            outputs[name] = engine(image)  # warm up
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                engine(image)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"  {name:>9}: {elapsed * 1000:7.1f} ms -> {outputs[name].width}x{outputs[name].height}")
+        a, b = (np.asarray(outputs[name], dtype=np.float32) for name in ("fitz", "resample"))
+        print(f"  mean abs pixel difference: {np.abs(a - b).mean():.2f}")
+
+
+def synthetic_cells(width, height, num_cells, seed=0):
+    """Random layout cells of the usual categories inside a width x height page"""
+    import random
+    from dots_ocr.utils.layout_utils import dict_layout_type_to_color
+
+    rng = random.Random(seed)
+    categories = [name for name in dict_layout_type_to_color if name != "Unknown"]
+    cells = []
+    for _ in range(num_cells):
+        x0, y0 = rng.randint(0, width - 40), rng.randint(0, height - 20)
+        x1, y1 = min(width, x0 + rng.randint(20, width // 3)), min(height, y0 + rng.randint(10, 120))
+        cells.append({"bbox": [x0, y0, x1, y1], "category": rng.choice(categories), "text": "stub"})
+    return cells
+
+
+def bench_overlay(args):
+    """Layout overlay rendering: fitz page round trip vs numpy/PIL"""
+    import numpy as np
+    from dots_ocr.utils.layout_utils import draw_layout_on_image
+
+    page = synthetic_pages()["scan"]
+    for num_cells in args.cells:
+        cells = synthetic_cells(page.width, page.height, num_cells)
+        outputs = {}
+        print(f"{num_cells} cells on {page.width}x{page.height}")
+        for engine in ("fitz", "pil"):
+            outputs[engine] = draw_layout_on_image(page, cells, engine=engine)  # warm up
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                draw_layout_on_image(page, cells, engine=engine)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"  {engine:>5}: {elapsed * 1000:7.1f} ms")
+        a, b = (np.asarray(outputs[engine], dtype=np.float32) for engine in ("fitz", "pil"))
+        print(f"  mean abs pixel difference: {np.abs(a - b).mean():.2f}")
+
+
+_tiny_chat_template = (
+    "{% for message in messages %}<|im_start|>{{ message['role'] }}\n"
+    "{% if message['content'] is string %}{{ message['content'] }}{% else %}{% for content in message['content'] %}"
+    "{% if content['type'] == 'image' %}<|vision_start|><|image_pad|><|vision_end|>"
+    "{% elif content['type'] == 'text' %}{{ content['text'] }}{% endif %}{% endfor %}{% endif %}<|im_end|>\n"
+    "{% endfor %}{% if add_generation_prompt %}<|im_start|>assistant\n{% endif %}"
+)
+
+_tiny_modeling = '''from transformers import Qwen2VLForConditionalGeneration
+
+
+class TinyDotsOCR(Qwen2VLForConditionalGeneration):
+    pass
+'''
+
+
+def make_tiny_hf_model(output_dir, seed=0):
+    """
+    Write a tiny randomly initialized Qwen2-VL checkpoint that loads like DotsOCR
+
+    Byte-level tokenizer, 2 text layers, 1 vision block: it runs the whole hf backend path
+    (`load_hf_model` with trust_remote_code, processor, batched generate) on the CPU in seconds.
+    Its output is noise, use it for equivalence checks and relative speed only.
+    """
+    import json
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+    from transformers import (
+        Qwen2TokenizerFast, Qwen2VLConfig, Qwen2VLForConditionalGeneration,
+        Qwen2VLImageProcessor, Qwen2VLProcessor,
+    )
+    from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+    byte_tokenizer = Tokenizer(models.BPE(vocab={ch: i for i, ch in enumerate(bytes_to_unicode().values())}, merges=[]))
+    byte_tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False, use_regex=False)
+    byte_tokenizer.decoder = decoders.ByteLevel()
+    tokenizer = Qwen2TokenizerFast(
+        tokenizer_object=byte_tokenizer, unk_token=None, bos_token=None,
+        eos_token="<|im_end|>", pad_token="<|endoftext|>",
+        additional_special_tokens=["<|im_start|>", "<|vision_start|>", "<|vision_end|>", "<|image_pad|>", "<|video_pad|>"],
+    )
+    processor = Qwen2VLProcessor(
+        image_processor=Qwen2VLImageProcessor(), tokenizer=tokenizer, chat_template=_tiny_chat_template
+    )
+    token_id = tokenizer.convert_tokens_to_ids
+    config = Qwen2VLConfig(
+        vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=2, num_key_value_heads=1, max_position_embeddings=8192,
+        rope_scaling={"type": "mrope", "mrope_section": [2, 3, 3]},
+        vision_config={"depth": 1, "embed_dim": 32, "hidden_size": 32, "num_heads": 2, "mlp_ratio": 2},
+        image_token_id=token_id("<|image_pad|>"), video_token_id=token_id("<|video_pad|>"),
+        vision_start_token_id=token_id("<|vision_start|>"), vision_end_token_id=token_id("<|vision_end|>"),
+        bos_token_id=None, eos_token_id=token_id("<|im_end|>"), pad_token_id=token_id("<|endoftext|>"),
+        tie_word_embeddings=False,
+        # peaked logits, greedy decoding does not flip on rounding differences of padded rows
+        initializer_range=0.5,
+    )
+    torch.manual_seed(seed)
+    Qwen2VLForConditionalGeneration(config).save_pretrained(output_dir)
+    processor.save_pretrained(output_dir)
+
+    # loaded with AutoModelForCausalLM and trust_remote_code, like the DotsOCR weights
+    with open(os.path.join(output_dir, "modeling_tiny.py"), "w") as f:
+        f.write(_tiny_modeling)
+    config_path = os.path.join(output_dir, "config.json")
+    with open(config_path) as f:
+        saved_config = json.load(f)
+    saved_config["auto_map"] = {"AutoModelForCausalLM": "modeling_tiny.TinyDotsOCR"}
+    with open(config_path, "w") as f:
+        json.dump(saved_config, f, indent=2)
+    return output_dir
+
+
+def bench_tiny_model(args):
+    """Write the tiny checkpoint of the hf-batch / hf-cpu benchmarks"""
+    make_tiny_hf_model(args.output, seed=args.seed)
+    print(f"Tiny random checkpoint written to {args.output}")
+
+
+def _hf_bench_parser(model_path, max_new_tokens, **hf_options):
+    """A DotsOCRParser on the hf backend, loaded through the same path as the CLI / API"""
+    from dots_ocr.parser import DotsOCRParser
+    return DotsOCRParser(use_hf=True, hf_model_path=model_path, hf_max_new_tokens=max_new_tokens, **hf_options)
+
+
+def _hf_generate_rate(parser, pages, batch_size, num_pages):
+    """(pages/s, generated tokens/s) of `num_pages` pages generated `batch_size` at a time"""
+    from dots_ocr.utils.prompts import dict_promptmode_to_prompt
+
+    prompt = dict_promptmode_to_prompt["prompt_ocr"]
+    parser._generate_with_hf([pages[0]], [prompt])  # warm up
+    start = time.perf_counter()
+    tokens = 0
+    for first in range(0, num_pages, batch_size):
+        batch = [pages[(first + i) % len(pages)] for i in range(min(batch_size, num_pages - first))]
+        responses = parser._generate_with_hf(batch, [prompt] * len(batch))
+        tokens += sum(len(parser.processor.tokenizer(response).input_ids) for response in responses)
+    elapsed = time.perf_counter() - start
+    return num_pages / elapsed, tokens / elapsed
+
+
+def bench_hf_batch(args):
+    """HF generation throughput per batch size, on synthetic pages of one size"""
+    parser = _hf_bench_parser(args.model_path, args.max_new_tokens, hf_device=args.device)
+    page = synthetic_pages(max_pixels=args.max_pixels)["text"]
+    for batch_size in args.batch_sizes:
+        pages_per_second, tokens_per_second = _hf_generate_rate(parser, [page], batch_size, args.pages)
+        print(f"batch {batch_size:>3}: {pages_per_second:6.2f} pages/s, {tokens_per_second:8.1f} tokens/s")
+
+
+def bench_hf_cpu(args):
+    """HF generation tokens/s on the CPU per attention / precision / threads configuration"""
+    from dots_ocr.model.hf_model import default_cpu_threads
+
+    configurations = [
+        ("eager fp32", dict(hf_attn_implementation="eager", hf_dtype="float32")),
+        ("sdpa fp32", dict(hf_attn_implementation="sdpa", hf_dtype="float32")),
+        ("sdpa fp32 + bf16 autocast", dict(hf_attn_implementation="sdpa", hf_dtype="float32", hf_autocast_dtype="bfloat16")),
+        ("sdpa bf16 weights", dict(hf_attn_implementation="sdpa", hf_dtype="bfloat16")),
+        ("sdpa int8 dynamic", dict(hf_attn_implementation="sdpa", hf_dtype="float32", hf_quantize=True)),
+    ]
+    page = synthetic_pages(max_pixels=args.max_pixels)["text"]
+    for num_threads in args.threads or [default_cpu_threads()]:
+        for name, options in configurations:
+            parser = _hf_bench_parser(
+                args.model_path, args.max_new_tokens, hf_device="cpu", hf_num_threads=num_threads, **options
+            )
+            pages_per_second, tokens_per_second = _hf_generate_rate(parser, [page], 1, args.pages)
+            print(f"{num_threads:>3} threads, {name:>26}: {tokens_per_second:8.1f} tokens/s, {pages_per_second:6.3f} pages/s")
+            del parser
+
+
+def malformed_outputs(num_cells=40, seed=0):
+    """{defect: model output} of the layout json with the defects the output cleaner has to handle"""
+    import random
+
+    rng = random.Random(seed)
+    texts = ["Plain paragraph text.", "Formula $\\frac{a}{b} + x^{2}$", 'Quoted "word" in text',
+             "Unicode: Tiếng Việt, 中文", "Table <td>1</td><td>{2}</td>"]
+    cells = [
+        {"bbox": [10, 20 * i, 300, 20 * i + 15], "category": rng.choice(["Text", "Title", "Formula"]),
+         "text": f"{rng.choice(texts)} #{i}"}
+        for i in range(num_cells)
+    ]
+    items = [json.dumps(cell, ensure_ascii=False) for cell in cells]
+    full = "[" + ", ".join(items) + "]"
+    loop = json.dumps(cells[-1], ensure_ascii=False)
+    broken = items[:]
+    broken[num_cells // 2] = broken[num_cells // 2].replace('\\"word\\"', '"word"')
+    broken[num_cells // 2] = broken[num_cells // 2].replace("paragraph", 'para"graph')
+    return {
+        "truncated": full[:len(full) * 2 // 3],
+        "missing_commas": "[" + "".join(items) + "]",
+        "missing_bracket": ", ".join(items) + "]",
+        "looping": "[" + ", ".join(items + [loop] * 200)[:-len(loop) // 2],
+        "unescaped_quote": "[" + ", ".join(broken) + "]",
+        "raw_newline": full.replace("text.", "text.\n"),
+        "trailing_garbage": full + " }]",
+        "single_incomplete": full[:len(items[0]) - 5],
+    }
+
+
+def _legacy_clean(text):
+    """The regex pipeline clean_model_output used for strings"""
+    from dots_ocr.utils.output_cleaner import OutputCleaner
+
+    cleaner = OutputCleaner()
+    result = cleaner.clean_string_data(text, case_id=0)
+    cells = result.cleaned_data
+    if result.success and cells:
+        cells = cleaner.remove_duplicate_category_text_pairs_and_bbox(cells, case_id=0)
+    return cells
+
+
+def bench_repair(args):
+    """Output repair: single pass parser vs the regex cleaner, recovered cells and time per output size"""
+    import contextlib
+    from dots_ocr.utils.output_repair import repair_layout_output
+
+    quiet = contextlib.redirect_stdout(open(os.devnull, "w"))  # the regex cleaner prints every step
+    # the regex cleaner rewrites '}{' inside texts to '},{' (e.g. in \\frac{a}{b}), compare texts separately
+    print("recovered cells: regex, single pass, regex cells lost, texts that differ")
+    for defect, text in malformed_outputs().items():
+        with quiet:
+            legacy = _legacy_clean(text)
+        repaired = repair_layout_output(text)
+        repaired_texts = {str(cell.get("bbox")): cell.get("text") for cell in repaired}
+        lost = [cell for cell in legacy if str(cell.get("bbox")) not in repaired_texts]
+        text_diffs = [cell for cell in legacy if repaired_texts.get(str(cell.get("bbox")), cell.get("text")) != cell.get("text")]
+        print(f"  {defect:>18}: {len(legacy):4d} {len(repaired):4d} {len(lost):4d} {len(text_diffs):4d}")
+
+    print("best time per output")
+    for size in args.sizes:
+        for defect in ("truncated", "looping"):
+            text = malformed_outputs(num_cells=size // 60)[defect]
+            for name, fn in (("regex", _legacy_clean), ("single pass", repair_layout_output)):
+                times = []
+                with quiet:
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        fn(text)
+                        times.append(time.perf_counter() - start)
+                print(f"  {defect:>9} {len(text):>9,} chars, {name:>11}: {min(times) * 1000:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dots.ocr micro-benchmarks')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    client = subparsers.add_parser('client', help='OpenAI client overhead against a local stub server')
+    client.add_argument('--requests', type=int, default=500, help='Number of requests per variant')
+    client.add_argument('--threads', type=int, default=16, help='Concurrent requests')
+    client.set_defaults(func=bench_client)
+
+    encode = subparsers.add_parser('encode', help='Image transport encode time and payload size')
+    encode.add_argument('--repeat', type=int, default=5, help='Encodes per option')
+    encode.set_defaults(func=bench_encode)
+
+    preprocess = subparsers.add_parser('preprocess', help='fitz_preprocess latency of the fitz and resample engines')
+    preprocess.add_argument('--dpi', type=int, default=200, help='Target dpi')
+    preprocess.add_argument('--repeat', type=int, default=5, help='Runs per engine')
+    preprocess.set_defaults(func=bench_preprocess)
+
+    overlay = subparsers.add_parser('overlay', help='Layout overlay rendering, fitz vs numpy/PIL')
+    overlay.add_argument('--cells', type=int, nargs='+', default=[10, 100, 1000], help='Cells per page')
+    overlay.add_argument('--repeat', type=int, default=5, help='Renders per engine')
+    overlay.set_defaults(func=bench_overlay)
+
+    tiny_model = subparsers.add_parser('tiny-model', help='Write a tiny random checkpoint for the hf benchmarks')
+    tiny_model.add_argument('--output', type=str, required=True, help='Checkpoint directory')
+    tiny_model.add_argument('--seed', type=int, default=0)
+    tiny_model.set_defaults(func=bench_tiny_model)
+
+    hf_batch = subparsers.add_parser('hf-batch', help='HF generation throughput per batch size')
+    hf_batch.add_argument('--model_path', type=str, required=True,
+                          help='Local checkpoint, a tiny random one (tiny-model) is enough to run on CPU')
+    hf_batch.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4])
+    hf_batch.add_argument('--pages', type=int, default=8, help='Pages per batch size')
+    hf_batch.add_argument('--max_new_tokens', type=int, default=64)
+    hf_batch.add_argument('--max_pixels', type=int, default=256 * 28 * 28, help='Page size sent to the model')
+    hf_batch.add_argument('--device', type=str, default=None, help='cuda or cpu, default: cuda if available')
+    hf_batch.set_defaults(func=bench_hf_batch)
+
+    hf_cpu = subparsers.add_parser('hf-cpu', help='HF generation tokens/s per CPU configuration')
+    hf_cpu.add_argument('--model_path', type=str, required=True,
+                        help='Local checkpoint, a tiny random one (tiny-model) is enough for relative numbers')
+    hf_cpu.add_argument('--threads', type=int, nargs='+', default=None, help='Intra-op thread counts, default: all cpus')
+    hf_cpu.add_argument('--pages', type=int, default=2, help='Pages per configuration')
+    hf_cpu.add_argument('--max_new_tokens', type=int, default=64)
+    hf_cpu.add_argument('--max_pixels', type=int, default=256 * 28 * 28, help='Page size sent to the model')
+    hf_cpu.set_defaults(func=bench_hf_cpu)
+
+    repair = subparsers.add_parser('repair', help='Malformed output repair, single pass parser vs regex cleaner')
+    repair.add_argument('--sizes', type=int, nargs='+', default=[10_000, 50_000, 200_000, 1_000_000],
+                        help='Approximate output sizes in characters')
+    repair.add_argument('--repeat', type=int, default=5, help='Runs per size, the best is reported')
+    repair.set_defaults(func=bench_repair)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
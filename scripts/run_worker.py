@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Script to run queue workers of the asynchronous job API (/api/v1/jobs) without the API server
+
+Workers and API servers share the queue (QUEUE_BACKEND=sqlite on one host, redis across hosts)
+and the UPLOAD_DIR / RESULTS_DIR directories. Run the API with QUEUE_WORKERS=0 to leave
+inference to the workers.
+"""
+import sys
+import os
+import time
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    parser = argparse.ArgumentParser(description='Run dots.ocr queue workers')
+    parser.add_argument('--threads', type=int, default=4, help='Pages processed at the same time')
+    parser.add_argument('--cpu', action='store_true', help='Force CPU mode')
+    
+    args = parser.parse_args()
+    
+    # Set environment variables
+    if args.cpu:
+        os.environ['DEVICE'] = 'cpu'
+        print("🖥️  Running in CPU mode")
+    
+    from api.config import settings
+    from api.services.jobs import job_service
+    
+    if settings.QUEUE_BACKEND == "memory" and not settings.USE_REDIS:
+        print("QUEUE_BACKEND=memory is private to the API process, use sqlite or redis")
+        sys.exit(1)
+    
+    print("="*60)
+    print("🚀 Starting dots.ocr queue workers")
+    print(f"📥 Queue: {'redis' if settings.USE_REDIS else settings.QUEUE_BACKEND}, {args.threads} threads")
+    print("="*60)
+    
+    job_service.start(args.threads)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping workers after their current page...")
+        job_service.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import tempfile
+
+import fitz
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# api.config reads its settings at import, keep the test runs out of the working directory
+_api_dir = tempfile.mkdtemp(prefix="dots_ocr_tests_")
+for _name, _value in {
+    "UPLOAD_DIR": os.path.join(_api_dir, "uploads"),
+    "RESULTS_DIR": os.path.join(_api_dir, "results"),
+    "TEMP_DIR": os.path.join(_api_dir, "temp"),
+    "QUEUE_SQLITE_PATH": os.path.join(_api_dir, "queue", "queue.db"),
+    "THROUGHPUT_FILE": os.path.join(_api_dir, "queue", "throughput.json"),
+    "USE_VLLM": "true",
+    "QUEUE_WORKERS": "0",
+}.items():
+    os.environ.setdefault(_name, _value)
+
+STUB_RESPONSE = json.dumps([{"bbox": [10, 10, 100, 40], "category": "Text", "text": "hello"}])
+
+
+def make_pdf(path, num_pages, text="page"):
+    """Write a small text pdf of `num_pages` A4 pages."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    doc = fitz.open()
+    for page_no in range(num_pages):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((72, 72), f"{text} {page_no + 1}")
+    doc.save(path)
+    doc.close()
+    return path
+
+
+@pytest.fixture
+def pdf_factory(tmp_path):
+    return lambda name, num_pages, text="page": make_pdf(str(tmp_path / name), num_pages, text)
+
+
+class StubBackend:
+    """Replaces the model call of every DotsOCRParser, each page takes `delay` seconds."""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+
+    def __call__(self, parser, image, prompt, on_text=None, group=None):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("stub backend failure")
+        return STUB_RESPONSE
+
+
+@pytest.fixture
+def stub_backend(monkeypatch):
+    from dots_ocr.parser import DotsOCRParser
+
+    backend = StubBackend()
+    monkeypatch.setattr(DotsOCRParser, "_inference", lambda self, *args, **kwargs: backend(self, *args, **kwargs))
+    return backend
+
+
+@pytest.fixture
+def api_client(stub_backend):
+    from fastapi.testclient import TestClient
+    from api.main import app
+
+    return TestClient(app)
@@ -0,0 +1,98 @@
+import os
+
+import pytest
+
+pytest.importorskip("torch")  # api.config
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    """Replace the admission controller of the process router, configured by the test"""
+    from api.routers import process
+    from api.services.admission import AdmissionController
+
+    def _make(**kwargs):
+        admission = AdmissionController(**kwargs)
+        monkeypatch.setattr(process, "admission", admission)
+        return admission
+
+    return _make
+
+
+def _post(api_client, path, endpoint="/api/v1/process"):
+    with open(path, "rb") as f:
+        return api_client.post(endpoint, files={"file": ("doc.pdf", f, "application/pdf")})
+
+
+def _uploads():
+    from api.config import settings
+    return sorted(os.listdir(settings.UPLOAD_DIR))
+
+
+def test_full_budget_rejects_with_429(api_client, controller, pdf_factory):
+    admission = controller(max_pending_tokens=2000, default_throughput=100.0)
+    admission.admit(1500)  # another document is being processed
+    before = _uploads()
+
+    response = _post(api_client, pdf_factory("doc.pdf", 1))
+
+    assert response.status_code == 429
+    retry_after = int(response.headers["Retry-After"])
+    assert 1 <= retry_after <= admission.max_retry_after
+    assert admission.pending_tokens() == 1500
+    assert _uploads() == before
+
+
+def test_slow_measured_drain_rejects_with_503(api_client, controller, pdf_factory):
+    admission = controller(max_pending_tokens=None, max_wait=10)
+    # 5 tokens/s measured, the pending document alone takes 20s
+    admission._drained_tokens, admission._busy_seconds = 50.0, 10.0
+    admission.admit(100)
+
+    response = _post(api_client, pdf_factory("doc.pdf", 1))
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert admission.pending_tokens() == 100
+
+
+def test_unmeasured_drain_rate_does_not_reject_with_503(api_client, controller, pdf_factory):
+    admission = controller(max_pending_tokens=None, max_wait=0.001)
+    admission.admit(100)
+
+    response = _post(api_client, pdf_factory("doc.pdf", 1))
+
+    assert response.status_code == 200, response.text
+    assert admission.pending_tokens() == 100
+
+
+def test_slots_released_after_success(api_client, controller, pdf_factory):
+    admission = controller(max_pending_tokens=10_000_000)
+
+    response = _post(api_client, pdf_factory("doc.pdf", 2))
+
+    assert response.status_code == 200 and response.json()["status"] == "completed"
+    stats = admission.stats()
+    assert stats["pending_tokens"] == 0 and stats["pending_requests"] == 0
+    assert stats["throughput_tokens_per_s"] is not None
+
+
+def test_slots_released_after_failure(api_client, stub_backend, controller, pdf_factory):
+    admission = controller(max_pending_tokens=10_000_000)
+    stub_backend.fail = True
+
+    response = _post(api_client, pdf_factory("doc.pdf", 2))
+
+    assert response.json()["status"] == "failed"
+    stats = admission.stats()
+    assert stats["pending_tokens"] == 0 and stats["pending_requests"] == 0
+    assert stats["throughput_tokens_per_s"] is None  # failed documents do not count as drained
+
+
+def test_stream_slots_released(api_client, controller, pdf_factory):
+    admission = controller(max_pending_tokens=10_000_000)
+
+    response = _post(api_client, pdf_factory("doc.pdf", 2), endpoint="/api/v1/process/stream")
+
+    assert response.status_code == 200 and "event: result" in response.text
+    assert admission.pending_tokens() == 0
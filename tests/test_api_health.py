@@ -0,0 +1,43 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("torch")  # api.config
+
+
+def test_health_answers_while_a_document_is_processed(monkeypatch, stub_backend, pdf_factory):
+    from fastapi.testclient import TestClient
+    from api.main import app
+    from api.services.ocr_service import ocr_service
+
+    # the app shutdown closes the executor of the service, give this app run its own
+    monkeypatch.setattr(ocr_service, "executor", ThreadPoolExecutor(max_workers=2, thread_name_prefix="ocr"))
+    stub_backend.delay = 1.5
+    path = pdf_factory("slow.pdf", 2)
+    responses = []
+
+    with TestClient(app) as client:  # one event loop for both requests
+        def _process():
+            with open(path, "rb") as f:
+                responses.append(client.post("/api/v1/process", files={"file": ("slow.pdf", f, "application/pdf")}))
+
+        thread = threading.Thread(target=_process)
+        thread.start()
+        deadline = time.time() + 10
+        while stub_backend.calls == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        assert stub_backend.calls > 0
+
+        start = time.perf_counter()
+        health = client.get("/api/v1/health")
+        elapsed = time.perf_counter() - start
+        still_processing = thread.is_alive()
+        thread.join()
+
+    assert health.status_code == 200
+    assert health.json()["status"] == "healthy"
+    assert still_processing
+    assert elapsed < 0.5
+    assert responses[0].status_code == 200, responses[0].text
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+
+import pytest
+
+pytest.importorskip("torch")  # api.config
+
+
+def _uploads():
+    from api.config import settings
+    return sorted(os.listdir(settings.UPLOAD_DIR))
+
+
+def test_process_removes_upload(api_client, pdf_factory):
+    before = _uploads()
+    with open(pdf_factory("doc.pdf", 2), "rb") as f:
+        response = api_client.post("/api/v1/process", files={"file": ("doc.pdf", f, "application/pdf")})
+
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "completed"
+    assert _uploads() == before
+
+
+def test_process_keeps_overlay_source(api_client, pdf_factory):
+    from api.config import settings
+
+    with open(pdf_factory("doc.pdf", 1), "rb") as f:
+        response = api_client.post("/api/v1/process", files={"file": ("doc.pdf", f, "application/pdf")})
+    task_id = response.json()["task_id"]
+
+    with open(settings.RESULTS_DIR / task_id / "task.json", encoding="utf-8") as f:
+        source_path = json.load(f)["source_path"]
+    assert os.path.dirname(source_path) == str((settings.RESULTS_DIR / task_id).resolve())
+    overlay = api_client.get(f"/api/v1/results/{task_id}/overlay?page=1&max_size=200")
+    assert overlay.status_code == 200
+    assert overlay.headers["content-type"] == "image/jpeg"
+
+
+def test_failed_process_removes_upload(api_client, stub_backend, pdf_factory):
+    stub_backend.fail = True
+    before = _uploads()
+    with open(pdf_factory("doc.pdf", 1), "rb") as f:
+        response = api_client.post("/api/v1/process", files={"file": ("doc.pdf", f, "application/pdf")})
+
+    assert response.json()["status"] == "failed"
+    assert _uploads() == before
+
+
+def test_stream_removes_upload(api_client, pdf_factory):
+    before = _uploads()
+    with open(pdf_factory("doc.pdf", 2), "rb") as f:
+        response = api_client.post("/api/v1/process/stream", files={"file": ("doc.pdf", f, "application/pdf")})
+
+    assert response.status_code == 200
+    assert "event: result" in response.text
+    assert _uploads() == before
+
+
+def test_job_removes_upload(api_client, pdf_factory):
+    from api.services.jobs import job_service
+
+    before = _uploads()
+    with open(pdf_factory("doc.pdf", 2), "rb") as f:
+        response = api_client.post("/api/v1/jobs", files={"file": ("doc.pdf", f, "application/pdf")})
+    assert response.status_code == 202
+    task_id = response.json()["task_id"]
+
+    job_service.start(2)
+    try:
+        for _ in range(200):
+            result = api_client.get(f"/api/v1/jobs/{task_id}/result")
+            if result.status_code == 200:
+                break
+            time.sleep(0.05)
+    finally:
+        job_service.stop(timeout=5)
+    assert result.status_code == 200 and result.json()["status"] == "completed"
+    assert _uploads() == before
+
+
+@pytest.mark.parametrize("name", ["doc.pdf", "page.png"])
+def test_process_parses_the_upload_from_disk(api_client, monkeypatch, pdf_factory, tmp_path, name):
+    from pathlib import Path
+    from PIL import Image
+    from api.config import settings
+    from dots_ocr.parser import DotsOCRParser
+
+    read_bytes = Path.read_bytes
+
+    def _read_bytes(path):
+        assert Path(settings.UPLOAD_DIR).resolve() not in Path(path).resolve().parents, "upload read into memory"
+        return read_bytes(path)
+
+    monkeypatch.setattr(Path, "read_bytes", _read_bytes)
+    monkeypatch.setattr(DotsOCRParser, "parse_bytes", None)
+    if name.endswith(".pdf"):
+        path = pdf_factory(name, 2)
+    else:
+        path = str(tmp_path / name)
+        Image.new("RGB", (600, 800), "white").save(path)
+
+    with open(path, "rb") as f:
+        response = api_client.post("/api/v1/process", files={"file": (name, f, "application/octet-stream")})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["status"] == "completed", body.get("error")
+    assert body["page_numbers"] == ([1, 2] if name.endswith(".pdf") else [1])
+    assert body["layout_elements"] and "hello" in body["markdown_content"]
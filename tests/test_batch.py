@@ -0,0 +1,46 @@
+import json
+import os
+
+from dots_ocr.batch import BatchParser, collect_input_files, output_keys
+from dots_ocr.parser import DotsOCRParser
+
+RESPONSE = json.dumps([{"bbox": [10, 10, 100, 40], "category": "Text", "text": "hello"}])
+
+
+def _stub_parser(output_dir, groups):
+    parser = DotsOCRParser(output_dir=str(output_dir), num_thread=4, output_profile='minimal', dpi=72)
+
+    def _inference(image, prompt, on_text=None, group=None):
+        groups.add(group)
+        return RESPONSE
+
+    parser._inference = _inference
+    return parser
+
+
+def test_output_keys_keep_subdirectories():
+    files = ["in/a/x.pdf", "in/b/x.pdf", "in/b/x.png", "in/y.pdf"]
+    assert output_keys(files) == [
+        os.path.join("a", "x"), os.path.join("b", "x"), os.path.join("b", "x_png"), "y"
+    ]
+    assert output_keys(["in/x.pdf"]) == ["x"]
+
+
+def test_duplicate_basenames_do_not_overwrite(tmp_path, pdf_factory):
+    pdf_factory("dup/a/x.pdf", 2, text="a")
+    pdf_factory("dup/b/x.pdf", 3, text="b")
+    output_dir = tmp_path / "out"
+    groups = set()
+
+    input_files = collect_input_files(str(tmp_path / "dup"))
+    summary = BatchParser(_stub_parser(output_dir, groups)).parse_files(input_files)
+
+    assert summary['pages'] == 5 and summary['failed_pages'] == 0
+    for sub_dir, num_pages in [("a", 2), ("b", 3)]:
+        with open(output_dir / sub_dir / "x.jsonl", encoding="utf-8") as f:
+            results = [json.loads(line) for line in f]
+        assert [result['page_no'] for result in results] == list(range(num_pages))
+        assert all(result['file_path'].endswith(os.path.join(sub_dir, "x.pdf")) for result in results)
+        assert sorted(os.listdir(output_dir / sub_dir / "x")) == sorted(f"x_page_{i}.json" for i in range(num_pages))
+    # each document waits in its own governor group
+    assert len(groups) == 2
@@ -0,0 +1,127 @@
+import json
+
+import pytest
+from PIL import Image
+
+import dots_ocr.parser
+from dots_ocr.parser import DotsOCRParser
+from dots_ocr.utils.cell_stream import CellStreamParser
+
+CELLS = [
+    {"bbox": [10, 10, 300, 40], "category": "Title", "text": "Report"},
+    {"bbox": [10, 50, 300, 80], "category": "Text", "text": 'He said "stop" \\ and left.'},
+    {"bbox": [10, 90, 300, 120], "category": "Formula", "text": "$\\frac{a}{b} + \\{x\\}$"},
+    {"bbox": [10, 130, 300, 160], "category": "Text", "text": 'braces } { ] [ and a fake start {"bbox": [1, 2, 3, 4]}'},
+    {"bbox": [10, 170, 300, 200], "category": "Table", "text": "<table><tr><td>0.00</td></tr></table>"},
+    {"bbox": [10, 210, 300, 240], "category": "Picture"},
+    {"bbox": [10, 250, 300, 280], "category": "Text", "text": "Tiếng Việt, 中文\nsecond line"},
+]
+OUTPUT = json.dumps(CELLS, ensure_ascii=False)
+
+
+def _stream(text, chunk_size):
+    parser = CellStreamParser()
+    cells = []
+    for start in range(0, len(text), chunk_size):
+        cells += parser.feed(text[start:start + chunk_size])
+    return parser, cells
+
+
+@pytest.mark.parametrize("chunk_size", list(range(1, 40)) + [97, 500, len(OUTPUT)])
+def test_any_chunking_gives_the_json_cells(chunk_size):
+    parser, cells = _stream(OUTPUT, chunk_size)
+
+    assert cells == json.loads(OUTPUT)
+    assert parser.cells == cells and parser.skipped == 0
+    assert parser.finish() == []
+
+
+def _closed_cells(cut):
+    """The cells of OUTPUT whose closing brace is before `cut`"""
+    closed, end = [], 1
+    for cell in CELLS:
+        end = OUTPUT.index(json.dumps(cell, ensure_ascii=False), end) + len(json.dumps(cell, ensure_ascii=False))
+        if end <= cut:
+            closed.append(cell)
+    return closed
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_truncated_stream_yields_every_closed_cell(chunk_size):
+    for cut in range(len(OUTPUT)):
+        _, cells = _stream(OUTPUT[:cut], chunk_size)
+        assert cells == _closed_cells(cut), f"cut at {cut}: {OUTPUT[:cut][-40:]!r}"
+
+
+def test_truncated_last_cell_is_salvaged():
+    parser, cells = _stream(OUTPUT[:OUTPUT.index("second line") + 6], 5)
+
+    assert cells == CELLS[:-1]
+    salvaged = parser.finish()
+    assert salvaged == [dict(CELLS[-1], text="Tiếng Việt, 中文\nsecond")]
+
+
+def test_defects_between_cells():
+    items = [json.dumps(cell, ensure_ascii=False) for cell in CELLS]
+    # no opening bracket, missing commas, raw newline in a text
+    text = "".join(items).replace("\\n", "\n")
+    _, cells = _stream(text, 11)
+
+    assert cells == CELLS
+
+
+def _streaming_parser(monkeypatch, deliver):
+    """A parser whose backend streams the first `deliver` characters of OUTPUT through on_text"""
+    def _inference(self, image, prompt, on_text=None, group=None):
+        if on_text is not None:
+            for start in range(0, deliver, 9):
+                on_text(OUTPUT[start:min(start + 9, deliver)])
+        return OUTPUT
+
+    monkeypatch.setattr(DotsOCRParser, "_inference", _inference)
+    return DotsOCRParser(output_profile='memory')
+
+
+def _parse_with_on_cell(parser):
+    emitted = []
+    image = Image.new("RGB", (600, 800), "white")
+    parser._parse_single_image(
+        image, "prompt_layout_all_en", None, "page", on_cell=lambda page_idx, cell: emitted.append(cell)
+    )
+    return emitted
+
+
+def _texts(cells):
+    return sorted(str(cell.get("text")) for cell in cells)
+
+
+def test_every_cell_emitted_once_when_fully_streamed(monkeypatch):
+    emitted = _parse_with_on_cell(_streaming_parser(monkeypatch, len(OUTPUT)))
+
+    assert [cell.get("text") for cell in emitted] == [cell.get("text") for cell in CELLS]
+
+
+def test_cells_missing_from_the_stream_are_emitted_after_the_final_parse(monkeypatch):
+    # the stream stops inside the fourth cell, the final response holds all of them
+    emitted = _parse_with_on_cell(_streaming_parser(monkeypatch, OUTPUT.index("fake start")))
+
+    assert _texts(emitted) == _texts(CELLS)
+    assert len(emitted) == len(CELLS)
+
+
+def test_cell_failing_streamed_post_process_is_emitted_after_the_final_parse(monkeypatch):
+    post_process_cells = dots_ocr.parser.post_process_cells
+    calls = []
+
+    def _fail_first(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("transient post process failure")
+        return post_process_cells(*args, **kwargs)
+
+    parser = _streaming_parser(monkeypatch, len(OUTPUT))
+    monkeypatch.setattr(dots_ocr.parser, "post_process_cells", _fail_first)
+    emitted = _parse_with_on_cell(parser)
+
+    assert _texts(emitted) == _texts(CELLS)
+    assert len(emitted) == len(CELLS)
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from PIL import Image
+
+from dots_ocr.parser import DotsOCRParser
+
+
+def _hf_parser(monkeypatch, hf_batch_size, calls):
+    monkeypatch.setattr(DotsOCRParser, "_load_hf_model", lambda self: None)
+    state = {"running": 0}
+    lock = threading.Lock()
+
+    def _generate_with_hf(self, images, prompts):
+        with lock:
+            state["running"] += 1
+            calls.append((state["running"], len(images)))
+        time.sleep(0.05)
+        with lock:
+            state["running"] -= 1
+        return ["[]"] * len(images)
+
+    monkeypatch.setattr(DotsOCRParser, "_generate_with_hf", _generate_with_hf)
+    return DotsOCRParser(use_hf=True, hf_batch_size=hf_batch_size, max_inflight_pages=32)
+
+
+def _run_pages(parser, num_pages):
+    image = Image.new("RGB", (64, 64), "white")
+    threads = [
+        threading.Thread(target=parser._inference, args=(image, "prompt"), kwargs={"group": i})
+        for i in range(num_pages)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_hf_generates_one_page_at_a_time(monkeypatch):
+    calls = []
+    parser = _hf_parser(monkeypatch, 1, calls)
+    assert parser.governor.max_inflight == 1
+
+    _run_pages(parser, 6)
+    assert len(calls) == 6
+    assert max(running for running, _ in calls) == 1
+
+
+def test_hf_batches_are_not_generated_concurrently(monkeypatch):
+    calls = []
+    parser = _hf_parser(monkeypatch, 3, calls)
+    assert parser.governor.max_inflight == 3
+
+    _run_pages(parser, 6)
+    assert sum(size for _, size in calls) == 6
+    assert max(running for running, _ in calls) == 1
+    assert max(size for _, size in calls) <= 3
+
+
+def test_hf_service_processes_one_document_at_a_time(monkeypatch):
+    from api.config import settings
+    from api.services.ocr_service import OCRService
+
+    monkeypatch.setattr(settings, "OCR_WORKERS", 4)
+    monkeypatch.setattr(settings, "USE_VLLM", False)
+    assert OCRService().executor._max_workers == 1
+    monkeypatch.setattr(settings, "USE_VLLM", True)
+    assert OCRService().executor._max_workers == 4
@@ -0,0 +1,134 @@
+import threading
+
+import pytest
+from PIL import Image, ImageDraw
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("qwen_vl_utils")
+
+from dots_ocr.parser import DotsOCRParser
+from dots_ocr.utils import repetition
+from dots_ocr.utils.metrics import counters
+from dots_ocr.utils.prompts import dict_promptmode_to_prompt
+from scripts.benchmark import make_tiny_hf_model
+
+# prompts of different lengths, the batch is left padded
+PROMPTS = [
+    dict_promptmode_to_prompt["prompt_ocr"],
+    dict_promptmode_to_prompt["prompt_layout_only_en"],
+    "Read the text.",
+    dict_promptmode_to_prompt["prompt_layout_all_en"],
+]
+
+
+@pytest.fixture(scope="module")
+def tiny_model_path(tmp_path_factory):
+    return make_tiny_hf_model(str(tmp_path_factory.mktemp("tiny_hf_model")))
+
+
+def _parser(model_path, **kwargs):
+    return DotsOCRParser(
+        use_hf=True, hf_model_path=model_path, hf_device="cpu", hf_max_new_tokens=96, **kwargs
+    )
+
+
+def _pages():
+    """Pages of one size (one HFBatcher batch) and different content"""
+    pages = []
+    for i in range(len(PROMPTS)):
+        page = Image.new("RGB", (112, 140), "white")
+        draw = ImageDraw.Draw(page)
+        draw.text((5, 5 + i * 20), f"page {i}", fill=(0, 0, 0))
+        draw.rectangle((10 * i, 60, 40 + 10 * i, 90), fill=(50 * i, 0, 200))
+        pages.append(page)
+    return pages
+
+
+def _unbatched(parser, pages):
+    return [parser._generate_with_hf([page], [prompt])[0] for page, prompt in zip(pages, PROMPTS)]
+
+
+def test_batched_generation_matches_unbatched(tiny_model_path):
+    parser = _parser(tiny_model_path)
+    assert parser.processor.tokenizer.padding_side == "left"
+    pages = _pages()
+
+    batched = parser._generate_with_hf(pages, PROMPTS)
+    unbatched = _unbatched(parser, pages)
+
+    assert batched == unbatched
+    # rows stopped at their own end of sequence, not at the longest one
+    assert len({len(response) for response in batched}) > 1
+
+
+class _StopAfter(repetition.RepetitionDetector):
+    """Reports a loop once `limit` characters were generated"""
+
+    limit = 24
+
+    def feed(self, chunk):
+        self._text += chunk
+        if not self.triggered and len(self._text) >= self.limit:
+            self.triggered = 'periodic'
+        return self.triggered is not None
+
+
+def test_repetition_stop_applies_per_row(tiny_model_path, monkeypatch):
+    parser = _parser(tiny_model_path)
+    pages = _pages()
+    full = _unbatched(parser, pages)
+
+    monkeypatch.setattr(repetition, "RepetitionDetector", _StopAfter)
+    stops = counters.get('repetition_stops.hf')
+    batched = parser._generate_with_hf(pages, PROMPTS)
+    batch_stops = counters.get('repetition_stops.hf') - stops
+    unbatched = _unbatched(parser, pages)
+    unbatched_stops = counters.get('repetition_stops.hf') - stops - batch_stops
+
+    assert batched == unbatched
+    assert batch_stops == unbatched_stops > 0
+    # stopped rows are cut short, the others still end at their end of sequence
+    for response, full_response in zip(batched, full):
+        assert full_response.startswith(response)
+    assert any(len(response) < len(full_response) for response, full_response in zip(batched, full))
+    assert any(response == full_response for response, full_response in zip(batched, full))
+
+
+def test_hf_batcher_matches_unbatched(tiny_model_path):
+    parser = _parser(tiny_model_path, hf_batch_size=len(PROMPTS))
+    pages = _pages()
+    responses = [None] * len(pages)
+
+    def _run(i):
+        responses[i] = parser._inference(pages[i], PROMPTS[i], group=i)
+
+    threads = [threading.Thread(target=_run, args=(i,)) for i in range(len(pages))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert responses == _unbatched(parser, pages)
+    assert parser._hf_batcher.pages == len(pages)
+
+
+@pytest.mark.parametrize("options", [
+    dict(hf_quantize=True),
+    dict(hf_dtype="bfloat16"),
+    dict(hf_autocast_dtype="bfloat16"),
+    dict(hf_profile="cpu"),
+])
+def test_cpu_precision_paths_generate(tiny_model_path, options):
+    import torch
+
+    parser = _parser(tiny_model_path, **options)
+    if options.get("hf_quantize"):
+        quantized = [
+            name for name, module in parser.model.named_modules()
+            if isinstance(module, torch.ao.nn.quantized.dynamic.Linear)
+        ]
+        assert quantized and not any(name.startswith("visual") for name in quantized)
+
+    responses = parser._generate_with_hf(_pages()[:2], PROMPTS[:2])
+    assert len(responses) == 2 and all(isinstance(response, str) for response in responses)
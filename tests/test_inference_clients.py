@@ -0,0 +1,100 @@
+import gc
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from dots_ocr.model import inference
+from dots_ocr.model.inference import get_openai_client, get_async_openai_client
+
+BASE_URL = "http://127.0.0.1:1/v1"
+
+
+def test_async_clients_of_closed_loops_are_dropped():
+    async def get_client():
+        return get_async_openai_client(BASE_URL, max_connections=4)
+
+    clients = [asyncio.run(get_client()) for _ in range(40)]
+    gc.collect()
+    assert len(inference._async_clients) <= 1
+    # every loop got its own client, even when a new loop reuses the id of a closed one
+    assert len({id(client) for client in clients}) == len(clients)
+
+
+def test_async_client_shared_within_a_loop():
+    async def get_clients():
+        first = get_async_openai_client(BASE_URL, max_connections=4)
+        return first, get_async_openai_client(BASE_URL, max_connections=2)
+
+    first, second = asyncio.run(get_clients())
+    assert first is second
+
+
+class _SlowChatHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible chat completions answering after `delay` seconds"""
+    protocol_version = "HTTP/1.1"
+    delay = 0.5
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay)
+        body = json.dumps({
+            "id": "stub", "object": "chat.completion", "created": 0, "model": "model",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "done"}}],
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowChatHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def _complete(client):
+    response = client.chat.completions.create(model="model", messages=[{"role": "user", "content": "p"}])
+    return response.choices[0].message.content
+
+
+def test_request_in_flight_survives_client_replacement(slow_server_url):
+    small = get_openai_client(slow_server_url, max_connections=2)
+    assert get_openai_client(slow_server_url, max_connections=1) is small
+    with ThreadPoolExecutor(1) as executor:
+        in_flight = executor.submit(_complete, small)
+        time.sleep(0.1)
+        large = get_openai_client(slow_server_url, max_connections=8)
+        assert large is not small
+        assert in_flight.result() == "done"
+    assert not small.is_closed()
+    assert _complete(large) == "done"
+
+
+def test_async_request_in_flight_survives_client_replacement(slow_server_url):
+    async def complete(client):
+        response = await client.chat.completions.create(model="model", messages=[{"role": "user", "content": "p"}])
+        return response.choices[0].message.content
+
+    async def replace_during_request():
+        small = get_async_openai_client(slow_server_url, max_connections=2)
+        in_flight = asyncio.ensure_future(complete(small))
+        await asyncio.sleep(0.1)
+        large = get_async_openai_client(slow_server_url, max_connections=8)
+        return small, large, await in_flight, await complete(large)
+
+    small, large, first, second = asyncio.run(replace_during_request())
+    assert large is not small
+    assert first == second == "done"
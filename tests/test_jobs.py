@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+pytest.importorskip("torch")  # api.config
+
+from api.services.jobs import JobService
+from api.services.ocr_service import ocr_service
+from api.services.task_queue import MemoryQueue, SQLiteQueue
+
+
+def _wait_for_result(service, task_id, timeout=20):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        task = service.get_task(task_id)
+        if task.get("result") is not None:
+            return task
+        time.sleep(0.05)
+    raise AssertionError(f"task {task_id} did not finish: {service.get_task(task_id)}")
+
+
+@pytest.mark.parametrize("backend_name", ["memory", "sqlite"])
+def test_page_results_dropped_when_task_finishes(backend_name, stub_backend, pdf_factory, tmp_path):
+    backend = MemoryQueue() if backend_name == "memory" else SQLiteQueue(tmp_path / "queue.db", poll_interval=0.01)
+    service = JobService(backend, ocr_service)
+    task_id = service.submit(pdf_factory("doc.pdf", 3), "doc.pdf", prompt_mode="prompt_layout_all_en")
+
+    service.start(2)
+    try:
+        task = _wait_for_result(service, task_id)
+    finally:
+        service.stop(timeout=5)
+
+    assert task["result"]["status"] == "completed"
+    assert task["result"]["page_numbers"] == [1, 2, 3]
+    assert task["finished_pages"] == 3
+    assert backend.get_page_results(task_id) == []
+
+
+def test_page_of_dead_workers_fails_after_max_attempts(stub_backend, pdf_factory, tmp_path):
+    backend = SQLiteQueue(tmp_path / "queue.db", poll_interval=0.01, lease_timeout=0.2)
+    service = JobService(backend, ocr_service, max_attempts=2)
+    task_id = service.submit(pdf_factory("doc.pdf", 2), "doc.pdf", prompt_mode="prompt_layout_all_en")
+    service._run_document(task_id)
+    backend.ack_job(backend.get_job(timeout=0.1))  # the document job, run above
+
+    # a worker takes page 1 and dies: never acknowledged, no heartbeat
+    first = backend.get_job(timeout=0.1)
+    assert first["page_idx"] == 0
+    time.sleep(0.3)
+    second = backend.get_job(timeout=0.1)  # handed out again, and its worker dies too
+    assert second["page_idx"] == 0 and second["attempts"] == 2
+    time.sleep(0.3)
+
+    service.start(1)
+    try:
+        task = _wait_for_result(service, task_id)
+    finally:
+        service.stop(timeout=5)
+
+    assert task["result"]["status"] == "failed"
+    assert "page 1: worker lost 2 times" in task["result"]["error"]
+    assert task["result"]["page_numbers"] == [2]
+
+
+def test_redelivered_page_is_processed(stub_backend, pdf_factory, tmp_path):
+    backend = SQLiteQueue(tmp_path / "queue.db", poll_interval=0.01, lease_timeout=0.2)
+    service = JobService(backend, ocr_service)
+    task_id = service.submit(pdf_factory("doc.pdf", 2), "doc.pdf", prompt_mode="prompt_layout_all_en")
+
+    service._run_document(task_id)
+    backend.ack_job(backend.get_job(timeout=0.1))
+    backend.get_job(timeout=0.1)  # page 1 taken by a worker that dies
+    time.sleep(0.3)
+
+    service.start(1)
+    try:
+        task = _wait_for_result(service, task_id)
+    finally:
+        service.stop(timeout=5)
+
+    assert task["result"]["status"] == "completed"
+    assert task["result"]["page_numbers"] == [1, 2]
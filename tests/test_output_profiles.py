@@ -0,0 +1,50 @@
+import json
+import os
+
+from PIL import Image
+
+from dots_ocr.parser import DotsOCRParser
+
+RESPONSE = json.dumps([
+    {"bbox": [10, 10, 300, 40], "category": "Text", "text": "hello"},
+    {"bbox": [10, 60, 300, 300], "category": "Picture"},
+])
+
+
+def _stub_parser(output_dir, **kwargs):
+    parser = DotsOCRParser(output_dir=str(output_dir), **kwargs)
+    parser._inference = lambda image, prompt, on_text=None, group=None: RESPONSE
+    return parser
+
+
+def _files(root):
+    return sorted(
+        os.path.relpath(os.path.join(dir_path, name), root)
+        for dir_path, _, names in os.walk(root) for name in names
+    )
+
+
+def test_memory_profile_writes_no_picture_files(tmp_path):
+    image_path = tmp_path / "page.png"
+    Image.new("RGB", (600, 800), "white").save(image_path)
+    output_dir = tmp_path / "out"
+
+    parser = _stub_parser(output_dir, output_profile='memory', picture_mode='file')
+    results = parser.parse_file(str(image_path), prompt_mode="prompt_layout_all_en")
+
+    assert _files(output_dir) == ["page.jsonl"]
+    assert "data:image/png;base64," in results[0]['md_content']
+
+
+def test_file_picture_mode_links_picture_files(tmp_path):
+    image_path = tmp_path / "page.png"
+    Image.new("RGB", (600, 800), "white").save(image_path)
+    output_dir = tmp_path / "out"
+
+    parser = _stub_parser(output_dir, output_profile='text', picture_mode='file')
+    results = parser.parse_file(str(image_path), prompt_mode="prompt_layout_all_en")
+
+    pictures = [path for path in _files(output_dir) if path.startswith(os.path.join("page", "images"))]
+    assert len(pictures) == 1
+    with open(results[0]['md_content_path'], encoding="utf-8") as f:
+        assert "images/" in f.read()
@@ -0,0 +1,87 @@
+import json
+import contextlib
+import os
+
+import pytest
+
+from dots_ocr.utils.output_repair import repair_layout_output
+from scripts.benchmark import malformed_outputs, _legacy_clean
+
+
+def _cell(i, text, category="Text"):
+    return {"bbox": [10, 20 * i, 300, 20 * i + 15], "category": category, "text": text}
+
+
+def _dumps(cells):
+    return [json.dumps(cell, ensure_ascii=False) for cell in cells]
+
+
+HAND_CELLS = [
+    _cell(0, "Title of the page", "Title"),
+    _cell(1, 'He said "stop" {here}'),
+    _cell(2, "Formula $\\frac{a}{b}$", "Formula"),
+    _cell(3, "Braces } { and brackets ] [ in text"),
+    _cell(4, "Last line."),
+]
+_items = _dumps(HAND_CELLS)
+_full = "[" + ", ".join(_items) + "]"
+
+# handcrafted defects: {name: (model output, number of leading HAND_CELLS it still holds)}
+HANDCRAFTED = {
+    "cut_inside_text": (_full[:_full.index("Last line") + 4], 4),
+    "cut_after_comma": ("[" + ", ".join(_items[:3]) + ", ", 3),
+    "cut_inside_bbox": ("[" + ", ".join(_items[:2]) + ', {"bbox": [10, 6', 2),
+    "extra_closing_brace": ("[" + ", ".join(_items[:2]) + "}, " + ", ".join(_items[2:]) + "]", 5),
+    "extra_closing_bracket": (_full + "]]", 5),
+    "missing_opening_bracket": (", ".join(_items) + "]", 5),
+    "no_brackets": (", ".join(_items), 5),
+    "nested_open_bracket": ("[[" + ", ".join(_items) + "]", 5),
+}
+
+
+def _legacy(text):
+    with contextlib.redirect_stdout(open(os.devnull, "w")):  # the regex cleaner prints every step
+        return _legacy_clean(text)
+
+
+def _keys(cells):
+    return [(str(cell.get("bbox")), cell.get("category")) for cell in cells]
+
+
+def _assert_superset(repaired, legacy):
+    repaired_keys = set(_keys(repaired))
+    lost = [cell for cell in legacy if (str(cell.get("bbox")), cell.get("category")) not in repaired_keys]
+    assert not lost, f"cells recovered by the legacy cleaner only: {lost}"
+
+
+@pytest.mark.parametrize("defect", sorted(malformed_outputs()))
+def test_repair_recovers_every_legacy_cell(defect):
+    text = malformed_outputs()[defect]
+    # the defects keep the cells of the well-formed output, in order
+    original = {str(cell["bbox"]): cell for cell in json.loads(malformed_outputs()["trailing_garbage"][:-3])}
+
+    repaired = repair_layout_output(text)
+    _assert_superset(repaired, _legacy(text))
+    assert len(set(_keys(repaired))) == len(repaired)
+    for cell in repaired:
+        expected = original[str(cell["bbox"])]
+        expected_text = expected["text"].replace("text.", "text.\n") if defect == "raw_newline" else expected["text"]
+        assert cell["category"] == expected["category"]
+        # texts are compared to the original, not to the legacy cleaner, which rewrites '}{' in them
+        # ('\frac{a},{b}'); the unescaped quote and the cut last cell change their text themselves
+        if defect not in ("unescaped_quote", "single_incomplete"):
+            assert cell["text"] == expected_text
+
+
+@pytest.mark.parametrize("defect", sorted(HANDCRAFTED))
+def test_repair_of_handcrafted_outputs(defect):
+    text, num_cells = HANDCRAFTED[defect]
+
+    repaired = repair_layout_output(text)
+    _assert_superset(repaired, _legacy(text))
+    assert repaired[:num_cells] == HAND_CELLS[:num_cells]
+    assert len(repaired) == num_cells
+
+
+def test_valid_output_unchanged():
+    assert repair_layout_output(_full) == HAND_CELLS
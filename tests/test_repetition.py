@@ -0,0 +1,135 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+from PIL import Image
+
+from dots_ocr.model.inference import inference_with_vllm, inference_with_vllm_async
+from dots_ocr.utils.metrics import counters
+from dots_ocr.utils.repetition import RepetitionDetector
+
+
+def _cell(bbox, text, category="Text"):
+    return json.dumps({"bbox": bbox, "category": category, "text": text})
+
+
+def _feed(detector, text, chunk_size=7):
+    for start in range(0, len(text), chunk_size):
+        if detector.feed(text[start:start + chunk_size]):
+            return start + chunk_size
+    return None
+
+
+def test_periodic_tail_triggers():
+    detector = RepetitionDetector()
+    head = "[" + _cell([10, 10, 200, 30], "Title") + ", "
+    stopped_at = _feed(detector, head + "the same line again\n" * 1000)
+
+    assert detector.triggered == 'periodic'
+    assert stopped_at < len(head) + 20 * 300
+
+
+def test_repeated_cells_trigger():
+    detector = RepetitionDetector()
+    cells = [_cell([10, 10 + 30 * i, 300, 35 + 30 * i], f"line {i}") for i in range(5)]
+    cells += [_cell([10, 160, 300, 185], f"loop {i}") for i in range(20)]  # the model keeps emitting one box
+
+    _feed(detector, "[" + ", ".join(cells))
+    assert detector.triggered == 'repeated_cells'
+
+
+def test_identical_values_in_different_places_do_not_trigger():
+    # a ledger: "0.00" in every row and the same header on every block
+    cells = []
+    for block in range(4):
+        cells.append(_cell([10, 1000 * block, 500, 1000 * block + 20], "Account  Debit  Credit", "Section-header"))
+        for row in range(40):
+            y = 1000 * block + 30 + 22 * row
+            cells.append(_cell([10, y, 200, y + 20], f"Item {block}-{row}"))
+            cells.append(_cell([220, y, 320, y + 20], "0.00"))
+            cells.append(_cell([340, y, 440, y + 20], "0.00"))
+    # and a column read top to bottom, one "0.00" after the other
+    cells += [_cell([460, 30 + 22 * row, 560, 50 + 22 * row], "0.00") for row in range(40)]
+    detector = RepetitionDetector()
+
+    assert _feed(detector, "[" + ", ".join(cells) + "]") is None
+    assert detector.triggered is None
+
+
+class _LoopingStreamHandler(BaseHTTPRequestHandler):
+    """Streams a chat completion that loops on one cell, up to `max_chunks` chunks"""
+    max_chunks = 5000
+    sent = []
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        deltas = ["[" + _cell([10, 10, 300, 30], "first") + ", "]
+        deltas += [_cell([10, 50, 300, 70], "again") + ", "] * self.max_chunks
+        sent = 0
+        try:
+            for delta in deltas:
+                chunk = {
+                    "id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "model",
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+                sent += 1
+                time.sleep(0.001)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            _LoopingStreamHandler.sent.append(sent)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def looping_server_port():
+    _LoopingStreamHandler.sent = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _LoopingStreamHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address[1]
+    server.shutdown()
+
+
+def _wait_for_server_stop():
+    deadline = time.time() + 10
+    while not _LoopingStreamHandler.sent and time.time() < deadline:
+        time.sleep(0.01)
+    return _LoopingStreamHandler.sent[0]
+
+
+def _check_partial_output(response):
+    assert response.startswith("[" + _cell([10, 10, 300, 30], "first"))
+    assert response.count("again") <= 20
+    # the server stopped sending when the client closed the stream, long before the end
+    assert _wait_for_server_stop() < _LoopingStreamHandler.max_chunks / 2
+
+
+def test_vllm_stream_closed_on_repetition(looping_server_port):
+    stops = counters.get('repetition_stops.vllm')
+    response = inference_with_vllm(
+        Image.new("RGB", (28, 28), "white"), "p", ip="127.0.0.1", port=looping_server_port, repetition_stop=True
+    )
+
+    _check_partial_output(response)
+    assert counters.get('repetition_stops.vllm') == stops + 1
+
+
+def test_async_vllm_stream_closed_on_repetition(looping_server_port):
+    response = asyncio.run(inference_with_vllm_async(
+        Image.new("RGB", (28, 28), "white"), "p", ip="127.0.0.1", port=looping_server_port, repetition_stop=True
+    ))
+
+    _check_partial_output(response)
@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from api.services.task_queue import MemoryQueue, SQLiteQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend_factory(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            kwargs.pop("lease_timeout", None)
+            return MemoryQueue(**kwargs)
+        return SQLiteQueue(tmp_path / "queue.db", poll_interval=0.01, **kwargs)
+    return make
+
+
+def test_tasks_expire_after_ttl(backend_factory):
+    backend = backend_factory(ttl=1)
+    backend.create_task("old", {"status": "completed"})
+    backend.add_page_result("old", 0, {"page_no": 0})
+    time.sleep(1.2)
+    backend.create_task("new", {"status": "pending"})
+
+    assert backend.get_task("old") is None
+    assert backend.get_page_results("old") == []
+    assert backend.get_task("new")["status"] == "pending"
+
+
+def test_updates_keep_tasks_alive(backend_factory):
+    backend = backend_factory(ttl=1)
+    backend.create_task("running", {"status": "processing"})
+    for page_no in range(3):
+        time.sleep(0.5)
+        backend.add_page_result("running", page_no, {"page_no": page_no})
+    backend.create_task("new", {"status": "pending"})
+
+    assert backend.get_task("running")["finished_pages"] == 3
+
+
+def test_deleted_page_results_keep_stored_count(backend_factory):
+    backend = backend_factory()
+    backend.create_task("task", {"status": "processing", "total_pages": 2})
+    backend.add_page_result("task", 0, {"page_no": 0})
+    backend.add_page_result("task", 1, {"page_no": 1})
+    backend.update_task("task", status="completed", finished_pages=2)
+    backend.delete_page_results("task")
+
+    assert backend.get_page_results("task") == []
+    assert backend.get_task("task")["finished_pages"] == 2
+
+
+def test_sqlite_job_of_dead_worker_is_handed_out_again(tmp_path):
+    backend = SQLiteQueue(tmp_path / "queue.db", poll_interval=0.01, lease_timeout=0.3)
+    backend.put_job({"type": "page", "task_id": "t", "page_idx": 0})
+
+    job = backend.get_job(timeout=0.1)
+    assert job["attempts"] == 1
+    assert backend.get_job(timeout=0.1) is None  # leased
+    time.sleep(0.4)  # no heartbeat
+    again = backend.get_job(timeout=0.1)
+    assert again["page_idx"] == 0 and again["attempts"] == 2
+
+    backend.ack_job(again)
+    time.sleep(0.4)
+    assert backend.get_job(timeout=0.1) is None
+
+
+def test_sqlite_heartbeat_keeps_the_lease(tmp_path):
+    backend = SQLiteQueue(tmp_path / "queue.db", poll_interval=0.01, lease_timeout=0.3)
+    backend.put_job({"type": "page", "task_id": "t", "page_idx": 0})
+
+    job = backend.get_job(timeout=0.1)
+    for _ in range(4):
+        time.sleep(0.15)
+        backend.extend_lease(job)
+        assert backend.get_job(timeout=0.01) is None
+
+
+def test_sqlite_migrates_queue_files_of_the_first_release(tmp_path):
+    import sqlite3
+
+    path = tmp_path / "queue.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT NOT NULL)")
+    conn.execute("CREATE TABLE tasks (task_id TEXT PRIMARY KEY, fields TEXT NOT NULL)")
+    conn.execute("INSERT INTO jobs (job) VALUES ('{\"type\": \"document\", \"task_id\": \"t\"}')")
+    conn.commit()
+    conn.close()
+
+    job = SQLiteQueue(path, poll_interval=0.01).get_job(timeout=0.1)
+    assert job["task_id"] == "t" and job["attempts"] == 1
+
+
+def test_redis_job_of_dead_worker_is_handed_out_again(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    import redis
+    from api.services.task_queue import RedisQueue
+
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, "from_url", staticmethod(lambda url: fakeredis.FakeRedis(server=server)))
+    backend = RedisQueue("redis://test", lease_timeout=0.3)
+    backend.put_job({"type": "page", "task_id": "t", "page_idx": 0})
+
+    job = backend.get_job(timeout=0.1)
+    assert job["attempts"] == 1
+    assert backend.get_job(timeout=0.1) is None  # leased
+    time.sleep(0.4)  # no heartbeat
+    backend._next_requeue = 0.0
+    again = backend.get_job(timeout=0.1)
+    assert again["page_idx"] == 0 and again["attempts"] == 2
+
+    backend.ack_job(again)
+    time.sleep(0.4)
+    backend._next_requeue = 0.0
+    assert backend.get_job(timeout=0.1) is None